@@ -88,6 +88,8 @@ setup(
             'karma = calmjs.dev.runtime:karma',
         ],
         'calmjs.dev.runtime.karma': [
+            'concurrent = calmjs.dev.runtime:concurrent',
+            'merge = calmjs.dev.runtime:merge',
             'run = calmjs.dev.runtime:run',
         ],
     },
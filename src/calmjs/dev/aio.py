@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides an asyncio based variant of the karma driver, such
+that multiple toolchain specs may be built and tested concurrently.
+
+This module requires Python 3.5.1 or later; it is only imported by the
+other modules in this package when the concurrent execution is used.
+The generator based coroutines are used such that it remains valid
+syntax for all versions of Python 3 supported by this package.
+"""
+
+import asyncio
+import logging
+import sys
+import types
+from asyncio.subprocess import PIPE
+from asyncio.subprocess import STDOUT
+
+from calmjs.toolchain import AFTER_TEST
+from calmjs.toolchain import BEFORE_TEST
+
+from calmjs.dev import karma
+from calmjs.dev import utils
+from calmjs.dev.cli import KarmaDriver
+
+if not hasattr(asyncio, 'run_coroutine_threadsafe'):  # pragma: no cover
+    raise ImportError('calmjs.dev.aio requires Python 3.5.1 or later')
+
+logger = logging.getLogger(__name__)
+
+# asyncio.coroutine is deprecated in favor of this since Python 3.5.
+coroutine = getattr(types, 'coroutine', None) or asyncio.coroutine
+
+# the event loop that the tests for a spec will be scheduled on.
+EVENT_LOOP = 'aio_event_loop'
+# the size of the chunks read from the output of karma; lines are split
+# from the chunks such that arbitrarily long lines are supported.
+CHUNK_SIZE = 65536
+
+
+class AsyncKarmaDriver(KarmaDriver):
+    """
+    A karma driver where karma is executed through asyncio subprocesses,
+    such that the execution of the tests for a spec may overlap with
+    the building or testing of other specs.
+    """
+
+    @classmethod
+    def from_driver(cls, driver):
+        """
+        Create an instance with the settings of the provided karma
+        driver.
+        """
+
+        return cls(
+            binary=driver.binary, karma_conf_js=driver.karma_conf_js,
+            testrunner_advice_name=driver.testrunner_advice_name,
+            node_path=driver.node_path, env_path=driver.env_path,
+            working_dir=driver.working_dir, indent=driver.indent,
+            separators=driver.separators,
+        )
+
+    def _emit(self, line, line_handler):
+        text = line.decode('utf8', 'replace')
+        try:
+            utils.write_line(sys.stdout, line, text)
+        except (IOError, OSError, ValueError, TypeError, UnicodeError):
+            pass
+        if line_handler:
+            line_handler(text)
+
+    @coroutine
+    def _exec(self, args, line_handler=None, **call_kw):
+        proc = yield from asyncio.create_subprocess_exec(
+            *args, stdout=PIPE, stderr=STDOUT, **call_kw)
+        remainder = b''
+        while True:
+            chunk = yield from proc.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                self._emit(line + b'\n', line_handler)
+        if remainder:
+            self._emit(remainder, line_handler)
+        return (yield from proc.wait())
+
+    @coroutine
+    def _exec_shard(self, binary, config_fn, call_kw):
+        log_fn = self._shard_log_path(config_fn)
+        logger.info('invoking %s start %r', self.binary, config_fn)
+        with open(log_fn, 'wb') as log_fd:
+            proc = yield from asyncio.create_subprocess_exec(
+                binary, 'start', config_fn, '--color',
+                stdout=log_fd, stderr=STDOUT, **call_kw)
+            return_code = yield from proc.wait()
+        return log_fn, return_code
+
+    @coroutine
+    def run_shards_async(
+            self, binary, config_paths, call_kw, line_handler=None):
+        """
+        The asynchronous version of run_shards.
+        """
+
+        results = yield from asyncio.gather(*[
+            self._exec_shard(binary, config_fn, call_kw)
+            for config_fn in config_paths
+        ])
+        for log_fn, return_code in results:
+            self._echo_shard_log(log_fn, line_handler)
+        return_codes = [return_code for log_fn, return_code in results]
+        logger.info('karma shards exited with return codes %r', return_codes)
+        return return_codes
+
+    @coroutine
+    def karma_async(self, spec):
+        """
+        Start karma with the provided spec, asynchronously.
+        """
+
+        loop = asyncio.get_event_loop()
+        spec.handle(karma.BEFORE_KARMA)
+        if self._skip_karma(spec):
+            spec.handle(karma.AFTER_KARMA)
+            return
+
+        binary, config_fn, call_kw = self._prepare_karma(spec)
+        collector = karma.ResultCollector()
+        shard_config_paths = spec.get(karma.KARMA_SHARD_CONFIG_PATHS)
+        if shard_config_paths:
+            self._update_shard_return_codes(
+                spec, (yield from self.run_shards_async(
+                    binary, shard_config_paths, call_kw, collector.feed)))
+            self._merge_shard_coverage(spec)
+        else:
+            # starting a persistent server blocks until the browsers
+            # are captured, so do that in the executor.
+            args = yield from loop.run_in_executor(
+                None, self._karma_args, spec, binary, config_fn, call_kw)
+            spec[karma.KARMA_RETURN_CODE] = yield from self._exec(
+                args, collector.feed, **call_kw)
+        spec[karma.KARMA_RESULTS] = collector.results
+
+        spec.handle(karma.AFTER_KARMA)
+
+    @coroutine
+    def test_spec_async(self, spec):
+        spec.handle(BEFORE_TEST)
+        yield from self.karma_async(spec)
+        spec.handle(AFTER_TEST)
+
+    def test_spec(self, spec):
+        loop = spec.get(EVENT_LOOP)
+        if loop is None:
+            return super(AsyncKarmaDriver, self).test_spec(spec)
+        # this is invoked by the toolchain from within an executor of
+        # the loop, so schedule the tests onto the loop and wait.
+        asyncio.run_coroutine_threadsafe(
+            self.test_spec_async(spec), loop).result()
+
+    @coroutine
+    def run_async(self, toolchain, spec):
+        """
+        The asynchronous version of run; the toolchain is executed in
+        the default executor of the running loop, with the tests
+        executed on the loop.
+        """
+
+        loop = asyncio.get_event_loop()
+        spec[EVENT_LOOP] = loop
+        try:
+            # the previous build may be reused, which runs the tests.
+            completed = yield from loop.run_in_executor(
+                None, self.prepare_run, toolchain, spec)
+            if not completed:
+                self.setup_toolchain_spec(toolchain, spec)
+                yield from loop.run_in_executor(None, toolchain, spec)
+        finally:
+            spec.pop(EVENT_LOOP, None)
+        return spec
+
+
+@coroutine
+def run_specs_async(driver, toolchain_specs, concurrency=None):
+    """
+    Run the list of (toolchain, spec) pairs through the driver, with at
+    most concurrency of them being executed at any given time.  All
+    pairs will be executed even if some of them fail; the first error
+    encountered is then raised.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency or len(toolchain_specs) or 1)
+
+    @coroutine
+    def run(toolchain, spec):
+        yield from semaphore.acquire()
+        try:
+            return (yield from driver.run_async(toolchain, spec))
+        finally:
+            semaphore.release()
+
+    results = yield from asyncio.gather(*[
+        run(toolchain, spec) for toolchain, spec in toolchain_specs
+    ], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def run_specs(driver, toolchain_specs, concurrency=None, loop=None):
+    """
+    Run the list of (toolchain, spec) pairs through the driver using
+    the event loop; if not provided, a new one will be used.
+    """
+
+    if loop is not None:
+        return loop.run_until_complete(
+            run_specs_async(driver, toolchain_specs, concurrency))
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            run_specs_async(driver, toolchain_specs, concurrency))
+    finally:
+        loop.close()
+
+
+def run_runtimes(
+        karma_runtime, runtime_kwargs, concurrency=None, driver=None,
+        loop=None):
+    """
+    Run the toolchain runtimes with their arguments, as a list of
+    (runtime, kwargs) pairs, through the karma runtime concurrently;
+    returns the resulting specs.
+    """
+
+    driver = driver or AsyncKarmaDriver.create()
+    return run_specs(driver, [
+        (runtime.toolchain,
+            karma_runtime._prepare_spec_from_runtime(runtime, **kwargs))
+        for runtime, kwargs in runtime_kwargs
+    ], concurrency=concurrency, loop=loop)
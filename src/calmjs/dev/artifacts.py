@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the manifest of the artifacts under test, which
+records the size, modification time and digest of every artifact, such
+that the artifacts that changed since the previous run may be reported
+and the tests that have passed against identical artifacts need not be
+executed again.
+"""
+
+import json
+import os
+from hashlib import sha256
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from os.path import realpath
+
+from calmjs.dev import cache
+from calmjs.dev import utils
+
+ARTIFACTS_JSON = 'karma.artifacts.json'
+# the number of the most recent runs that passed to be remembered.
+PASSED_LIMIT = 32
+
+
+def stat_artifact(path, previous=None):
+    """
+    Return the record of the size, modification time and digest of the
+    file at path.  The digest of the previous record is reused if the
+    size and modification time are unchanged from it.
+    """
+
+    st = os.stat(path)
+    record = {'size': st.st_size, 'mtime': st.st_mtime}
+    if previous and previous.get('sha256') and all(
+            previous.get(key) == value for key, value in record.items()):
+        record['sha256'] = previous['sha256']
+    else:
+        record['sha256'] = cache.file_digest(path)
+    return record
+
+
+def resolve_artifacts(paths, previous=None, digest=True, processes=None):
+    """
+    Resolve the paths to the artifacts through a pool of threads,
+    returning a list of tuples of the real path and the record for each
+    of the artifacts in the original order; the record is None for the
+    artifacts that do not exist, and empty if digest is False.
+    """
+
+    previous = previous or {}
+
+    def resolve(path):
+        realp = realpath(path)
+        if not exists(realp):
+            return realp, None
+        if not digest:
+            return realp, {}
+        return realp, stat_artifact(realp, previous.get(realp))
+
+    return utils.thread_map(resolve, paths, processes)
+
+
+def compare(previous, current):
+    """
+    Return the lists of the paths in current that are absent from, and
+    that differ in digest with the records in previous.
+    """
+
+    added = []
+    changed = []
+    for path, record in current.items():
+        if path not in previous:
+            added.append(path)
+        elif previous[path].get('sha256') != record.get('sha256'):
+            changed.append(path)
+    return sorted(added), sorted(changed)
+
+
+def load_manifest(path):
+    manifest = cache.read_json(dirname(path), basename(path), {})
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(path, manifest):
+    cache.write_json(dirname(path), basename(path), manifest)
+
+
+def update_manifest(path, records):
+    """
+    Merge the records of the artifacts into the manifest at path,
+    returning the records previously held for them.
+    """
+
+    manifest = load_manifest(path)
+    artifacts = manifest.setdefault('artifacts', {})
+    previous = {key: artifacts[key] for key in records if key in artifacts}
+    artifacts.update(records)
+    save_manifest(path, manifest)
+    return previous
+
+
+def run_key(digests, config, file_digests, build_dir):
+    """
+    Produce the key that identifies a run of the karma config against
+    the artifacts with the provided digests, along with the digests of
+    the other files that are served.  The path to the build directory
+    is not included, such that runs from temporary build directories
+    may be identified.
+    """
+
+    value = json.dumps(
+        [digests, config, file_digests], sort_keys=True
+    ).replace(json.dumps(build_dir)[1:-1], '')
+    return sha256(value.encode('utf8')).hexdigest()
+
+
+def has_passed(path, key):
+    return key in load_manifest(path).get('passed', [])
+
+
+def record_passed(path, key):
+    manifest = load_manifest(path)
+    passed = [k for k in manifest.get('passed', []) if k != key]
+    manifest['passed'] = (passed + [key])[-PASSED_LIMIT:]
+    save_manifest(path, manifest)
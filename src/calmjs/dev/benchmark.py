@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides benchmarks for the generation of the karma
+configuration and the resolution of the module registries, against
+synthetic packages and registries of configurable size, such that the
+scaling of these may be checked and compared against recorded
+baselines.  For example::
+
+    $ python -m calmjs.dev.benchmark --modules=1000,6000 --packages=100 \\
+        --save=baseline.json
+    $ python -m calmjs.dev.benchmark --modules=1000,6000 --packages=100 \\
+        --baseline=baseline.json
+"""
+
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from math import log
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from calmjs.base import BaseModuleRegistry
+from calmjs.registry import _inst as root_registry
+from calmjs.toolchain import Spec
+
+from calmjs.dev import dist
+from calmjs.dev import karma
+from calmjs.dev.cli import KarmaDriver
+
+REGISTRY_PREFIX = 'calmjs.dev.benchmark.module'
+TEST_REGISTRY_SUFFIX = '.tests'
+# the keys of the synthetic spec for the transpiled sources.
+SPEC_KEYS = ['transpiled_targets']
+
+MODULES_DEFAULT = (1000, 3000, 6000)
+PACKAGES_DEFAULT = 100
+REGISTRIES_DEFAULT = 2
+REPEAT_DEFAULT = 3
+THRESHOLD_DEFAULT = 1.5
+
+
+class SyntheticRegistry(BaseModuleRegistry):
+    """
+    A module registry populated directly with the records for the
+    synthetic packages, rather than through entry points.
+    """
+
+    def __init__(self, registry_name, package_records):
+        super(SyntheticRegistry, self).__init__(
+            registry_name, _working_set=None)
+        for package_name, records in package_records.items():
+            self.package_module_map[package_name] = [package_name]
+            self.records[package_name] = records
+
+    def _map_entry_point_module(self, entry_point, module):
+        return {}
+
+
+class Synthetic(object):
+    """
+    The synthetic packages with their source and test modules, spread
+    evenly across the packages and the registries.
+    """
+
+    def __init__(
+            self, modules, packages=PACKAGES_DEFAULT,
+            registries=REGISTRIES_DEFAULT, root='/synthetic'):
+        self.package_names = ['pkg%d' % i for i in range(packages)]
+        self.registry_names = [
+            '%s%d' % (REGISTRY_PREFIX, i) for i in range(registries)]
+        self.test_registry_names = [
+            name + TEST_REGISTRY_SUFFIX for name in self.registry_names]
+        self.sources = {}
+        self.registries = {}
+        for name in self.registry_names + self.test_registry_names:
+            self.registries[name] = {
+                package_name: {} for package_name in self.package_names}
+
+        for i in range(modules):
+            package_name = self.package_names[i % packages]
+            idx = i % registries
+            module = '%s/mod%d' % (package_name, i)
+            source = join(root, module + '.js')
+            test_module = '%s/tests/test_mod%d' % (package_name, i)
+            self.sources[module] = source
+            self.registries[self.registry_names[idx]][package_name][
+                module] = source
+            self.registries[self.test_registry_names[idx]][package_name][
+                test_module] = join(root, test_module + '.js')
+
+    @contextmanager
+    def registered(self):
+        """
+        Make the synthetic registries available through the root
+        registry within the context.
+        """
+
+        for name, package_records in self.registries.items():
+            root_registry.records[name] = SyntheticRegistry(
+                name, package_records)
+        try:
+            yield
+        finally:
+            for name in self.registries:
+                root_registry.records.pop(name, None)
+
+    def spec(self, build_dir, **kw):
+        spec = Spec(
+            build_dir=build_dir,
+            test_package_names=list(self.package_names),
+            calmjs_test_registry_names=list(self.test_registry_names),
+            transpiled_targets=dict(self.sources),
+            karma_spec_keys=list(SPEC_KEYS),
+            coverage_enable=True,
+        )
+        spec.update(kw)
+        return spec
+
+
+def bench_create_config(synthetic, build_dir):
+    driver = KarmaDriver()
+    spec = synthetic.spec(build_dir)
+    return lambda: driver._create_config(spec, SPEC_KEYS)
+
+
+def bench_apply_coverage_config(synthetic, build_dir):
+    driver = KarmaDriver()
+    spec = synthetic.spec(build_dir)
+    files = sorted(synthetic.sources.values())
+    test_module_paths = sorted(dist.get_module_registries_dependencies(
+        synthetic.package_names, synthetic.test_registry_names).values())
+    return lambda: driver._apply_coverage_config(
+        spec, {'reporters': []}, files, test_module_paths)
+
+
+def bench_apply_preprocessors_config(synthetic, build_dir):
+    driver = KarmaDriver()
+    preprocessors = {
+        path: ['coverage'] for path in synthetic.sources.values()}
+    return lambda: driver._apply_preprocessors_config({
+        'preprocessors': {'*.js': 'existing'}}, preprocessors)
+
+
+def _bench_write_config(synthetic, build_dir, **kw):
+    driver = KarmaDriver()
+    spec = synthetic.spec(build_dir, **kw)
+    spec[karma.KARMA_CONFIG] = driver._create_config(spec, SPEC_KEYS)
+
+    def write_config():
+        # always measure a fresh write of the files.
+        for name in os.listdir(build_dir):
+            os.remove(join(build_dir, name))
+        driver._write_config(spec)
+
+    return write_config
+
+
+def bench_write_config(synthetic, build_dir):
+    return _bench_write_config(synthetic, build_dir)
+
+
+def bench_write_compact_config(synthetic, build_dir):
+    return _bench_write_config(
+        synthetic, build_dir, karma_compact_config=True)
+
+
+def bench_registries_dependencies(synthetic, build_dir):
+    registry_names = (
+        synthetic.registry_names + synthetic.test_registry_names)
+    return lambda: dist.get_module_registries_dependencies(
+        synthetic.package_names, registry_names)
+
+
+# each of the benchmarks, as a function that accepts the synthetic
+# packages and a build directory, returning the callable to be timed.
+BENCHMARKS = (
+    ('create_config', bench_create_config),
+    ('apply_coverage_config', bench_apply_coverage_config),
+    ('apply_preprocessors_config', bench_apply_preprocessors_config),
+    ('write_config', bench_write_config),
+    ('write_compact_config', bench_write_compact_config),
+    ('registries_dependencies', bench_registries_dependencies),
+)
+
+
+def measure(func, repeat=REPEAT_DEFAULT):
+    """
+    Return the shortest duration of the calls to func out of repeat.
+    """
+
+    durations = []
+    for i in range(repeat):
+        start = default_timer()
+        func()
+        durations.append(default_timer() - start)
+    return min(durations)
+
+
+def run_benchmarks(
+        modules=MODULES_DEFAULT, packages=PACKAGES_DEFAULT,
+        registries=REGISTRIES_DEFAULT, repeat=REPEAT_DEFAULT, names=None):
+    """
+    Run the benchmarks for each of the number of modules, returning the
+    durations keyed by the name of the benchmark and then the number of
+    modules as a string.
+    """
+
+    results = {}
+    build_dir = mkdtemp()
+    try:
+        for count in modules:
+            synthetic = Synthetic(count, packages, registries)
+            with synthetic.registered():
+                for name, factory in BENCHMARKS:
+                    if names and name not in names:
+                        continue
+                    results.setdefault(name, {})[str(count)] = measure(
+                        factory(synthetic, build_dir), repeat)
+    finally:
+        rmtree(build_dir)
+    return results
+
+
+def scaling(durations):
+    """
+    Return the exponent of the growth of the durations, keyed by the
+    number of modules, between the smallest and the largest number; 1
+    is linear, 2 is quadratic.
+    """
+
+    counts = sorted(int(count) for count in durations)
+    if len(counts) < 2:
+        return None
+    low, high = durations[str(counts[0])], durations[str(counts[-1])]
+    if low <= 0 or high <= 0:
+        return None
+    return log(high / low) / log(float(counts[-1]) / counts[0])
+
+
+def compare(results, baseline, threshold=THRESHOLD_DEFAULT):
+    """
+    Return the list of regressions against the baseline, as tuples of
+    the name, the number of modules, the baseline and the current
+    duration, for the durations that exceed the baseline by the factor
+    specified by threshold.
+    """
+
+    regressions = []
+    for name in sorted(results):
+        for count in sorted(results[name], key=int):
+            expected = baseline.get(name, {}).get(count)
+            current = results[name][count]
+            if expected and current > expected * threshold:
+                regressions.append((name, int(count), expected, current))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for name, factory in BENCHMARKS:
+        if name not in results:
+            continue
+        durations = results[name]
+        lines.append('%s:' % name)
+        for count in sorted(durations, key=int):
+            line = '  %6s modules: %9.2fms' % (count, durations[count] * 1000)
+            expected = (baseline or {}).get(name, {}).get(count)
+            if expected:
+                line += ' (%.2fx baseline)' % (durations[count] / expected)
+            lines.append(line)
+        exponent = scaling(durations)
+        if exponent is not None:
+            lines.append('  scaling exponent: %.2f' % exponent)
+    return '\n'.join(lines)
+
+
+def main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    parser = ArgumentParser(
+        prog='python -m calmjs.dev.benchmark',
+        description='benchmark the generation of karma configurations and '
+                    'the resolution of module registries',
+    )
+    parser.add_argument(
+        '--modules', default=','.join(str(i) for i in MODULES_DEFAULT),
+        type=lambda value: [int(i) for i in value.split(',')],
+        help='comma separated list of the numbers of synthetic modules to '
+             'benchmark against; default: %(default)s')
+    parser.add_argument(
+        '--packages', type=int, default=PACKAGES_DEFAULT,
+        help='the number of synthetic packages; default: %(default)s')
+    parser.add_argument(
+        '--registries', type=int, default=REGISTRIES_DEFAULT,
+        help='the number of synthetic module registries, each with a test '
+             'registry; default: %(default)s')
+    parser.add_argument(
+        '--repeat', type=int, default=REPEAT_DEFAULT,
+        help='the number of times each benchmark is repeated, with the '
+             'shortest duration kept; default: %(default)s')
+    parser.add_argument(
+        '--benchmark', action='append', dest='names',
+        choices=[name for name, factory in BENCHMARKS],
+        help='the benchmark to run; may be specified multiple times; '
+             'defaults to all of them')
+    parser.add_argument(
+        '--save', metavar='FILE',
+        help='record the results as the baseline into the file')
+    parser.add_argument(
+        '--baseline', metavar='FILE',
+        help='compare the results against the baseline in the file, '
+             'exiting with an error if any of them regressed')
+    parser.add_argument(
+        '--threshold', type=float, default=THRESHOLD_DEFAULT,
+        help='the factor of the baseline duration beyond which a result '
+             'is considered a regression; default: %(default)s')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.modules, args.packages, args.registries, args.repeat,
+        args.names)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)['results']
+    stream.write(format_results(results, baseline) + '\n')
+
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump({
+                'parameters': {
+                    'packages': args.packages,
+                    'registries': args.registries,
+                    'repeat': args.repeat,
+                },
+                'results': results,
+            }, fd, indent=2, sort_keys=True)
+
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, count, expected, current in regressions:
+        stream.write(
+            'regression: %s with %d modules took %.2fms, baseline %.2fms\n'
+            % (name, count, current * 1000, expected * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides a simple persistent cache for values that are
+expensive to compute but stable across runs, stored as JSON files in a
+cache directory.
+"""
+
+import json
+import logging
+import os
+from hashlib import sha256
+from os.path import dirname
+from os.path import exists
+from os.path import getmtime
+from os.path import isdir
+from os.path import isfile
+from os.path import join
+
+from pkg_resources import working_set as default_working_set
+
+logger = logging.getLogger(__name__)
+
+
+def digest(value):
+    """
+    Produce a stable hex digest for a JSON serializable value.
+    """
+
+    return sha256(json.dumps(
+        value, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def file_digest(path, blocksize=65536):
+    """
+    Produce the hex digest for the contents of the file at path.
+    """
+
+    h = sha256()
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _metadata_mtime(dist):
+    # the egg_info attribute is provided by the metadata provider for
+    # distributions found on the filesystem.
+    egg_info = getattr(dist, 'egg_info', None)
+    if not egg_info or not isdir(egg_info):
+        return None
+    return max([getmtime(egg_info)] + [
+        getmtime(join(egg_info, name)) for name in os.listdir(egg_info)])
+
+
+def files_digests(paths):
+    """
+    Return a mapping of the files at the provided paths to the digest
+    of their contents; directories are walked for the files within,
+    while missing paths are omitted.
+    """
+
+    result = {}
+    for path in paths:
+        if isfile(path):
+            result[path] = file_digest(path)
+        elif isdir(path):
+            for root, dirs, files in os.walk(path):
+                for name in files:
+                    target = join(root, name)
+                    result[target] = file_digest(target)
+    return result
+
+
+def spec_digest(spec):
+    """
+    Produce a digest for the items in the spec that are serializable
+    as JSON; the rest are ignored.
+    """
+
+    items = {}
+    for key, value in spec.items():
+        try:
+            json.dumps(value, sort_keys=True)
+        except (TypeError, ValueError):
+            continue
+        items[key] = value
+    return digest(items)
+
+
+def working_set_fingerprint(working_set=None):
+    """
+    Produce a digest that identifies the state of the distributions in
+    the working set, derived from their names, versions, locations and
+    the modification times of their metadata.
+    """
+
+    working_set = working_set or default_working_set
+    return digest(sorted(
+        (dist.project_name, dist.version, dist.location,
+            _metadata_mtime(dist))
+        for dist in working_set
+    ))
+
+
+def path_stamps(paths):
+    """
+    Return a mapping of the parent directories of the provided paths to
+    their modification times, such that the addition or removal of
+    files within them may be detected.
+    """
+
+    dirs = set(dirname(path) for path in paths)
+    return {d: getmtime(d) for d in dirs if exists(d)}
+
+
+def check_stamps(stamps):
+    return all(
+        exists(d) and getmtime(d) == mtime for d, mtime in stamps.items())
+
+
+def read_json(cache_dir, name, default=None):
+    """
+    Read the named JSON file from the cache directory; the default is
+    returned if it does not exist or is unreadable.
+    """
+
+    path = join(cache_dir, name)
+    if not exists(path):
+        return default
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except (IOError, OSError, ValueError) as e:
+        logger.warning("ignoring unreadable cache file '%s': %s", path, e)
+        return default
+
+
+def write_json(cache_dir, name, value):
+    """
+    Write the value as the named JSON file into the cache directory,
+    replacing the existing file only once the write is complete.
+    """
+
+    if not exists(cache_dir):
+        os.makedirs(cache_dir)
+    path = join(cache_dir, name)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as fd:
+        json.dump(value, fd, sort_keys=True)
+    if exists(path):
+        # os.rename does not replace an existing file on Windows.
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def cached(cache_dir, name, key, factory, stamp_paths=None,
+           working_set=None):
+    """
+    Return the value stored under key in the named cache file, or
+    produce it through the factory and store it.
+
+    Entries are invalidated whenever the fingerprint of the working set
+    changes.  If stamp_paths is provided, it is called with the value
+    produced to derive the paths whose parent directories will also be
+    checked for changes.
+    """
+
+    fingerprint = working_set_fingerprint(working_set)
+    key = digest(key)
+    entries = read_json(cache_dir, name, {})
+    entry = entries.get(key)
+    if (isinstance(entry, dict) and
+            entry.get('fingerprint') == fingerprint and
+            check_stamps(entry.get('stamps', {}))):
+        logger.debug("using cached value from '%s'", join(cache_dir, name))
+        return entry['value']
+
+    value = factory()
+    # drop entries produced from a different working set.
+    entries = {
+        k: v for k, v in entries.items()
+        if isinstance(v, dict) and v.get('fingerprint') == fingerprint
+    }
+    entries[key] = {
+        'fingerprint': fingerprint,
+        'stamps': path_stamps(stamp_paths(value)) if stamp_paths else {},
+        'value': value,
+    }
+    write_json(cache_dir, name, entries)
+    return value
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the bundling of the test modules into a small
+number of chunk files, each with a source map that maps every line back
+to the test module it came from, such that the browser only has to load
+a handful of scripts rather than every test module individually.
+"""
+
+import codecs
+import json
+import re
+from os.path import basename
+from os.path import dirname
+from os.path import join
+from os.path import relpath
+
+from calmjs.dev import utils
+
+CHUNK_TEMPLATE = '%s.bundle%d.js'
+SOURCE_MAP_SUFFIX = '.map'
+# the lines surrounding the test modules that are to be wrapped in a
+# closure, as done by the wrap preprocessor; the leading semicolon
+# terminates any unterminated statement from the preceding module.
+WRAP_HEAD = ';(function () {'
+WRAP_TAIL = '})();'
+SEPARATOR = ';'
+
+BASE64 = (
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/')
+
+# the line terminators of ECMAScript.
+_lines = re.compile(u'\r\n|[\r\n\u2028\u2029]')
+
+
+def encode_vlq(value):
+    """
+    Encode the integer as a base64 variable length quantity, as used by
+    the mappings of source maps.
+    """
+
+    value = ((-value) << 1) | 1 if value < 0 else value << 1
+    result = ''
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value:
+            digit |= 32
+        result += BASE64[digit]
+        if not value:
+            return result
+
+
+def split(items, count):
+    """
+    Split the items into at most count contiguous lists, such that the
+    lengths of the resulting lists differ by at most one and the order
+    of the items is retained.  Empty lists are not returned.
+    """
+
+    items = list(items)
+    count = max(1, min(count, len(items)))
+    size, extra = divmod(len(items), count)
+    results = []
+    start = 0
+    for idx in range(count):
+        end = start + size + (1 if idx < extra else 0)
+        if end > start:
+            results.append(items[start:end])
+        start = end
+    return results
+
+
+def build_chunk(paths, wrap_paths=(), chunk_fn='chunk.js'):
+    """
+    Concatenate the modules at paths, with the ones in wrap_paths each
+    wrapped in a closure, returning the source of the chunk along with
+    its source map as a dict.  The sources in the map are relative to
+    the directory of chunk_fn.
+    """
+
+    wrap_paths = set(wrap_paths)
+    lines = []
+    mappings = []
+    sources = []
+    contents = []
+    last_source = last_line = 0
+    for idx, path in enumerate(paths):
+        with codecs.open(path, encoding='utf8') as fd:
+            text = fd.read()
+        sources.append(relpath(path, dirname(chunk_fn) or '.'))
+        contents.append(text)
+        wrap = path in wrap_paths
+        lines.append(WRAP_HEAD if wrap else SEPARATOR)
+        mappings.append('')
+        for lineno, line in enumerate(_lines.split(text.rstrip(u'\r\n'))):
+            lines.append(line)
+            # every line maps from its first column to the first column
+            # of the source line, relative to the previous segment.
+            mappings.append('A%s%sA' % (
+                encode_vlq(idx - last_source), encode_vlq(lineno - last_line)))
+            last_source, last_line = idx, lineno
+        if wrap:
+            lines.append(WRAP_TAIL)
+            mappings.append('')
+
+    lines.append('//# sourceMappingURL=%s' % basename(
+        chunk_fn + SOURCE_MAP_SUFFIX))
+    source_map = {
+        'version': 3,
+        'file': basename(chunk_fn),
+        'sources': sources,
+        'sourcesContent': contents,
+        'names': [],
+        'mappings': ';'.join(mappings),
+    }
+    return u'\n'.join(lines) + u'\n', source_map
+
+
+def write_chunks(build_dir, name, paths, count, wrap_paths=()):
+    """
+    Bundle the modules at paths into at most count chunk files, written
+    into build_dir along with their source maps.  Return the list of
+    the paths to the chunk files, in the order of the modules bundled.
+    Chunk files with identical contents are not rewritten.
+    """
+
+    results = []
+    for idx, chunk in enumerate(split(paths, count)):
+        chunk_fn = join(build_dir, CHUNK_TEMPLATE % (name, idx))
+        source, source_map = build_chunk(chunk, wrap_paths, chunk_fn)
+        utils.write_if_changed(chunk_fn, source)
+        utils.write_if_changed(
+            chunk_fn + SOURCE_MAP_SUFFIX, json.dumps(source_map))
+        results.append(chunk_fn)
+    return results
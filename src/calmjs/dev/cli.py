@@ -3,13 +3,29 @@
 This module provides interface to the karma cli runtime.
 """
 
+import codecs
+import json
 import logging
-import re
+import os
+import shutil
+import signal
+import sys
+from copy import deepcopy
+from hashlib import sha256
+from os.path import basename
 from os.path import curdir
+from os.path import dirname
+from os.path import exists
+from os.path import getmtime
+from os.path import isabs
 from os.path import join
 from os.path import realpath
 from os.path import sep
-from subprocess import call
+from os.path import splitext
+from subprocess import Popen
+from subprocess import STDOUT
+from time import sleep
+from time import time
 
 from calmjs.exc import AdviceAbort
 from calmjs.exc import ToolchainAbort
@@ -30,14 +46,32 @@ from calmjs.toolchain import TEST_MODULE_PATHS_MAP
 from calmjs.cli import NodeDriver
 from calmjs.cli import get_bin_version
 
+from calmjs.dev import artifacts
+from calmjs.dev import cache
+from calmjs.dev import chunks
+from calmjs.dev import coverage
 from calmjs.dev import dist
+from calmjs.dev import impact
 from calmjs.dev import karma
+from calmjs.dev import phases
+from calmjs.dev import pool
+from calmjs.dev import testcache
+from calmjs.dev import timing
 from calmjs.dev import utils
+from calmjs.dev.paths import COVER
+from calmjs.dev.paths import WRAP
+from calmjs.dev.paths import compact_paths
+from calmjs.dev.paths import get_classifier
 
+from calmjs.dev.toolchain import CACHE_DIR
 from calmjs.dev.toolchain import COVERAGE_ENABLE
 from calmjs.dev.toolchain import COVERAGE_TYPE
 from calmjs.dev.toolchain import COVER_ARTIFACT
 from calmjs.dev.toolchain import COVER_BUNDLE
+from calmjs.dev.toolchain import COVER_CACHE
+from calmjs.dev.toolchain import COVER_EXCLUDE
+from calmjs.dev.toolchain import COVER_NATIVE
+from calmjs.dev.toolchain import COVER_RAW_DIR
 from calmjs.dev.toolchain import COVER_REPORT_DIR
 from calmjs.dev.toolchain import COVER_REPORT_FILE
 from calmjs.dev.toolchain import COVER_TEST
@@ -45,11 +79,20 @@ from calmjs.dev.toolchain import COVER_TEST
 from calmjs.dev.toolchain import COVERAGE_TYPE_DEFAULT
 from calmjs.dev.toolchain import COVER_REPORT_DIR_DEFAULT
 from calmjs.dev.toolchain import NO_WRAP_TESTS
+from calmjs.dev.toolchain import TEST_CHANGED_FILES
 from calmjs.dev.toolchain import TEST_FILENAME_PREFIX
 from calmjs.dev.toolchain import TEST_FILENAME_PREFIX_DEFAULT
+from calmjs.dev.toolchain import TEST_IMPACT_INDEX
+from calmjs.dev.toolchain import TEST_NO_CACHE
+from calmjs.dev.toolchain import get_resolver
 
 logger = logging.getLogger(__name__)
 
+# the function used to invoke karma; it streams the output to the
+# console while passing each line to a handler, but is otherwise a drop
+# in replacement for subprocess.call for those that need to stub it.
+call = utils.tee_call
+
 
 class KarmaDriver(NodeDriver):
     """
@@ -76,38 +119,351 @@ class KarmaDriver(NodeDriver):
         self.binary = binary
         self.testrunner_advice_name = testrunner_advice_name
         self.karma_conf_js = karma_conf_js
+        # persistent karma server processes started by this instance,
+        # keyed by the port they listen on.
+        self.servers = {}
 
     def get_karma_version(self):
         kw = self._gen_call_kws()
         return get_bin_version(self.binary, version_flag='--version', kw=kw)
 
-    def karma(self, spec):
+    def _prepare_karma(self, spec):
         """
-        Start karma with the provided spec
+        Return the resolved karma binary, the path to the config file and
+        the keyword arguments for invoking karma with the spec.
         """
 
-        spec.handle(karma.BEFORE_KARMA)
-
         config_fn = join(spec[BUILD_DIR], self.karma_conf_js)
         call_kw = self._gen_call_kws(**utils.extract_gui_environ_keys())
-        logger.info('invoking %s start %r', self.binary, config_fn)
-        # TODO would be great if there is a way to "tee" the result into
-        # both here and stdout.
-        # perhaps the provided spec can contain well-defined keywords
-        # that can be passed to the `call` function (extend call_kw).
-        # For now at least log this down like so.
+        logger.info(
+            'invoking %s %s %r', self.binary,
+            'run' if spec.get(karma.KARMA_PERSISTENT_SERVER) else 'start',
+            config_fn,
+        )
         binary = self.which() or self.which_with_node_modules()
         if binary is None:
             raise AdviceAbort('karma not found')
+        return binary, config_fn, call_kw
+
+    def _no_tests_selected(self, spec):
+        # only applicable when the test modules are narrowed down by the
+        # changed files or by the test cache, otherwise the lack of tests
+        # is reported by karma.
+        if spec.get(TEST_CHANGED_FILES) is None and not spec.get(
+                karma.KARMA_TEST_CACHED):
+            return False
+        test_module_paths = set(spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+        return not any(
+            path in test_module_paths
+            for path in spec.get(karma.KARMA_CONFIG, {}).get('files', [])
+        )
+
+    def _karma_skipped(self, spec):
+        return bool(spec.get(karma.KARMA_SKIPPED)) or self._no_tests_selected(
+            spec)
+
+    def _artifact_run_key(self, spec):
+        """
+        Return the key that identifies the run of the karma config in
+        the spec against the artifacts recorded in the manifest of the
+        artifacts, or None if not applicable.
+        """
+
+        manifest_path = spec.get(karma.KARMA_ARTIFACT_MANIFEST)
+        artifact_paths = spec.get(ARTIFACT_PATHS)
+        if not (manifest_path and artifact_paths):
+            return None
+        records = artifacts.load_manifest(manifest_path).get('artifacts', {})
+        digests = [records.get(path, {}).get('sha256') for path in (
+            artifact_paths)]
+        if not all(digests):
+            return None
+        karma_config = spec.get(karma.KARMA_CONFIG, {})
+        build_dir = spec[BUILD_DIR]
+        # the artifacts are already identified by their digests.
+        file_digests = cache.files_digests(
+            join(build_dir, f) for f in karma_config.get('files', [])
+            if not isinstance(f, dict) and f not in records
+        )
+        return artifacts.run_key(
+            digests, karma_config, file_digests, build_dir)
+
+    def _artifacts_passed(self, spec):
+        if not spec.get(karma.KARMA_SKIP_UNCHANGED_ARTIFACTS):
+            return False
+        if spec.get(COVERAGE_ENABLE):
+            logger.info(
+                'karma will be invoked regardless of unchanged artifacts '
+                'as coverage is enabled')
+            return False
+        key = spec[karma.KARMA_ARTIFACT_RUN_KEY] = self._artifact_run_key(
+            spec)
+        return key is not None and artifacts.has_passed(
+            spec[karma.KARMA_ARTIFACT_MANIFEST], key)
+
+    def _skip_karma(self, spec):
+        """
+        Skip the execution of karma for the spec if no test modules were
+        affected by the changed files or left by the test cache, as karma
+        would otherwise fail for the lack of tests, or if the tests have
+        passed in a previous run against identical artifacts; returns
+        True if skipped.
+        """
+
+        if self._no_tests_selected(spec) and spec.get(
+                karma.KARMA_TEST_CACHED):
+            logger.info(
+                'all selected test modules have passed in a previous run '
+                'with identical inputs; karma will not be invoked')
+        elif self._no_tests_selected(spec):
+            logger.info(
+                'no test modules affected by the changed files; '
+                'karma will not be invoked')
+        elif self._artifacts_passed(spec):
+            logger.info(
+                'tests have passed in a previous run against identical '
+                'artifacts; karma will not be invoked')
+            spec[karma.KARMA_SKIPPED] = True
+        else:
+            return False
+        spec[karma.KARMA_RETURN_CODE] = 0
+        spec[karma.KARMA_RESULTS] = karma.ResultCollector().results
+        return True
+
+    def record_artifacts_passed(self, spec):
+        """
+        Record the run into the manifest of the artifacts if the tests
+        have passed, such that the tests need not be executed against
+        identical artifacts again.
+        """
+
+        key = spec.get(karma.KARMA_ARTIFACT_RUN_KEY)
+        if key is None or spec.get(karma.KARMA_SKIPPED):
+            return
+        if spec.get(karma.KARMA_RETURN_CODE) == 0:
+            artifacts.record_passed(spec[karma.KARMA_ARTIFACT_MANIFEST], key)
+
+    def record_test_cache(self, spec):
+        """
+        Record the fingerprints of the executed test modules that have
+        passed into the test cache, such that they need not be executed
+        again for as long as their inputs remain identical.
+        """
+
+        test_fingerprints = spec.get(karma.KARMA_TEST_FINGERPRINTS)
+        if not test_fingerprints or self._karma_skipped(spec):
+            return
+        cached = set(spec.get(karma.KARMA_TEST_CACHED, []))
+        test_module_paths_map = spec.get(TEST_MODULE_PATHS_MAP, {})
+        executed = {
+            modname: test_module_paths_map[modname]
+            for modname in test_fingerprints
+            if modname not in cached and modname in test_module_paths_map
+        }
+        if spec.get(karma.KARMA_RETURN_CODE) == 0:
+            succeeded, failed = set(executed), set()
+        else:
+            path_names = {path: modname for modname, path in executed.items()}
+            succeeded, failed, unattributed = testcache.attribute_results(
+                spec.get(karma.KARMA_RESULTS, {}).get('tests', []),
+                timing.map_suites_to_files(path_names), path_names,
+            )
+            if unattributed:
+                # any of the test modules may have failed.
+                succeeded = set()
+        testcache.update_cache(
+            spec[CACHE_DIR], test_fingerprints, succeeded, failed)
+        logger.debug(
+            'recorded %d passed test modules into the test cache',
+            len(succeeded))
+
+    def _karma_args(self, spec, binary, config_fn, call_kw):
         # but actually run it with the '--color' flag, because otherwise
         # colors don't work consistently... Node.js tools in a nutshell.
         # ... at least disable colours in the config file will also make
         # this option disabled.
-        spec[karma.KARMA_RETURN_CODE] = call(
-            [binary, 'start', config_fn, '--color'], **call_kw)
+        if spec.get(karma.KARMA_PERSISTENT_SERVER):
+            port = self.start_server(spec, binary, config_fn, call_kw)
+            return [binary, 'run', config_fn, '--port', str(port), '--color']
+        return [binary, 'start', config_fn, '--color']
 
+    def _update_shard_return_codes(self, spec, return_codes):
+        spec[karma.KARMA_SHARD_RETURN_CODES] = return_codes
+        spec[karma.KARMA_RETURN_CODE] = next(
+            (code for code in return_codes if code), 0)
+
+    def karma(self, spec):
+        """
+        Start karma with the provided spec
+        """
+
+        spec.handle(karma.BEFORE_KARMA)
+        self.run_karma(spec)
         spec.handle(karma.AFTER_KARMA)
 
+    def run_karma(self, spec):
+        """
+        Run karma with the config already written for the spec, without
+        triggering any of the advices.
+        """
+
+        if self._skip_karma(spec):
+            return
+        binary, config_fn, call_kw = self._prepare_karma(spec)
+        collector = karma.ResultCollector()
+        shard_config_paths = spec.get(karma.KARMA_SHARD_CONFIG_PATHS)
+        if shard_config_paths:
+            self._update_shard_return_codes(spec, self.run_shards(
+                binary, shard_config_paths, call_kw, collector.feed))
+            self._merge_shard_coverage(spec)
+        else:
+            spec[karma.KARMA_RETURN_CODE] = call(
+                self._karma_args(spec, binary, config_fn, call_kw),
+                line_handler=collector.feed, **call_kw)
+        spec[karma.KARMA_RESULTS] = collector.results
+
+    def _read_server_state(self, spec):
+        state_fn = join(spec[BUILD_DIR], karma.KARMA_SERVER_JSON)
+        if not exists(state_fn):
+            return {}
+        try:
+            with open(state_fn) as fd:
+                return json.load(fd)
+        except ValueError:
+            logger.warning("ignoring malformed '%s'", state_fn)
+            return {}
+
+    def _wait_for_capture(self, proc, log_fn, timeout):
+        deadline = time() + timeout
+        while time() < deadline:
+            if proc.poll() is not None:
+                raise AdviceAbort(
+                    'karma server exited with return code %s; refer to %r '
+                    'for details' % (proc.returncode, log_fn))
+            with open(log_fn) as fd:
+                if karma.KARMA_SERVER_CAPTURED in fd.read():
+                    return
+            sleep(0.1)
+        proc.terminate()
+        raise AdviceAbort(
+            'karma server failed to capture a browser within %s seconds' %
+            timeout)
+
+    def start_server(self, spec, binary, config_fn, call_kw):
+        """
+        Ensure that a persistent karma server for the config written for
+        the spec is running, starting a new one if necessary.  Returns
+        the port the server is listening on.
+
+        The state of the server is recorded in the build directory, such
+        that subsequent invocations using the same build directory and
+        an identical configuration will reuse the running server.
+        """
+
+        build_dir = spec[BUILD_DIR]
+        port = spec.get(karma.KARMA_CONFIG, {}).get('port', 9876)
+        with open(config_fn, 'rb') as fd:
+            digest = sha256(fd.read()).hexdigest()
+        state = self._read_server_state(spec)
+
+        if state.get('port') == port and utils.check_port(port):
+            if state.get('config') == digest:
+                logger.info('reusing karma server listening on port %d', port)
+                return port
+            logger.info('karma configuration changed; restarting server')
+            self.stop_server(spec)
+
+        if utils.check_port(port):
+            raise AdviceAbort(
+                'port %d is in use by a process not managed by this build '
+                'directory; cannot start karma server' % port)
+
+        log_fn = join(build_dir, karma.KARMA_SERVER_LOG)
+        logger.info('starting persistent karma server on port %d', port)
+        with open(log_fn, 'wb') as log_fd:
+            proc = Popen(
+                [binary, 'start', config_fn], stdout=log_fd, stderr=STDOUT,
+                **call_kw)
+        self.servers[port] = proc
+        with open(join(build_dir, karma.KARMA_SERVER_JSON), 'w') as fd:
+            json.dump({'pid': proc.pid, 'port': port, 'config': digest}, fd)
+
+        timeout = spec.get(karma.KARMA_CONFIG, {}).get(
+            'captureTimeout', 60000) / 1000.0
+        self._wait_for_capture(proc, log_fn, timeout)
+        return port
+
+    def stop_server(self, spec):
+        """
+        Stop the persistent karma server recorded in the build directory
+        of the spec.
+        """
+
+        state = self._read_server_state(spec)
+        proc = self.servers.pop(state.get('port'), None)
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        elif state.get('pid'):
+            try:
+                os.kill(state['pid'], signal.SIGTERM)
+            except OSError:
+                logger.debug('karma server pid %s already gone', state['pid'])
+            # give the external process a moment to release the port.
+            deadline = time() + 5
+            while utils.check_port(state.get('port')) and time() < deadline:
+                sleep(0.1)
+        state_fn = join(spec[BUILD_DIR], karma.KARMA_SERVER_JSON)
+        if exists(state_fn):
+            os.remove(state_fn)
+
+    def stop_servers(self):
+        """
+        Stop all persistent karma servers started by this instance.
+        """
+
+        while self.servers:
+            port, proc = self.servers.popitem()
+            logger.info('stopping karma server on port %d', port)
+            proc.terminate()
+            proc.wait()
+
+    def run_shards(self, binary, config_paths, call_kw, line_handler=None):
+        """
+        Run a karma process for each of the provided shard config paths
+        concurrently, and return the list of their return codes.  The
+        output of each shard is captured into a log file next to its
+        config, and is written out in order once all shards complete,
+        with each line also passed to line_handler if provided.
+        """
+
+        procs = []
+        for config_fn in config_paths:
+            log_fn = self._shard_log_path(config_fn)
+            logger.info('invoking %s start %r', self.binary, config_fn)
+            with open(log_fn, 'wb') as log_fd:
+                procs.append((log_fn, Popen(
+                    [binary, 'start', config_fn, '--color'],
+                    stdout=log_fd, stderr=STDOUT, **call_kw)))
+
+        return_codes = []
+        for log_fn, proc in procs:
+            return_codes.append(proc.wait())
+            self._echo_shard_log(log_fn, line_handler)
+        logger.info('karma shards exited with return codes %r', return_codes)
+        return return_codes
+
+    def _shard_log_path(self, config_fn):
+        return splitext(config_fn)[0] + '.log'
+
+    def _echo_shard_log(self, log_fn, line_handler=None):
+        with codecs.open(log_fn, encoding='utf8', errors='replace') as fd:
+            for line in fd:
+                sys.stdout.write(line)
+                if line_handler:
+                    line_handler(line)
+        sys.stdout.flush()
+
     def abort_on_test_failure(self, spec):
         if spec.get(karma.KARMA_RETURN_CODE):
             raise ToolchainAbort('karma exited with return code %s' % spec.get(
@@ -137,8 +493,11 @@ class KarmaDriver(NodeDriver):
             result = fallback_callback(result)
         return result
 
-    def _valid_cover_file(self, path):
-        return path.endswith('js') and not re.search('__\w*__', path)
+    def _path_classifier(self, spec):
+        return get_classifier(
+            spec.get(TEST_FILENAME_PREFIX, TEST_FILENAME_PREFIX_DEFAULT),
+            spec.get(COVER_EXCLUDE) or (),
+        )
 
     def _apply_coverage_config(self, spec, config, files, test_module_paths):
         if not spec.get(COVERAGE_ENABLE):
@@ -164,7 +523,18 @@ class KarmaDriver(NodeDriver):
         cover_type = spec.get(COVERAGE_TYPE, COVERAGE_TYPE_DEFAULT)
         cover_dir = realpath(spec.get(
                 COVER_REPORT_DIR, COVER_REPORT_DIR_DEFAULT))
-        if cover_type == COVERAGE_TYPE_DEFAULT:
+        if self._native_coverage(spec):
+            # only the raw report is written by karma, staged where the
+            # collect_raw_coverage advice also expects it.
+            coverage_reporter = {
+                'dir': realpath(join(
+                    spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING)),
+                'reporters': [{
+                    'type': 'json',
+                    'file': coverage.RAW_COVERAGE_FILE,
+                }],
+            }
+        elif cover_type == COVERAGE_TYPE_DEFAULT:
             coverage_reporter = {
                 'dir': cover_dir,
                 'reporters': [
@@ -196,42 +566,424 @@ class KarmaDriver(NodeDriver):
                     covfile = realpath(covfile)
                 coverage_reporter['file'] = covfile
 
+        if spec.get(COVER_RAW_DIR) and not self._native_coverage(spec):
+            coverage_reporter = self._raw_coverage_reporter(
+                spec, coverage_reporter)
+
+        paths = set(self._path_classifier(spec).select(COVER, paths))
+        if spec.get(COVER_CACHE):
+            # the test modules remain with the preprocessors, such that
+            # they are wrapped after being instrumented.
+            instrumented = spec[karma.KARMA_INSTRUMENTED_PATHS] = (
+                self._instrument_cached(spec, paths - set(test_module_paths)))
+            paths.difference_update(instrumented)
+
         # finally, modify the config
         config['reporters'] = list(config['reporters']) + ['coverage']
         self._apply_preprocessors_config(config, {
-            path: ['coverage']
-            for path in paths if self._valid_cover_file(path)
-        })
+            path: ['coverage'] for path in paths})
         config['coverageReporter'] = coverage_reporter
 
-    def _valid_wrap_test_file(self, spec, path):
-        return re.search(r'%s[^\\\/]*js$' % spec.get(
-            TEST_FILENAME_PREFIX, TEST_FILENAME_PREFIX_DEFAULT), path)
+    def _instrument_cached(self, spec, paths):
+        """
+        Return the mapping of the provided paths to their instrumented
+        copies in the cache directory, with the ones not already cached
+        instrumented through istanbul; paths that cannot be instrumented
+        are omitted such that karma will instrument them instead.
+        """
+
+        if not spec.get(CACHE_DIR):
+            logger.warning(
+                'caching instrumented sources requires a cache directory')
+            return {}
+        istanbul = IstanbulDriver(
+            node_path=self.node_path, env_path=self.env_path,
+            working_dir=self.working_dir)
+        binary = istanbul.which() or istanbul.which_with_node_modules()
+        if binary is None:
+            logger.warning(
+                'istanbul not found; sources will be instrumented by karma')
+            return {}
+        # a different installation of istanbul may instrument the
+        # sources differently.
+        instrumenter = [realpath(binary), getmtime(realpath(binary))]
+
+        results = {}
+        hits = 0
+        for path in sorted(paths):
+            source = path if isabs(path) else join(spec[BUILD_DIR], path)
+            if not exists(source):
+                continue
+            source = realpath(source)
+            target = coverage.instrumented_path(
+                spec[CACHE_DIR], source, instrumenter)
+            if exists(target):
+                hits += 1
+            elif not istanbul.instrument(source, target, binary=binary):
+                continue
+            results[path] = target
+        logger.info(
+            'using %d cached and %d newly instrumented sources',
+            hits, len(results) - hits)
+        return results
+
+    def _raw_coverage_reporter(self, spec, coverage_reporter):
+        # the raw coverage report is written to a fixed location within
+        # the build directory such that the configuration is stable; it
+        # is then moved to the raw directory with a unique name by the
+        # collect_raw_coverage advice once karma completes.
+        if not spec.get(BUILD_DIR):
+            logger.warning(
+                "no build directory specified; raw coverage report will not "
+                "be written to '%s'", spec[COVER_RAW_DIR])
+            return coverage_reporter
+        if 'reporters' not in coverage_reporter:
+            coverage_reporter = {
+                'dir': coverage_reporter['dir'],
+                'reporters': [{
+                    k: v for k, v in coverage_reporter.items() if k != 'dir'
+                }],
+            }
+        coverage_reporter['reporters'].append({
+            'type': 'json',
+            'dir': realpath(join(
+                spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING)),
+            'file': coverage.RAW_COVERAGE_FILE,
+        })
+        return coverage_reporter
+
+    def _native_coverage(self, spec):
+        if not spec.get(COVER_NATIVE):
+            return False
+        if not spec.get(BUILD_DIR):
+            logger.warning(
+                "no build directory specified; coverage reports will be "
+                "produced by karma")
+            return False
+        return True
+
+    def _coverage_reporters(self, spec):
+        # the reporters for the reports produced by write_reports.
+        cover_type = spec.get(COVERAGE_TYPE, COVERAGE_TYPE_DEFAULT)
+        if spec.get(COVER_NATIVE):
+            return coverage.native_reporters_for_type(cover_type)
+        return coverage.reporters_for_type(cover_type)
+
+    def write_native_coverage(self, spec):
+        """
+        Produce the coverage reports from the raw coverage report that
+        was written by karma into the build directory, for the native
+        coverage mode.
+        """
+
+        if not (spec.get(COVERAGE_ENABLE) and self._native_coverage(spec)):
+            return
+        if spec.get(karma.KARMA_SHARD_CONFIG_PATHS):
+            # already written from the reports of the shards.
+            return
+        staging_dir = join(spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING)
+        paths = coverage.find_staged_coverage(staging_dir)
+        if not paths:
+            logger.warning(
+                "no raw coverage report found in '%s'", staging_dir)
+            return
+        reporters = self._coverage_reporters(spec)
+        driver = IstanbulDriver.create() if 'html' in reporters else None
+        coverage.write_reports(
+            coverage.merge_coverage_files(paths),
+            realpath(spec.get(COVER_REPORT_DIR, COVER_REPORT_DIR_DEFAULT)),
+            reporters, driver,
+        )
+        if not spec.get(COVER_RAW_DIR):
+            shutil.rmtree(staging_dir)
+
+    def collect_raw_coverage(self, spec):
+        """
+        Move the raw coverage reports produced by the karma run into the
+        raw coverage directory, each with a unique name such that the
+        reports from separate runs may be merged together.
+        """
+
+        if not (spec.get(COVERAGE_ENABLE) and spec.get(COVER_RAW_DIR) and
+                spec.get(BUILD_DIR)):
+            return
+        for path in coverage.collect_raw_coverage(
+                join(spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING),
+                spec[COVER_RAW_DIR]):
+            logger.info("wrote raw coverage report to '%s'", path)
 
     def _apply_wrap_tests(self, spec, config, test_module_paths):
         if spec.get(NO_WRAP_TESTS):
             return
         self._apply_preprocessors_config(config, {
-            path: ['wrap']
-            for path in test_module_paths
-            if self._valid_wrap_test_file(spec, path)
+            path: ['wrap'] for path in self._path_classifier(spec).select(
+                WRAP, test_module_paths)
         })
         config['wrapPreprocessor'] = {
             "template": "(function () { <%= contents %> })()",
         }
 
+    def _apply_test_bundles(self, spec, config, name):
+        """
+        Replace the test modules listed in the files of the config with
+        the chunk files they are bundled into, written to the build
+        directory under the provided name, with each test module wrapped
+        by the chunk in place of the wrap preprocessor.
+        """
+
+        count = spec.get(karma.KARMA_BUNDLE_TESTS)
+        if not count:
+            return
+        if spec.get(COVER_TEST):
+            logger.warning(
+                'test modules are not bundled as they are to be '
+                'instrumented for coverage')
+            return
+        if spec.get(karma.KARMA_WATCH):
+            logger.warning(
+                'test modules are not bundled as they are to be watched '
+                'for changes')
+            return
+
+        test_module_paths = set(spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+        files = config.get('files', [])
+        bundled = [
+            f for f in files
+            if not isinstance(f, dict) and f in test_module_paths]
+        if not bundled:
+            return
+        wrap_paths = [] if spec.get(NO_WRAP_TESTS) else (
+            self._path_classifier(spec).select(WRAP, bundled))
+        chunk_paths = chunks.write_chunks(
+            spec[BUILD_DIR], name, bundled, count, wrap_paths)
+
+        idx = files.index(bundled[0])
+        bundled = set(bundled)
+        remaining = [f for f in files if f not in bundled]
+        config['files'] = remaining[:idx] + chunk_paths + [{
+            'pattern': path + chunks.SOURCE_MAP_SUFFIX,
+            'included': False,
+            'watched': False,
+        } for path in chunk_paths] + remaining[idx:]
+        config['preprocessors'] = {
+            key: value for key, value in config.get(
+                'preprocessors', {}).items()
+            if key not in bundled
+        }
+        logger.info(
+            'bundled %d test modules into %d chunk files',
+            len(bundled), len(chunk_paths),
+        )
+
     def _apply_preprocessors_config(self, config, new_preprocessors):
         original = config['preprocessors'] = config.get('preprocessors', {})
-        for key in new_preprocessors:
-            preprocessor = original.get(key, [])
-            if not isinstance(preprocessor, list):
-                preprocessor = [preprocessor]
-            original[key] = preprocessor
-
-            if isinstance(new_preprocessors[key], list):
-                preprocessor.extend(new_preprocessors[key])
+        for key, value in new_preprocessors.items():
+            value = value if isinstance(value, list) else [value]
+            preprocessor = original.get(key)
+            if preprocessor is None:
+                original[key] = list(value)
+            elif isinstance(preprocessor, list):
+                preprocessor.extend(value)
             else:
-                preprocessor.append(new_preprocessors[key])
+                original[key] = [preprocessor] + value
+
+    def _timing_enabled(self, spec):
+        return bool(spec.get(CACHE_DIR) or spec.get(karma.KARMA_SLOWEST))
+
+    def _timings_path(self, config_fn):
+        return splitext(config_fn)[0] + '.timings.json'
+
+    def _apply_timing_config(self, spec, config):
+        config['plugins'] = list(config.get('plugins', ['karma-*'])) + [
+            timing.get_timing_reporter_path()]
+        config['reporters'] = list(config['reporters']) + [
+            timing.TIMING_REPORTER]
+        config[timing.TIMING_REPORTER_CONFIG] = {
+            'outputFile': self._timings_path(
+                join(spec[BUILD_DIR], self.karma_conf_js)),
+        }
+
+    def record_timings(self, spec):
+        """
+        Record the test durations reported by the timing reporter into
+        the timing store, which is kept in the cache directory if one is
+        specified, otherwise the build directory.
+        """
+
+        if not self._timing_enabled(spec) or self._karma_skipped(spec):
+            return
+
+        results = []
+        for config_fn in (spec.get(karma.KARMA_SHARD_CONFIG_PATHS) or [
+                join(spec[BUILD_DIR], self.karma_conf_js)]):
+            timings_fn = self._timings_path(config_fn)
+            if not exists(timings_fn):
+                logger.warning("no timings reported at '%s'", timings_fn)
+                continue
+            with open(timings_fn) as fd:
+                results.extend(json.load(fd))
+        spec[karma.KARMA_TIMINGS] = results
+
+        if not spec.get(CACHE_DIR):
+            logger.info(
+                "no cache directory specified; test durations are kept in "
+                "the build directory '%s'", spec[BUILD_DIR])
+        store_dir = spec.get(CACHE_DIR) or spec[BUILD_DIR]
+        store = timing.load_store(store_dir)
+        timing.update_timings(store, results, timing.map_suites_to_files(
+            spec.get(TEST_MODULE_PATHS_MAP, {}).values()))
+        timing.save_store(store_dir, store)
+
+        if spec.get(karma.KARMA_SLOWEST):
+            sys.stdout.write(timing.format_slowest(
+                store, spec[karma.KARMA_SLOWEST]) + '\n')
+            sys.stdout.flush()
+
+    def _impact_path(self, config_fn):
+        return splitext(config_fn)[0] + '.impact.json'
+
+    def _apply_impact_config(self, spec, config, test_module_paths):
+        if not spec.get(TEST_IMPACT_INDEX):
+            return
+        if not spec.get(COVERAGE_ENABLE):
+            logger.warning(
+                'the test impact index can only be recorded with coverage '
+                'enabled')
+            return
+        config['plugins'] = list(config.get('plugins', ['karma-*'])) + [
+            impact.get_impact_reporter_path()]
+        config['reporters'] = list(config['reporters']) + [
+            impact.IMPACT_REPORTER]
+        config[impact.IMPACT_REPORTER_CONFIG] = {
+            'outputFile': self._impact_path(
+                join(spec[BUILD_DIR], self.karma_conf_js)),
+        }
+        # the hooks must be loaded ahead of the test modules.
+        files = config['files']
+        idx = len(files) - len(test_module_paths)
+        config['files'] = files[:idx] + [
+            impact.get_impact_hooks_path()] + files[idx:]
+
+    def record_impact(self, spec):
+        """
+        Record the source modules executed by each of the test modules
+        that were run, as reported by the impact reporter, into the test
+        impact index kept in the cache directory.
+        """
+
+        if not (spec.get(TEST_IMPACT_INDEX) and spec.get(COVERAGE_ENABLE)):
+            return
+        if self._karma_skipped(spec):
+            return
+        if not spec.get(CACHE_DIR):
+            logger.warning(
+                'the test impact index requires a cache directory')
+            return
+
+        executed_paths = {}
+        for config_fn in (spec.get(karma.KARMA_SHARD_CONFIG_PATHS) or [
+                join(spec[BUILD_DIR], self.karma_conf_js)]):
+            impact_fn = self._impact_path(config_fn)
+            if not exists(impact_fn):
+                logger.warning("no test impact reported at '%s'", impact_fn)
+                continue
+            with open(impact_fn) as fd:
+                for title, paths in json.load(fd).items():
+                    executed_paths.setdefault(title, set()).update(
+                        realpath(path) for path in paths)
+
+        test_names = {
+            path: modname for modname, path in
+            spec.get(TEST_MODULE_PATHS_MAP, {}).items()
+        }
+        source_names = {}
+        for key in spec.get(karma.KARMA_SPEC_KEYS, []):
+            for modname, path in spec.get(key, {}).items():
+                source_names[realpath(join(spec[BUILD_DIR], path))] = modname
+
+        # every test module that was run is recorded, including those
+        # that executed none of the source modules.
+        files = spec.get(karma.KARMA_CONFIG, {}).get('files', [])
+        executed = {
+            test_names[f]: set() for f in files
+            if not isinstance(f, dict) and f in test_names
+        }
+        suite_files = timing.map_suites_to_files(test_names)
+        for title, paths in executed_paths.items():
+            modname = test_names.get(suite_files.get(title))
+            if modname in executed:
+                executed[modname].update(
+                    source_names[path] for path in paths
+                    if path in source_names)
+
+        index = impact.update_index(
+            impact.load_index(spec[CACHE_DIR]), executed)
+        impact.save_index(spec[CACHE_DIR], index)
+        logger.info(
+            'recorded the source modules executed by %d test modules into '
+            'the test impact index', len(executed))
+
+    def _dependent_test_modules(
+            self, spec, test_module_paths_map, source_map, changed_files):
+        """
+        Return the subset of test_module_paths_map that may be affected
+        by the changed source modules, for runs of more than one package,
+        which are the changed test modules and the test modules of the
+        packages that depend on the packages declaring them; the test
+        modules of the other packages need not be read for references.
+        """
+
+        package_test_modules = spec.get(karma.KARMA_PACKAGE_TEST_MODULES)
+        if not package_test_modules:
+            return test_module_paths_map
+        changed = set(realpath(path) for path in changed_files)
+        packages = get_resolver(spec).module_dependents(
+            sorted(package_test_modules),
+            spec.get(CALMJS_MODULE_REGISTRY_NAMES, []),
+            [
+                modname for modname, path in source_map.items()
+                if realpath(path) in changed
+            ],
+        )
+        if packages is None:
+            return test_module_paths_map
+        modnames = set()
+        for package_name in packages.intersection(package_test_modules):
+            modnames.update(package_test_modules[package_name])
+        result = {
+            modname: path for modname, path in test_module_paths_map.items()
+            if modname in modnames or realpath(path) in changed
+        }
+        logger.debug(
+            'test modules of packages %r may be affected by the changed '
+            'source modules', sorted(packages))
+        return result
+
+    def _select_test_modules(self, spec, test_module_paths_map):
+        changed_files = spec.get(TEST_CHANGED_FILES)
+        if changed_files is None:
+            return test_module_paths_map
+
+        source_map = {}
+        for key in spec.get(karma.KARMA_SOURCE_MAP_KEYS, []):
+            source_map.update(spec.get(key, {}))
+        index = {}
+        if spec.get(TEST_IMPACT_INDEX) and spec.get(CACHE_DIR):
+            index = impact.load_index(spec[CACHE_DIR])
+        if index:
+            logger.info('selecting test modules through the test impact index')
+            selected = impact.select_indexed_tests(
+                index, test_module_paths_map, source_map, changed_files)
+        else:
+            selected = impact.select_affected_tests(
+                self._dependent_test_modules(
+                    spec, test_module_paths_map, source_map, changed_files),
+                source_map, changed_files)
+        logger.info(
+            'selected %d of %d test modules affected by %d changed files',
+            len(selected), len(test_module_paths_map), len(changed_files),
+        )
+        return selected
 
     def _create_config(self, spec, spec_keys):
         package_names = self._pick_spec_keys(
@@ -252,27 +1004,247 @@ class KarmaDriver(NodeDriver):
         # calculate, extract and persist the test module names
         test_module_paths_map = spec[TEST_MODULE_PATHS_MAP] = spec.get(
             TEST_MODULE_PATHS_MAP, {})
-        test_module_paths_map.update(dist.get_module_registries_dependencies(
-            package_names, module_registries))
+        if len(package_names) > 1:
+            # keep track of the test modules of every package, such
+            # that the results may be attributed to them.
+            package_test_modules = self._get_package_test_modules(
+                spec, package_names, module_registries)
+            spec[karma.KARMA_PACKAGE_TEST_MODULES] = {
+                package_name: sorted(modules)
+                for package_name, modules in package_test_modules.items()
+            }
+            for modules in package_test_modules.values():
+                test_module_paths_map.update(modules)
+        else:
+            test_module_paths_map.update(
+                get_resolver(spec).module_registries_dependencies(
+                    package_names, module_registries))
 
         config = karma.build_base_config()
+        # report the timing of each test for the result collector.
+        config['specReporter'] = {'showSpecTiming': True}
+        if spec.get(karma.KARMA_PERSISTENT_SERVER):
+            config['singleRun'] = False
+            config['autoWatch'] = False
+        if self._timing_enabled(spec) and spec.get(BUILD_DIR):
+            self._apply_timing_config(spec, config)
         config['frameworks'].extend(spec.get(karma.KARMA_EXTRA_FRAMEWORKS, []))
 
         if spec.get(karma.KARMA_BROWSERS, []):
             config['browsers'] = spec.get(karma.KARMA_BROWSERS, [])
+        if spec.get(karma.KARMA_BROWSER_POOL) is not None:
+            self._apply_browser_pool_config(spec, config)
 
         files = list(utils.get_targets_from_spec(spec, spec_keys))
-        test_module_paths = sorted(test_module_paths_map.values())
+        selected = self._select_test_modules(spec, test_module_paths_map)
+        test_module_paths = sorted(selected.values())
 
         config['files'] = files + test_module_paths
         self._apply_coverage_config(spec, config, files, test_module_paths)
+        self._apply_impact_config(spec, config, test_module_paths)
         self._apply_wrap_tests(spec, config, test_module_paths)
+        self._apply_test_cache(spec, config, selected)
 
         return config
 
+    def _test_cache_key(self, spec, config, test_module_paths):
+        # the digest of the inputs shared by all the test modules, which
+        # are the artifacts, the other files and the rest of the config;
+        # the build directory is not included.
+        test_module_paths = set(test_module_paths)
+        build_dir = spec[BUILD_DIR]
+        shared = dict(config)
+        shared['files'] = [
+            f for f in config.get('files', [])
+            if isinstance(f, dict) or f not in test_module_paths
+        ]
+        shared['preprocessors'] = {
+            key: value for key, value in config.get(
+                'preprocessors', {}).items()
+            if key not in test_module_paths
+        }
+        file_digests = cache.files_digests(list(
+            spec.get(ARTIFACT_PATHS) or []) + [
+            join(build_dir, f) for f in shared['files']
+            if not isinstance(f, dict)
+        ])
+        return artifacts.run_key([], shared, file_digests, build_dir)
+
+    def _apply_test_cache(self, spec, config, selected):
+        """
+        Omit the test modules that have passed in a previous run with
+        identical inputs from the config, as recorded in the test cache.
+        """
+
+        if (spec.get(TEST_NO_CACHE) or not selected or not spec.get(
+                CACHE_DIR) or not spec.get(BUILD_DIR) or spec.get(
+                karma.KARMA_PERSISTENT_SERVER)):
+            return
+        if spec.get(COVERAGE_ENABLE):
+            logger.info(
+                'the test cache is not applied as coverage is enabled')
+            return
+
+        test_fingerprints = spec[karma.KARMA_TEST_FINGERPRINTS] = (
+            testcache.fingerprints(self._test_cache_key(
+                spec, config, selected.values()), selected))
+        cached = spec[karma.KARMA_TEST_CACHED] = testcache.select_cached(
+            testcache.load_cache(spec[CACHE_DIR]), test_fingerprints)
+        if not cached:
+            return
+        cached_paths = set(selected[modname] for modname in cached)
+        config['files'] = [
+            f for f in config['files']
+            if isinstance(f, dict) or f not in cached_paths
+        ]
+        for path in cached_paths:
+            config.get('preprocessors', {}).pop(path, None)
+        logger.info(
+            'skipping %d of %d test modules that have passed in a previous '
+            'run with identical inputs', len(cached), len(selected))
+
+    def _browser_pool(self, spec, timeout=60):
+        return pool.BrowserPool(
+            join(spec[CACHE_DIR], pool.BROWSER_POOL_CACHE),
+            size=spec[karma.KARMA_BROWSER_POOL],
+            recycle=spec.get(
+                karma.KARMA_BROWSER_POOL_RECYCLE) or pool.RECYCLE_DEFAULT,
+            binary=pool.find_browser_binary(),
+            timeout=timeout,
+        )
+
+    def _apply_browser_pool_config(self, spec, config):
+        if not spec.get(CACHE_DIR):
+            logger.warning('the browser pool requires a cache directory')
+            return
+        browser_pool = self._browser_pool(
+            spec, timeout=config.get('captureTimeout', 60000) / 1000.0)
+        if not spec[karma.KARMA_BROWSER_POOL]:
+            logger.info('stopping all pooled browsers')
+            browser_pool.stop()
+            return
+        # every shard gets its own browser where available.
+        endpoints = browser_pool.acquire(spec.get(karma.KARMA_SHARDS) or 1)
+        if not endpoints:
+            logger.warning(
+                'no pooled browsers available; karma will launch the '
+                'browsers')
+            return
+        spec[karma.KARMA_BROWSER_POOL_ENDPOINTS] = endpoints
+        config['plugins'] = list(config.get('plugins', ['karma-*'])) + [
+            pool.get_pool_launcher_path()]
+        config['browsers'] = [pool.POOL_LAUNCHER]
+        config[pool.POOL_LAUNCHER_CONFIG] = {'endpoint': endpoints[0]}
+
+    def _get_package_test_modules(
+            self, spec, package_names, module_registries):
+        return get_resolver(spec).module_registries_dependencies_by_package(
+            package_names, module_registries)
+
+    def _load_run_coverage(self, spec):
+        # the raw coverage report of the run, from the staging directory
+        # if written there, otherwise from the coverage report directory
+        # for the default coverage type.
+        paths = coverage.find_staged_coverage(
+            join(spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING))
+        if not paths and spec.get(
+                COVERAGE_TYPE, COVERAGE_TYPE_DEFAULT) == COVERAGE_TYPE_DEFAULT:
+            paths = [join(realpath(spec.get(
+                COVER_REPORT_DIR, COVER_REPORT_DIR_DEFAULT)),
+                coverage.COVERAGE_JSON)]
+        paths = [path for path in paths if exists(path)]
+        if not paths:
+            return None
+        return coverage.merge_coverage_files(paths)
+
+    def _package_coverage(self, spec, package_names):
+        """
+        Return the summary of the coverage of the source modules of each
+        of the packages, for the packages that have any.
+        """
+
+        if not spec.get(COVERAGE_ENABLE):
+            return {}
+        run_coverage = self._load_run_coverage(spec)
+        if run_coverage is None:
+            logger.debug('no coverage report found to attribute to packages')
+            return {}
+        targets = {}
+        for key in spec.get(karma.KARMA_SPEC_KEYS, []):
+            for modname, path in spec.get(key, {}).items():
+                targets[modname] = realpath(join(spec[BUILD_DIR], path))
+        run_coverage = {
+            realpath(path): file_coverage
+            for path, file_coverage in run_coverage.items()
+        }
+        package_modules = get_resolver(
+            spec).module_registries_dependencies_by_package(
+                package_names, spec.get(CALMJS_MODULE_REGISTRY_NAMES, []))
+        result = {}
+        for package_name, modules in package_modules.items():
+            paths = set(
+                targets[modname] for modname in modules if modname in targets)
+            if not paths:
+                continue
+            result[package_name] = coverage.summary({
+                path: run_coverage[path] for path in paths
+                if path in run_coverage
+            })
+        return result
+
+    def record_package_results(self, spec):
+        """
+        Attribute the results of the tests, along with the coverage of
+        the source modules, to each of the packages tested, for the runs
+        where more than one package was tested.
+        """
+
+        package_test_modules = spec.get(karma.KARMA_PACKAGE_TEST_MODULES)
+        if not package_test_modules or self._karma_skipped(spec):
+            return
+
+        test_module_paths_map = spec.get(TEST_MODULE_PATHS_MAP, {})
+        path_packages = {}
+        for package_name, modnames in package_test_modules.items():
+            for modname in modnames:
+                if modname in test_module_paths_map:
+                    path_packages[test_module_paths_map[modname]] = (
+                        package_name)
+        suite_files = timing.map_suites_to_files(path_packages)
+
+        results = {
+            package_name: {'success': 0, 'failed': 0, 'skipped': 0}
+            for package_name in package_test_modules
+        }
+        for test in spec.get(karma.KARMA_RESULTS, {}).get('tests', []):
+            package_name = path_packages.get(
+                suite_files.get((test.get('suite') or [None])[0]))
+            if package_name is not None:
+                results[package_name][test['status']] += 1
+
+        return_code = spec.get(karma.KARMA_RETURN_CODE)
+        for result in results.values():
+            result['return_code'] = 1 if result['failed'] else 0
+        if return_code and not any(r['failed'] for r in results.values()):
+            logger.warning(
+                'karma exited with return code %s, which cannot be '
+                'attributed to any of the packages tested', return_code)
+            for result in results.values():
+                result['return_code'] = return_code
+
+        for package_name, summary in self._package_coverage(
+                spec, list(package_test_modules)).items():
+            results[package_name]['coverage'] = {
+                key: list(value) for key, value in summary.items()}
+
+        spec[karma.KARMA_PACKAGE_RESULTS] = results
+        sys.stdout.write(karma.format_package_results(results) + '\n')
+        sys.stdout.flush()
+
     def create_config(self, spec):
         spec_keys = spec.get(karma.KARMA_SPEC_KEYS, [])
-        spec[karma.KARMA_CONFIG] = self._create_config(spec, spec_keys)
+        with phases.span(spec, 'create_config'):
+            spec[karma.KARMA_CONFIG] = self._create_config(spec, spec_keys)
 
     def _write_config(self, spec):
         # grab the config from the spec.
@@ -289,17 +1261,164 @@ class KarmaDriver(NodeDriver):
         for f in (spec.get(ARTIFACT_PATHS), karma_config.get('files')):
             if isinstance(f, (tuple, list)):
                 files.extend(f)
-        karma_config['files'] = files
+        # serve the cached instrumented copies in place of the sources.
+        instrumented = spec.get(karma.KARMA_INSTRUMENTED_PATHS, {})
+        karma_config['files'] = [
+            f if isinstance(f, dict) else instrumented.get(f, f)
+            for f in files
+        ]
 
-        s = self.dumps(karma_config)
-        build_dir = spec[BUILD_DIR]
-        config_fn = join(build_dir, self.karma_conf_js)
-        with open(config_fn, 'w') as fd:
-            fd.write(karma.KARMA_CONF_TEMPLATE % s)
+        # the config in the spec retains the test modules, as they are
+        # partitioned into the shards from there.
+        config = dict(karma_config)
+        self._apply_test_bundles(
+            spec, config, splitext(self.karma_conf_js)[0])
+        config_fn = join(spec[BUILD_DIR], self.karma_conf_js)
+        if not self._dump_config(spec, config, config_fn):
+            logger.debug("'%s' is unchanged; not rewriting", config_fn)
         return config_fn
 
+    def _dump_config(self, spec, config, config_fn):
+        """
+        Write the config to config_fn, unless it is unchanged; returns
+        True if written.  For the compact config, the files and the
+        preprocessors are compacted into glob patterns where possible
+        and streamed into a manifest that is loaded by the config.
+        """
+
+        if not spec.get(karma.KARMA_COMPACT_CONFIG):
+            return utils.write_if_changed(
+                config_fn, karma.KARMA_CONF_TEMPLATE % self.dumps(config))
+
+        config = dict(config)
+        files, preprocessors = compact_paths(
+            config.pop('files', []), config.pop('preprocessors', {}),
+            dirname(config_fn))
+        manifest_fn = splitext(config_fn)[0] + karma.KARMA_FILES_JSON_SUFFIX
+        digest = utils.stream_if_changed(
+            manifest_fn, karma.iter_files_manifest(files, preprocessors))
+        return utils.write_if_changed(
+            config_fn, karma.KARMA_CONF_COMPACT_TEMPLATE % {
+                'digest': digest,
+                'manifest': json.dumps('./' + basename(manifest_fn)),
+                'config': self.dumps(config),
+            })
+
     def write_config(self, spec):
-        spec[karma.KARMA_CONFIG_PATH] = self._write_config(spec)
+        with phases.span(spec, 'write_config'):
+            spec[karma.KARMA_CONFIG_PATH] = self._write_config(spec)
+        if spec[karma.KARMA_CONFIG_PATH] and spec.get(karma.KARMA_SHARDS):
+            with phases.span(spec, 'write_shard_configs'):
+                spec[karma.KARMA_SHARD_CONFIG_PATHS] = (
+                    self._write_shard_configs(spec))
+
+    def _shard_coverage_dir(self, spec):
+        return join(spec[BUILD_DIR], coverage.SHARD_COVERAGE_STAGING)
+
+    def _shard_coverage_reporter(self, spec, idx):
+        # each shard only writes the raw report, as the reports for the
+        # configured coverage type are produced from the merged reports
+        # once all shards complete.
+        return {
+            'dir': realpath(self._shard_coverage_dir(spec)),
+            'reporters': [{
+                'type': 'json',
+                'file': '%sshard%d.json' % (coverage.RAW_COVERAGE_PREFIX, idx),
+            }],
+        }
+
+    def _merge_shard_coverage(self, spec):
+        """
+        Merge the raw coverage reports written by the shards into the
+        coverage report directory, along with the raw coverage directory
+        if specified.
+        """
+
+        shard_dir = self._shard_coverage_dir(spec)
+        if not spec.get(COVERAGE_ENABLE) or not exists(shard_dir):
+            return
+        merged = coverage.merge_coverage_files(
+            coverage.find_coverage_files([shard_dir]))
+        shutil.rmtree(shard_dir)
+        cover_dir = realpath(spec.get(
+            COVER_REPORT_DIR, COVER_REPORT_DIR_DEFAULT))
+        logger.info(
+            "merging coverage reports from shards into '%s'", cover_dir)
+        reporters = self._coverage_reporters(spec)
+        coverage.write_reports(
+            merged, cover_dir, reporters,
+            IstanbulDriver.create() if 'html' in reporters else None)
+        if spec.get(COVER_RAW_DIR):
+            # stage it like the report written by a single karma run.
+            raw_staging = join(spec[BUILD_DIR], coverage.RAW_COVERAGE_STAGING)
+            if not exists(raw_staging):
+                os.makedirs(raw_staging)
+            raw_fn = join(raw_staging, coverage.RAW_COVERAGE_FILE)
+            with codecs.open(raw_fn, 'w', 'utf8') as fd:
+                coverage.write_json(merged, fd)
+
+    def _write_shard_configs(self, spec):
+        """
+        Partition the test modules of the karma config into the number
+        of shards specified, and write a config for each of them to the
+        build directory.  Return the list of paths written; an empty
+        list is returned if sharding is not applicable.
+        """
+
+        karma_config = spec[karma.KARMA_CONFIG]
+        files = karma_config.get('files', [])
+        test_module_paths = set(
+            spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+        base_files = [f for f in files if f not in test_module_paths]
+        shard_files = [f for f in files if f in test_module_paths]
+        durations = timing.file_durations(
+            timing.load_store(spec[CACHE_DIR])) if spec.get(CACHE_DIR) else {}
+        if durations:
+            logger.info('partitioning test modules by recorded durations')
+            shards = utils.partition_weighted(
+                shard_files, spec[karma.KARMA_SHARDS], durations)
+        else:
+            shards = utils.partition(shard_files, spec[karma.KARMA_SHARDS])
+        if len(shards) < 2:
+            logger.info('insufficient test modules for sharding')
+            return []
+        if exists(self._shard_coverage_dir(spec)):
+            shutil.rmtree(self._shard_coverage_dir(spec))
+
+        root, ext = splitext(self.karma_conf_js)
+        port = karma_config.get('port', 9876)
+        results = []
+        for idx, shard in enumerate(shards):
+            config = deepcopy(karma_config)
+            config['files'] = base_files + shard
+            config['port'] = port + idx
+            # shards are always executed as single runs.
+            config['singleRun'] = True
+            if 'coverageReporter' in config:
+                config['coverageReporter'] = self._shard_coverage_reporter(
+                    spec, idx)
+            config_fn = join(spec[BUILD_DIR], '%s.shard%d%s' % (
+                root, idx, ext))
+            self._apply_test_bundles(
+                spec, config, splitext(basename(config_fn))[0])
+            if timing.TIMING_REPORTER_CONFIG in config:
+                config[timing.TIMING_REPORTER_CONFIG] = {
+                    'outputFile': self._timings_path(config_fn)}
+            if pool.POOL_LAUNCHER_CONFIG in config:
+                endpoints = spec[karma.KARMA_BROWSER_POOL_ENDPOINTS]
+                config[pool.POOL_LAUNCHER_CONFIG] = {
+                    'endpoint': endpoints[idx % len(endpoints)]}
+            if impact.IMPACT_REPORTER_CONFIG in config:
+                config[impact.IMPACT_REPORTER_CONFIG] = {
+                    'outputFile': self._impact_path(config_fn)}
+            self._dump_config(spec, config, config_fn)
+            results.append(config_fn)
+
+        logger.info(
+            'partitioned %d test modules into %d shards',
+            sum(len(shard) for shard in shards), len(shards),
+        )
+        return results
 
     def test_spec(self, spec):
         spec.handle(BEFORE_TEST)
@@ -315,19 +1434,182 @@ class KarmaDriver(NodeDriver):
         if spec.get(COVERAGE_ENABLE):
             spec[GENERATE_SOURCE_MAP] = True
 
-        spec[karma.KARMA_SPEC_KEYS] = utils.get_toolchain_targets_keys(
-            toolchain, exclude_targets_from=())
+        # a list, as the config may be created more than once.
+        spec[karma.KARMA_SPEC_KEYS] = list(utils.get_toolchain_targets_keys(
+            toolchain, exclude_targets_from=()))
+        spec[karma.KARMA_SOURCE_MAP_KEYS] = (
+            utils.get_toolchain_source_map_keys(toolchain))
         karma_advice_group = spec.get(
             karma.KARMA_ADVICE_GROUP, self.testrunner_advice_name)
         spec.advise(karma_advice_group, self.test_spec, spec)
         spec.advise(BEFORE_TEST, self.create_config, spec)
         spec.advise(karma.BEFORE_KARMA, self.write_config, spec)
+        self._setup_result_advices(spec)
+
+    def _setup_result_advices(self, spec):
+        spec.advise(karma.AFTER_KARMA, self.record_artifacts_passed, spec)
+        spec.advise(karma.AFTER_KARMA, self.record_test_cache, spec)
+        spec.advise(karma.AFTER_KARMA, self.record_timings, spec)
+        spec.advise(karma.AFTER_KARMA, self.record_impact, spec)
+        spec.advise(karma.AFTER_KARMA, self.collect_raw_coverage, spec)
+        # the raw coverage report must be read before it gets collected.
+        spec.advise(karma.AFTER_KARMA, self.write_native_coverage, spec)
+        spec.advise(karma.AFTER_KARMA, self.record_package_results, spec)
 
         if spec.get(karma.KARMA_ABORT_ON_TEST_FAILURE):
             spec.advise(AFTER_TEST, self.abort_on_test_failure, spec)
         else:
             spec.advise(AFTER_TEST, self.warn_on_test_failure, spec)
 
+    def _build_inputs(self, toolchain, spec):
+        return cache.digest([
+            type(toolchain).__module__, type(toolchain).__name__,
+            cache.spec_digest(spec),
+        ])
+
+    def _build_paths(self, spec):
+        # the paths to the files that the build depends on or produced.
+        paths = set([spec.get(karma.KARMA_CONFIG_PATH)])
+        paths.update(spec.get(karma.KARMA_SHARD_CONFIG_PATHS) or [])
+        for f in spec.get(karma.KARMA_CONFIG, {}).get('files', []):
+            if isinstance(f, dict):
+                f = f.get('pattern')
+            if f and not any(c in f for c in '*?[{'):
+                paths.add(join(spec[BUILD_DIR], f))
+        for key in spec.get(karma.KARMA_SOURCE_MAP_KEYS, []):
+            paths.update(spec.get(key, {}).values())
+        paths.discard(None)
+        return sorted(paths)
+
+    def _build_stamps(self, spec):
+        # the parent directories of the test modules and the sources,
+        # such that files added to them since may be detected.
+        paths = set(spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+        for key in spec.get(karma.KARMA_SOURCE_MAP_KEYS, []):
+            paths.update(spec.get(key, {}).values())
+        return cache.path_stamps(paths)
+
+    def write_build_manifest(self, spec, inputs):
+        """
+        Record the inputs, the digests of the files involved, the
+        modification times of the directories containing the sources
+        and test modules, and the resulting keys of the spec for the
+        build into the build directory, such that it may be reused.
+        """
+
+        keys = [
+            karma.KARMA_CONFIG, karma.KARMA_CONFIG_PATH,
+            karma.KARMA_SHARD_CONFIG_PATHS, karma.KARMA_SOURCE_MAP_KEYS,
+            karma.KARMA_SPEC_KEYS, TEST_MODULE_PATHS_MAP,
+        ]
+        keys.extend(spec.get(karma.KARMA_SOURCE_MAP_KEYS, []))
+        keys.extend(spec.get(karma.KARMA_SPEC_KEYS, []))
+        cache.write_json(spec[BUILD_DIR], karma.KARMA_BUILD_JSON, {
+            'inputs': inputs,
+            'fingerprint': cache.working_set_fingerprint(),
+            'files': cache.files_digests(self._build_paths(spec)),
+            'stamps': self._build_stamps(spec),
+            'spec': {key: spec[key] for key in keys if key in spec},
+        })
+
+    def _load_build_manifest(self, spec, inputs):
+        manifest = cache.read_json(spec[BUILD_DIR], karma.KARMA_BUILD_JSON)
+        if not isinstance(manifest, dict):
+            logger.info('no previous build found for reuse')
+            return None
+        if manifest.get('inputs') != inputs:
+            logger.info('previous build was produced from different inputs')
+            return None
+        if manifest.get('fingerprint') != cache.working_set_fingerprint():
+            logger.info('installed distributions changed since previous build')
+            return None
+        files = manifest.get('files', {})
+        if cache.files_digests(files) != files:
+            logger.info('files changed since previous build')
+            return None
+        if not cache.check_stamps(manifest.get('stamps', {})):
+            logger.info('directories changed since previous build')
+            return None
+        return manifest
+
+    def reuse_build(self, spec, inputs):
+        """
+        Run the tests using the build recorded in the build directory of
+        the spec, if it was produced from the same inputs and none of
+        the files involved have changed since.  Return True if reused.
+        """
+
+        manifest = self._load_build_manifest(spec, inputs)
+        if manifest is None:
+            return False
+        logger.info("reusing previous build in '%s'", spec[BUILD_DIR])
+        spec.update(manifest['spec'])
+        self._setup_result_advices(spec)
+        self.test_spec(spec)
+        return True
+
+    def stop_recorded_server(self, spec):
+        """
+        Stop the persistent karma server recorded in the build directory
+        of the spec, if any.
+        """
+
+        if not spec.get(BUILD_DIR):
+            logger.error(
+                'stopping a persistent karma server requires the build '
+                'directory it was started with to be specified')
+            return
+        if not self._read_server_state(spec):
+            logger.info(
+                "no persistent karma server recorded in '%s'", spec[BUILD_DIR])
+            return
+        logger.info(
+            "stopping persistent karma server recorded in '%s'",
+            spec[BUILD_DIR])
+        self.stop_server(spec)
+
+    def prepare_run(self, toolchain, spec):
+        """
+        Validate the options in the spec for a run of the toolchain, and
+        carry out the actions that do not require the toolchain, such as
+        stopping a server or reusing the previous build.  Returns True
+        if the run was completed by those actions.
+        """
+
+        if spec.get(karma.KARMA_STOP_SERVER):
+            self.stop_recorded_server(spec)
+            return True
+
+        if spec.get(karma.KARMA_PERSISTENT_SERVER) and not spec.get(BUILD_DIR):
+            # the temporary build directory is removed once the toolchain
+            # completes, which would leave the server orphaned.
+            logger.warning(
+                'a persistent karma server requires a build directory to be '
+                'specified; karma will be started for a single run instead')
+            spec.pop(karma.KARMA_PERSISTENT_SERVER)
+
+        if spec.get(karma.KARMA_PERSISTENT_SERVER) and spec.get(
+                karma.KARMA_SHARDS):
+            logger.warning(
+                'shards are always executed as single runs; the persistent '
+                'karma server will not be used')
+            spec.pop(karma.KARMA_PERSISTENT_SERVER)
+
+        if spec.get(karma.KARMA_REUSE_BUILD):
+            if not spec.get(BUILD_DIR):
+                logger.warning(
+                    'reusing a build requires a build directory to be '
+                    'specified; continuing without reuse')
+            else:
+                inputs = self._build_inputs(toolchain, spec)
+                if self.reuse_build(spec, inputs):
+                    return True
+                spec.advise(
+                    karma.AFTER_KARMA, self.write_build_manifest, spec,
+                    inputs)
+
+        return False
+
     def run(self, toolchain, spec):
         """
         This is the test method invoked on a successful toolchain run.
@@ -335,5 +1617,64 @@ class KarmaDriver(NodeDriver):
         Will be invoked from a toolchain success
         """
 
-        self.setup_toolchain_spec(toolchain, spec)
-        toolchain(spec)
+        with phases.profile(spec):
+            with phases.span(spec, 'prepare_run'):
+                completed = self.prepare_run(toolchain, spec)
+            if completed:
+                return
+            self.setup_toolchain_spec(toolchain, spec)
+            with phases.span(spec, 'toolchain'):
+                toolchain(spec)
+
+
+class IstanbulDriver(NodeDriver):
+    """
+    The driver for the istanbul command line tool, for producing the
+    coverage reports from raw coverage data.
+    """
+
+    def __init__(self, binary='istanbul', *a, **kw):
+        super(IstanbulDriver, self).__init__(*a, **kw)
+        self.binary = binary
+
+    def report(self, root, report_dir, reporter):
+        """
+        Produce the report of the reporter type into the report_dir from
+        the raw coverage files found in root.  Returns True on success.
+        """
+
+        binary = self.which() or self.which_with_node_modules()
+        if binary is None:
+            logger.warning(
+                "istanbul not found; cannot produce %s report", reporter)
+            return False
+        return call([
+            binary, 'report', '--root', root, '--dir', report_dir, reporter,
+        ], **self._gen_call_kws()) == 0
+
+    def instrument(self, source, target, binary=None):
+        """
+        Write the instrumented copy of the source file to target, which
+        is only put in place once complete.  Returns True on success.
+        """
+
+        binary = binary or self.which() or self.which_with_node_modules()
+        if binary is None:
+            logger.warning(
+                "istanbul not found; cannot instrument '%s'", source)
+            return False
+        target_dir = dirname(target)
+        if not exists(target_dir):
+            os.makedirs(target_dir)
+        tmp = '%s.%d.tmp' % (target, os.getpid())
+        if call([
+                binary, 'instrument', '--output', tmp, source,
+                ], **self._gen_call_kws()) != 0 or not exists(tmp):
+            logger.warning("failed to instrument '%s'", source)
+            if exists(tmp):
+                os.remove(tmp)
+            return False
+        if exists(target):
+            os.remove(target)
+        os.rename(tmp, target)
+        return True
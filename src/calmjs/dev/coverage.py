@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the merging of the raw coverage reports, in the
+JSON format produced by istanbul, from multiple karma runs into a single
+report, along with the rendering of the reports in the various formats
+without going through istanbul.
+"""
+
+import codecs
+import json
+import logging
+import os
+import shutil
+import sys
+from os.path import commonprefix
+from os.path import dirname
+from os.path import exists
+from os.path import isdir
+from os.path import join
+from os.path import splitext
+from tempfile import mkdtemp
+from time import time
+from uuid import uuid4
+from xml.sax.saxutils import quoteattr
+
+from calmjs.dev import cache
+
+logger = logging.getLogger(__name__)
+
+# the prefix for the raw coverage report files.
+RAW_COVERAGE_PREFIX = 'coverage-'
+# the directory within the build directory that karma writes the raw
+# coverage report to, and the name of that report; these are kept
+# stable such that the generated configuration remains identical across
+# runs, with the report moved to a unique name once karma completes.
+RAW_COVERAGE_STAGING = 'coverage.raw'
+RAW_COVERAGE_FILE = 'coverage.json'
+# the directory within the build directory for the raw coverage reports
+# of the shards.
+SHARD_COVERAGE_STAGING = 'coverage.shards'
+
+# the directory within the cache directory for the instrumented copies
+# of the sources.
+INSTRUMENTED_CACHE = 'instrumented'
+
+# the names of the files written by the report types
+COVERAGE_JSON = 'coverage.json'
+COVERAGE_LCOV = 'coverage.lcov'
+COVERAGE_COBERTURA = 'cobertura-coverage.xml'
+
+
+def raw_coverage_filename():
+    """
+    Produce a unique filename for a raw coverage report, such that the
+    reports from separate runs will not overwrite each other.
+    """
+
+    return '%s%d-%d-%s.json' % (
+        RAW_COVERAGE_PREFIX, time() * 1000, os.getpid(), uuid4().hex[:8])
+
+
+def is_raw_coverage_filename(name):
+    return name.startswith(RAW_COVERAGE_PREFIX) and name.endswith('.json')
+
+
+def reporters_for_type(coverage_type):
+    """
+    Return the list of reporters for write_reports that correspond to
+    the coverage type as specified for the karma runtime.
+    """
+
+    return {
+        'default': ['html', 'lcov', 'json'],
+        'html': ['html'],
+        'lcov': ['html', 'lcov'],
+        'lcovonly': ['lcov'],
+    }.get(coverage_type, [coverage_type])
+
+
+def native_reporters_for_type(coverage_type):
+    """
+    Return the list of reporters for write_reports that correspond to
+    the coverage type for the native reports.  The html report is only
+    produced if explicitly requested, as it is the only one that must
+    be rendered through istanbul; it may be produced later from the
+    written json report using the merge command.
+    """
+
+    return {
+        'default': ['json', 'lcov', 'cobertura', 'text'],
+        'html': ['html'],
+        'lcov': ['html', 'lcov'],
+        'lcovonly': ['lcov'],
+    }.get(coverage_type, [coverage_type])
+
+
+def instrumented_path(cache_dir, path, instrumenter):
+    """
+    Return the path within the cache directory for the instrumented
+    copy of the source file at path.  As the path of the source is
+    embedded into its instrumented copy, the name is derived from both
+    the path and the digest of its contents, along with the identity of
+    the instrumenter.
+    """
+
+    key = cache.digest([path, cache.file_digest(path), instrumenter])
+    return join(cache_dir, INSTRUMENTED_CACHE, key + splitext(path)[1])
+
+
+def collect_raw_coverage(staging_dir, raw_dir):
+    """
+    Move the raw coverage reports written by karma into the staging_dir
+    to the raw_dir, each with a unique name.  Returns the list of paths
+    to the moved reports.
+    """
+
+    results = []
+    staged = find_staged_coverage(staging_dir)
+    if staged and not exists(raw_dir):
+        os.makedirs(raw_dir)
+    for path in staged:
+        target = join(raw_dir, raw_coverage_filename())
+        shutil.move(path, target)
+        results.append(target)
+    return results
+
+
+def find_staged_coverage(staging_dir):
+    """
+    Return the sorted list of the raw coverage reports written by karma
+    into the staging_dir, which are placed into a subdirectory for each
+    of the browsers.
+    """
+
+    results = []
+    for root, dirs, files in os.walk(staging_dir):
+        results.extend(
+            join(root, name) for name in files if name.endswith('.json'))
+    return sorted(results)
+
+
+def find_coverage_files(paths):
+    """
+    Return the sorted list of raw coverage reports from the provided
+    paths, with directories walked for the files named with the raw
+    coverage report prefix; merged reports are thus not included.
+    """
+
+    results = []
+    for path in paths:
+        if isdir(path):
+            for root, dirs, files in os.walk(path):
+                results.extend(
+                    join(root, name) for name in files
+                    if is_raw_coverage_filename(name))
+        elif exists(path):
+            results.append(path)
+        else:
+            logger.warning("coverage report '%s' does not exist", path)
+    return sorted(results)
+
+
+def _add_counts(target, source):
+    for key, count in source.items():
+        if isinstance(count, list):
+            existing = target.get(key) or [0] * len(count)
+            target[key] = [a + b for a, b in zip(existing, count)]
+        else:
+            target[key] = target.get(key, 0) + count
+
+
+def merge_file_coverage(target, source):
+    """
+    Merge the coverage of a single file from source into target.
+    """
+
+    for key in ('s', 'f', 'b'):
+        _add_counts(target.setdefault(key, {}), source.get(key, {}))
+    # the derived line coverage is recalculated when needed.
+    target.pop('l', None)
+    return target
+
+
+def merge_coverage(target, source):
+    """
+    Merge the coverage object source into target, both being mappings
+    of file paths to their coverage.
+    """
+
+    for path, file_coverage in source.items():
+        if path in target:
+            merge_file_coverage(target[path], file_coverage)
+        else:
+            target[path] = file_coverage
+    return target
+
+
+def merge_coverage_files(paths):
+    """
+    Merge the raw coverage reports at the provided paths; each of the
+    files is only loaded as it gets folded into the result.
+    """
+
+    result = {}
+    for path in paths:
+        logger.debug("merging coverage report '%s'", path)
+        try:
+            with codecs.open(path, encoding='utf8') as fd:
+                merge_coverage(result, json.load(fd))
+        except (IOError, OSError, ValueError) as e:
+            logger.warning(
+                "skipping invalid coverage report '%s': %s", path, e)
+    return result
+
+
+def line_coverage(file_coverage):
+    """
+    Derive the mapping of line numbers to their hit counts from the
+    statement coverage of a file.
+    """
+
+    lines = {}
+    statement_map = file_coverage.get('statementMap', {})
+    for key, count in file_coverage.get('s', {}).items():
+        statement = statement_map.get(key)
+        if not statement:
+            continue
+        line = statement['start']['line']
+        lines[line] = max(lines.get(line, 0), count)
+    return lines
+
+
+def file_summary(file_coverage):
+    """
+    Return the mapping of the metrics, being statements, branches,
+    functions and lines, to the (covered, total) counts for the
+    coverage of a file.
+    """
+
+    statements = list(file_coverage.get('s', {}).values())
+    functions = list(file_coverage.get('f', {}).values())
+    branches = [
+        count for counts in file_coverage.get('b', {}).values()
+        for count in counts
+    ]
+    lines = list(line_coverage(file_coverage).values())
+    return {
+        key: (sum(1 for count in counts if count), len(counts))
+        for key, counts in (
+            ('statements', statements), ('branches', branches),
+            ('functions', functions), ('lines', lines),
+        )
+    }
+
+
+def summary(coverage):
+    """
+    Return the summary of all the files in the coverage, in the same
+    form as file_summary.
+    """
+
+    result = {}
+    for file_coverage in coverage.values():
+        for key, (covered, total) in file_summary(file_coverage).items():
+            existing = result.get(key, (0, 0))
+            result[key] = (existing[0] + covered, existing[1] + total)
+    for key in ('statements', 'branches', 'functions', 'lines'):
+        result.setdefault(key, (0, 0))
+    return result
+
+
+def _rate(covered, total):
+    return float(covered) / total if total else 1.0
+
+
+def _pct(covered, total):
+    return '%g' % round(_rate(covered, total) * 100, 2)
+
+
+def write_json(coverage, fd):
+    json.dump(coverage, fd, sort_keys=True)
+
+
+def write_lcov(coverage, fd):
+    """
+    Write the coverage in the lcov tracefile format.
+    """
+
+    for path in sorted(coverage):
+        file_coverage = coverage[path]
+        fd.write('TN:\nSF:%s\n' % path)
+
+        fn_map = file_coverage.get('fnMap', {})
+        functions = file_coverage.get('f', {})
+        keys = sorted(fn_map, key=int)
+        for key in keys:
+            fd.write('FN:%d,%s\n' % (fn_map[key]['line'], fn_map[key]['name']))
+        for key in keys:
+            fd.write('FNDA:%d,%s\n' % (
+                functions.get(key, 0), fn_map[key]['name']))
+        fd.write('FNF:%d\nFNH:%d\n' % (
+            len(keys), sum(1 for key in keys if functions.get(key))))
+
+        lines = line_coverage(file_coverage)
+        for line in sorted(lines):
+            fd.write('DA:%d,%d\n' % (line, lines[line]))
+        fd.write('LF:%d\nLH:%d\n' % (
+            len(lines), sum(1 for count in lines.values() if count)))
+
+        branch_map = file_coverage.get('branchMap', {})
+        branches = file_coverage.get('b', {})
+        total = hit = 0
+        for key in sorted(branches, key=int):
+            meta = branch_map.get(key, {})
+            for idx, count in enumerate(branches[key]):
+                fd.write('BRDA:%s,%s,%d,%d\n' % (
+                    meta.get('line', 0), key, idx, count))
+                total += 1
+                hit += bool(count)
+        fd.write('BRF:%d\nBRH:%d\nend_of_record\n' % (total, hit))
+
+
+def write_cobertura(coverage, fd):
+    """
+    Write the coverage in the Cobertura xml format, with a package for
+    every directory.
+    """
+
+    paths = sorted(coverage)
+    root = dirname(commonprefix(paths)) if paths else ''
+    totals = summary(coverage)
+    lines_hit, lines_total = totals['lines']
+    branches_hit, branches_total = totals['branches']
+    fd.write(
+        '<?xml version="1.0" ?>\n'
+        '<!DOCTYPE coverage SYSTEM '
+        '"http://cobertura.sourceforge.net/xml/coverage-04.dtd">\n'
+        '<coverage lines-valid="%d" lines-covered="%d" line-rate="%.4f" '
+        'branches-valid="%d" branches-covered="%d" branch-rate="%.4f" '
+        'timestamp="%d" complexity="0" version="0.1">\n'
+        '<sources>\n<source>%s</source>\n</sources>\n<packages>\n' % (
+            lines_total, lines_hit, _rate(lines_hit, lines_total),
+            branches_total, branches_hit,
+            _rate(branches_hit, branches_total),
+            time() * 1000, quoteattr(root)[1:-1],
+        )
+    )
+
+    packages = {}
+    for path in paths:
+        packages.setdefault(dirname(path), []).append(path)
+
+    for package in sorted(packages):
+        package_coverage = {
+            path: coverage[path] for path in packages[package]}
+        totals = summary(package_coverage)
+        fd.write(
+            '<package name=%s line-rate="%.4f" branch-rate="%.4f" '
+            'complexity="0">\n<classes>\n' % (
+                quoteattr(package[len(root):].lstrip('/\\') or 'main'),
+                _rate(*totals['lines']), _rate(*totals['branches']),
+            )
+        )
+        for path in packages[package]:
+            _write_cobertura_class(path, root, coverage[path], fd)
+        fd.write('</classes>\n</package>\n')
+
+    fd.write('</packages>\n</coverage>\n')
+
+
+def _write_cobertura_class(path, root, file_coverage, fd):
+    totals = file_summary(file_coverage)
+    fd.write(
+        '<class name=%s filename=%s line-rate="%.4f" branch-rate="%.4f" '
+        'complexity="0">\n<methods>\n' % (
+            quoteattr(path[len(dirname(path)):].lstrip('/\\')),
+            quoteattr(path[len(root):].lstrip('/\\')),
+            _rate(*totals['lines']), _rate(*totals['branches']),
+        )
+    )
+
+    fn_map = file_coverage.get('fnMap', {})
+    functions = file_coverage.get('f', {})
+    for key in sorted(fn_map, key=int):
+        hits = functions.get(key, 0)
+        fd.write(
+            '<method name=%s hits="%d" signature="()V">\n<lines>'
+            '<line number="%d" hits="%d"/></lines>\n</method>\n' % (
+                quoteattr(fn_map[key]['name']), hits,
+                fn_map[key]['line'], hits,
+            )
+        )
+    fd.write('</methods>\n<lines>\n')
+
+    branch_lines = {}
+    branch_map = file_coverage.get('branchMap', {})
+    for key, counts in file_coverage.get('b', {}).items():
+        line = branch_map.get(key, {}).get('line')
+        if line is None:
+            continue
+        hit, total = branch_lines.get(line, (0, 0))
+        branch_lines[line] = (
+            hit + sum(1 for count in counts if count), total + len(counts))
+
+    lines = line_coverage(file_coverage)
+    for line in sorted(lines):
+        if line in branch_lines:
+            fd.write(
+                '<line number="%d" hits="%d" branch="true" '
+                'condition-coverage="%s%% (%d/%d)"/>\n' % ((
+                    line, lines[line], _pct(*branch_lines[line])) +
+                    branch_lines[line])
+            )
+        else:
+            fd.write('<line number="%d" hits="%d" branch="false"/>\n' % (
+                line, lines[line]))
+    fd.write('</lines>\n</class>\n')
+
+
+def write_text(coverage, fd):
+    """
+    Write the table of the coverage of every file, followed by the
+    totals for all files.
+    """
+
+    metrics = ('statements', 'branches', 'functions', 'lines')
+    rows = [
+        (path, file_summary(coverage[path])) for path in sorted(coverage)]
+    rows.append(('All files', summary(coverage)))
+    width = max(len(name) for name, totals in rows)
+    header = '%-*s | %% Stmts | %% Branch | %% Funcs | %% Lines' % (
+        width, 'File')
+    rule = '-' * len(header)
+    fd.write('%s\n%s\n%s\n' % (rule, header, rule))
+    for name, totals in rows:
+        fd.write('%-*s | %7s | %8s | %7s | %7s\n' % ((width, name) + tuple(
+            _pct(*totals[metric]) for metric in metrics)))
+    fd.write('%s\n' % rule)
+
+
+def write_text_summary(coverage, fd):
+    """
+    Write the totals for all files.
+    """
+
+    totals = summary(coverage)
+    fd.write('%s Coverage summary %s\n' % ('=' * 31, '=' * 31))
+    for label, metric in (
+            ('Statements', 'statements'), ('Branches', 'branches'),
+            ('Functions', 'functions'), ('Lines', 'lines')):
+        covered, total = totals[metric]
+        fd.write('%-12s : %s%% ( %d/%d )\n' % (
+            label, _pct(covered, total), covered, total))
+    fd.write('%s\n' % ('=' * 80))
+
+
+def write_html(coverage, report_dir, driver):
+    """
+    Produce the html report through the istanbul driver provided.
+    """
+
+    if driver is None:
+        logger.warning('no istanbul driver; cannot produce html report')
+        return False
+    root = mkdtemp()
+    try:
+        with codecs.open(join(root, COVERAGE_JSON), 'w', 'utf8') as fd:
+            write_json(coverage, fd)
+        return driver.report(root, join(report_dir, 'html'), 'html')
+    finally:
+        shutil.rmtree(root)
+
+
+def write_reports(
+        coverage, report_dir, reporters, driver=None, stream=None):
+    """
+    Write the merged coverage into the report directory using the
+    listed reporters, which may be any of json, lcov, cobertura, text,
+    text-summary and html; the istanbul driver is required for html.
+    The text reporters are written to the stream, which defaults to
+    sys.stdout.
+    """
+
+    if not exists(report_dir):
+        os.makedirs(report_dir)
+    writers = {
+        'json': (COVERAGE_JSON, write_json),
+        'lcov': (COVERAGE_LCOV, write_lcov),
+        'cobertura': (COVERAGE_COBERTURA, write_cobertura),
+    }
+    text_writers = {
+        'text': write_text,
+        'text-summary': write_text_summary,
+    }
+    for reporter in reporters:
+        if reporter == 'html':
+            write_html(coverage, report_dir, driver)
+        elif reporter in text_writers:
+            text_writers[reporter](coverage, stream or sys.stdout)
+        elif reporter in writers:
+            name, writer = writers[reporter]
+            target = join(report_dir, name)
+            with codecs.open(target, 'w', 'utf8') as fd:
+                writer(coverage, fd)
+            logger.info("wrote %s coverage report to '%s'", reporter, target)
+        else:
+            logger.warning("unsupported coverage reporter '%s'", reporter)
@@ -3,8 +3,54 @@
 Module that provides extra distribution functions
 """
 
-from calmjs.dist import get_module_registry_dependencies
+from itertools import chain
+
+from pkg_resources import safe_name
+from pkg_resources import working_set as default_working_set
+
+from calmjs.base import BaseModuleRegistry
 from calmjs.dist import TEST_REGISTRY_NAME_SUFFIX
+from calmjs.dist import find_packages_requirements_dists
+from calmjs.dist import flatten_module_registry_names
+from calmjs.registry import get
+from calmjs.registry import _inst as root_registry
+
+from calmjs.dev import cache
+from calmjs.dev import utils
+
+MODULE_REGISTRIES_CACHE = 'module_registries_dependencies.json'
+MODULE_REGISTRY_NAMES_CACHE = 'module_registry_names.json'
+
+
+def get_registries(registry_names, processes=None):
+    """
+    Return the registries identified by names, in the order provided.
+    The registries that have yet to be loaded, which involves the
+    resolution of their entry points and of the modules declared by
+    them, are loaded concurrently through a pool of threads.
+    """
+
+    registry_names = list(registry_names)
+    pending = sorted(set(
+        name for name in registry_names if name not in root_registry.records))
+    utils.thread_map(get, pending, processes)
+    return [get(name) for name in registry_names]
+
+
+def get_registries_records(pkg_names, registry_names, processes=None):
+    """
+    Return a list with an item for each of the registries identified by
+    names, in the order provided, holding the list of the records from
+    that registry for each of the packages, in the order provided.
+    """
+
+    pkg_names = list(pkg_names)
+    return [
+        [registry.get_records_for_package(pkg_name) for pkg_name in pkg_names]
+        if isinstance(registry, BaseModuleRegistry) else
+        [{} for pkg_name in pkg_names]
+        for registry in get_registries(registry_names, processes)
+    ]
 
 
 def get_module_registries_dependencies(
@@ -14,14 +60,85 @@ def get_module_registries_dependencies(
     resolve the targeted locations.
     """
 
+    # merged in the order of the registries then the packages, such
+    # that the later ones take precedence for the same module names.
     result = {}
-    for registry_name in registry_names:
-        result.update(
-            get_module_registry_dependencies(pkg_names, registry_name))
+    for records in get_registries_records(pkg_names, registry_names):
+        for package_records in records:
+            result.update(package_records)
 
     return result
 
 
+def get_cached_module_registries_dependencies(
+        pkg_names, registry_names, cache_dir, working_set=None):
+    """
+    As get_module_registries_dependencies, but with the result persisted
+    in cache_dir, keyed by the package and registry names.  The cached
+    result is invalidated when the distributions within the working set
+    or the directories holding the resolved modules are changed.
+    """
+
+    return cache.cached(
+        cache_dir, MODULE_REGISTRIES_CACHE,
+        ['registries', list(pkg_names), list(registry_names)],
+        lambda: get_module_registries_dependencies(
+            pkg_names, registry_names, working_set=working_set),
+        stamp_paths=lambda result: result.values(),
+        working_set=working_set,
+    )
+
+
+def get_module_registries_dependencies_by_package(
+        pkg_names, registry_names, working_set=None):
+    """
+    As get_module_registries_dependencies, but with the resolved
+    locations for each of the packages kept separately, keyed by the
+    name of the package.
+    """
+
+    pkg_names = list(pkg_names)
+    result = {pkg_name: {} for pkg_name in pkg_names}
+    for records in get_registries_records(pkg_names, registry_names):
+        for pkg_name, package_records in zip(pkg_names, records):
+            result[pkg_name].update(package_records)
+    return result
+
+
+def get_cached_module_registries_dependencies_by_package(
+        pkg_names, registry_names, cache_dir, working_set=None):
+    """
+    As get_module_registries_dependencies_by_package, but with the
+    result persisted in cache_dir like the result of
+    get_cached_module_registries_dependencies.
+    """
+
+    return cache.cached(
+        cache_dir, MODULE_REGISTRIES_CACHE,
+        ['packages', list(pkg_names), list(registry_names)],
+        lambda: get_module_registries_dependencies_by_package(
+            pkg_names, registry_names, working_set=working_set),
+        stamp_paths=lambda result: chain.from_iterable(
+            modules.values() for modules in result.values()),
+        working_set=working_set,
+    )
+
+
+def get_cached_flatten_module_registry_names(
+        pkg_names, cache_dir, working_set=None):
+    """
+    As calmjs.dist.flatten_module_registry_names, but with the result
+    persisted in cache_dir, keyed by the package names.
+    """
+
+    return cache.cached(
+        cache_dir, MODULE_REGISTRY_NAMES_CACHE, list(pkg_names),
+        lambda: flatten_module_registry_names(
+            pkg_names, working_set=working_set),
+        working_set=working_set,
+    )
+
+
 def map_registry_name_to_test(
         registry_names, test_registry_name_suffix=TEST_REGISTRY_NAME_SUFFIX):
     """
@@ -42,10 +159,191 @@ def get_module_default_test_registries_dependencies(
     test registries.
     """
 
-    result = {}
-    for registry_name in map_registry_name_to_test(
-            registry_names, test_registry_name_suffix):
-        result.update(get_module_registry_dependencies(
-            pkg_names, registry_name))
+    return get_module_registries_dependencies(
+        pkg_names, map_registry_name_to_test(
+            registry_names, test_registry_name_suffix),
+        working_set=working_set,
+    )
 
-    return result
+
+class Resolver(object):
+    """
+    The resolver of the graph of the packages and their dependencies,
+    along with the modules declared for them through the registries.
+    Every result is memoized for the lifetime of the instance, such that
+    the different phases of a run may query the same instance rather
+    than resolving everything again; if cache_dir is provided, the
+    results are also persisted there like the get_cached_* functions.
+    """
+
+    def __init__(self, working_set=None, cache_dir=None):
+        self.working_set = working_set or default_working_set
+        self.cache_dir = cache_dir
+        self._dists = {}
+        self._graphs = {}
+        self._reverse = {}
+        self._registry_names = {}
+        self._dependencies = {}
+        self._indexes = {}
+
+    def dists(self, pkg_names):
+        """
+        Return the distributions of the packages along with all their
+        dependencies, with the dependencies first.
+        """
+
+        key = tuple(pkg_names)
+        if key not in self._dists:
+            self._dists[key] = find_packages_requirements_dists(
+                list(key), working_set=self.working_set)
+        return self._dists[key]
+
+    def package_graph(self, pkg_names):
+        """
+        Return the mapping of the name of each of the packages and their
+        dependencies to the list of names of their direct dependencies;
+        the packages are named as provided, and their dependencies by
+        their project names.
+        """
+
+        key = tuple(pkg_names)
+        if key not in self._graphs:
+            dists = self.dists(key)
+            names = {dist.key: dist.project_name for dist in dists}
+            # the packages are named as provided.
+            names.update(
+                (safe_name(name).lower(), name) for name in key
+                if safe_name(name).lower() in names)
+            self._graphs[key] = {
+                names[dist.key]: sorted(set(
+                    names[req.key] for req in dist.requires()
+                    if req.key in names
+                ))
+                for dist in dists
+            }
+        return self._graphs[key]
+
+    def reverse_graph(self, pkg_names):
+        """
+        Return the mapping of the name of each of the packages and their
+        dependencies to the set of names of the packages that directly
+        depend on them.
+        """
+
+        key = tuple(pkg_names)
+        if key not in self._reverse:
+            reverse = {name: set() for name in self.package_graph(key)}
+            for name, requires in self.package_graph(key).items():
+                for required in requires:
+                    reverse[required].add(name)
+            self._reverse[key] = reverse
+        return self._reverse[key]
+
+    def dependents(self, pkg_names, targets):
+        """
+        Return the set of names of the packages, from pkg_names along
+        with their dependencies, that are or depend either directly or
+        indirectly on any of the packages named by targets.
+        """
+
+        reverse = self.reverse_graph(pkg_names)
+        keys = {safe_name(name).lower(): name for name in reverse}
+        result = set(
+            keys[safe_name(target).lower()] for target in targets
+            if safe_name(target).lower() in keys
+        )
+        pending = list(result)
+        while pending:
+            for name in reverse[pending.pop()]:
+                if name not in result:
+                    result.add(name)
+                    pending.append(name)
+        return result
+
+    def flatten_module_registry_names(self, pkg_names):
+        """
+        As calmjs.dist.flatten_module_registry_names.
+        """
+
+        key = tuple(pkg_names)
+        if key not in self._registry_names:
+            if self.cache_dir:
+                self._registry_names[key] = (
+                    get_cached_flatten_module_registry_names(
+                        key, self.cache_dir, working_set=self.working_set))
+            else:
+                self._registry_names[key] = flatten_module_registry_names(
+                    key, working_set=self.working_set)
+        return self._registry_names[key]
+
+    def module_registries_dependencies(self, pkg_names, registry_names):
+        """
+        As get_module_registries_dependencies.
+        """
+
+        key = ('registries', tuple(pkg_names), tuple(registry_names))
+        if key not in self._dependencies:
+            if self.cache_dir:
+                self._dependencies[key] = (
+                    get_cached_module_registries_dependencies(
+                        key[1], key[2], self.cache_dir, self.working_set))
+            else:
+                self._dependencies[key] = get_module_registries_dependencies(
+                    key[1], key[2], self.working_set)
+        return self._dependencies[key]
+
+    def module_registries_dependencies_by_package(
+            self, pkg_names, registry_names):
+        """
+        As get_module_registries_dependencies_by_package.
+        """
+
+        key = ('packages', tuple(pkg_names), tuple(registry_names))
+        if key not in self._dependencies:
+            if self.cache_dir:
+                self._dependencies[key] = (
+                    get_cached_module_registries_dependencies_by_package(
+                        key[1], key[2], self.cache_dir, self.working_set))
+            else:
+                self._dependencies[key] = (
+                    get_module_registries_dependencies_by_package(
+                        key[1], key[2], self.working_set))
+        return self._dependencies[key]
+
+    def module_index(self, pkg_names, registry_names):
+        """
+        Return the mapping of the name of each module declared through
+        the registries by the packages, or by their dependencies, to the
+        sorted list of names of the packages that declared them.
+        """
+
+        key = (tuple(pkg_names), tuple(registry_names))
+        if key not in self._indexes:
+            index = {}
+            for pkg_name, modules in (
+                    self.module_registries_dependencies_by_package(
+                        sorted(self.package_graph(key[0])), key[1]).items()):
+                for modname in modules:
+                    index.setdefault(modname, set()).add(pkg_name)
+            self._indexes[key] = {
+                modname: sorted(packages)
+                for modname, packages in index.items()
+            }
+        return self._indexes[key]
+
+    def module_dependents(self, pkg_names, registry_names, modnames):
+        """
+        Return the set of names of the packages, from pkg_names along
+        with their dependencies, that depend on any of the modules named
+        by modnames, which includes the packages that declared them.
+        None is returned if any one of the modules was not declared by
+        any of these packages.
+        """
+
+        index = self.module_index(pkg_names, registry_names)
+        owners = set()
+        for modname in modnames:
+            if modname not in index:
+                return None
+            owners.update(index[modname])
+        return self.dependents(pkg_names, owners)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the means to determine which test modules are
+affected by a given set of changed files, either through the references
+between the modules, or through an index of the source modules executed
+by each test module as recorded through coverage.
+"""
+
+import codecs
+import logging
+import re
+from os.path import isfile
+from os.path import realpath
+
+from pkg_resources import resource_filename
+
+from calmjs.dev import cache
+
+logger = logging.getLogger(__name__)
+
+IMPACT_REPORTER = 'calmjs-impact'
+IMPACT_REPORTER_CONFIG = 'calmjsImpactReporter'
+IMPACT_JSON = 'impact.json'
+
+_quoted_strings = re.compile(r'''['"]([^'"\s]+)['"]''')
+
+
+def get_impact_hooks_path():
+    """
+    Return the path to the bundled script that records the instrumented
+    files executed by the tests from within the browser.
+    """
+
+    return resource_filename('calmjs.dev', 'plugins/impact_hooks.js')
+
+
+def get_impact_reporter_path():
+    """
+    Return the path to the bundled karma impact reporter plugin.
+    """
+
+    return resource_filename('calmjs.dev', 'plugins/impact_reporter.js')
+
+
+def read_references(path, module_names):
+    """
+    Return the set of module names from module_names that are referenced
+    as string literals within the file at path.
+    """
+
+    if not module_names or not isfile(path):
+        return set()
+    with codecs.open(path, encoding='utf8', errors='replace') as fd:
+        return set(_quoted_strings.findall(fd.read())) & set(module_names)
+
+
+def build_reverse_index(modules):
+    """
+    For the mapping of module names to their paths, produce a mapping
+    from each module name to the set of module names that reference it.
+    """
+
+    names = set(modules)
+    result = {}
+    for modname, path in modules.items():
+        for referenced in read_references(path, names):
+            if referenced != modname:
+                result.setdefault(referenced, set()).add(modname)
+    return result
+
+
+def module_namespace(modname, tests_name='tests'):
+    """
+    Return the namespace of a module name; for test modules, which are
+    typically placed in a tests namespace, this will be the namespace of
+    the modules that they are testing.
+    """
+
+    parts = modname.split('/')[:-1]
+    if parts and parts[-1] == tests_name:
+        parts.pop()
+    return '/'.join(parts)
+
+
+def find_affected_modules(source_map, changed_files):
+    """
+    Return the set of module names from source_map that are affected by
+    the changed files, which include the modules that directly or
+    indirectly reference the changed modules.
+    """
+
+    changed = set(realpath(path) for path in changed_files)
+    affected = set(
+        modname for modname, path in source_map.items()
+        if realpath(path) in changed
+    )
+    reverse = build_reverse_index(source_map)
+    pending = list(affected)
+    while pending:
+        for modname in reverse.get(pending.pop(), ()):
+            if modname not in affected:
+                affected.add(modname)
+                pending.append(modname)
+    return affected
+
+
+def select_affected_tests(test_module_paths_map, source_map, changed_files):
+    """
+    Return the subset of test_module_paths_map that are affected by the
+    changed files.  A test module is affected if it was changed, if it
+    references an affected source module, or if it shares the namespace
+    of an affected source module.
+    """
+
+    changed = set(realpath(path) for path in changed_files)
+    affected = find_affected_modules(source_map, changed_files)
+    namespaces = set(module_namespace(modname) for modname in affected)
+    result = {}
+    for modname, path in test_module_paths_map.items():
+        if (realpath(path) in changed or
+                module_namespace(modname) in namespaces or
+                read_references(path, affected)):
+            result[modname] = path
+    logger.debug(
+        'changed files affected modules %r and test modules %r',
+        sorted(affected), sorted(result),
+    )
+    return result
+
+
+def decode_index(index):
+    """
+    Decode the compact form of the index, as persisted, into a mapping
+    of source module names to the set of test module names.
+    """
+
+    tests = index.get('tests', [])
+    return {
+        source: set(tests[idx] for idx in indexes)
+        for source, indexes in index.get('sources', {}).items()
+    }
+
+
+def encode_index(mapping, tests):
+    """
+    Encode the mapping of source module names to the sets of test module
+    names, along with the list of test module names that were recorded,
+    into the compact form where the test modules are referenced by their
+    position in the list of test modules.
+    """
+
+    tests = sorted(tests)
+    positions = {name: idx for idx, name in enumerate(tests)}
+    return {
+        'tests': tests,
+        'sources': {
+            source: sorted(positions[name] for name in names)
+            for source, names in mapping.items() if names
+        },
+    }
+
+
+def update_index(index, executed):
+    """
+    Update the index with the mapping of test module names to the set of
+    source module names that they executed; the previous entries for
+    those test modules are replaced.
+    """
+
+    mapping = decode_index(index)
+    for names in mapping.values():
+        names.difference_update(executed)
+    for test, sources in executed.items():
+        for source in sources:
+            mapping.setdefault(source, set()).add(test)
+    return encode_index(mapping, set(index.get('tests', [])) | set(executed))
+
+
+def load_index(cache_dir):
+    return cache.read_json(cache_dir, IMPACT_JSON, {})
+
+
+def save_index(cache_dir, index):
+    cache.write_json(cache_dir, IMPACT_JSON, index)
+
+
+def select_indexed_tests(
+        index, test_module_paths_map, source_map, changed_files):
+    """
+    Return the subset of test_module_paths_map that are affected by the
+    changed files according to the index.  A test module is affected if
+    it was changed, if it executed any of the changed source modules, or
+    if it has not been recorded into the index.
+    """
+
+    changed = set(realpath(path) for path in changed_files)
+    changed_sources = set(
+        modname for modname, path in source_map.items()
+        if realpath(path) in changed
+    )
+    mapping = decode_index(index)
+    covering = set()
+    for source in changed_sources:
+        covering.update(mapping.get(source, ()))
+    recorded = set(index.get('tests', []))
+    result = {
+        modname: path for modname, path in test_module_paths_map.items()
+        if (modname in covering or modname not in recorded or
+            realpath(path) in changed)
+    }
+    logger.debug(
+        'changed source modules %r are executed by test modules %r',
+        sorted(changed_sources), sorted(covering),
+    )
+    return result
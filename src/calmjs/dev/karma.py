@@ -3,17 +3,49 @@
 Module that provides integration with karma.
 """
 
+import json
+import re
+
 # spec keys
 AFTER_KARMA = 'after_karma'
 BEFORE_KARMA = 'before_karma'
 KARMA_ABORT_ON_TEST_FAILURE = 'karma_abort_on_test_failure'
 KARMA_ADVICE_GROUP = 'karma_advice_group'
+KARMA_ARTIFACT_MANIFEST = 'karma_artifact_manifest'
+KARMA_ARTIFACT_RUN_KEY = 'karma_artifact_run_key'
 KARMA_BROWSERS = 'karma_browsers'
+KARMA_BROWSER_POOL = 'karma_browser_pool'
+KARMA_BROWSER_POOL_ENDPOINTS = 'karma_browser_pool_endpoints'
+KARMA_BROWSER_POOL_RECYCLE = 'karma_browser_pool_recycle'
+KARMA_BUNDLE_TESTS = 'karma_bundle_tests'
+KARMA_COMPACT_CONFIG = 'karma_compact_config'
 KARMA_CONFIG = 'karma_config'
 KARMA_CONFIG_PATH = 'karma_config_path'
 KARMA_EXTRA_FRAMEWORKS = 'karma_extra_frameworks'
+KARMA_INSTRUMENTED_PATHS = 'karma_instrumented_paths'
+KARMA_PERSISTENT_SERVER = 'karma_persistent_server'
+KARMA_PACKAGE_RESULTS = 'karma_package_results'
+KARMA_PACKAGE_TEST_MODULES = 'karma_package_test_modules'
+KARMA_PHASE_RECORDER = 'karma_phase_recorder'
+KARMA_PROFILE = 'karma_profile'
+KARMA_PROFILE_STATS = 'karma_profile_stats'
+KARMA_PROFILE_TRACE = 'karma_profile_trace'
+KARMA_RESULTS = 'karma_results'
+KARMA_REUSE_BUILD = 'karma_reuse_build'
 KARMA_RETURN_CODE = 'karma_return_code'
+KARMA_SHARDS = 'karma_shards'
+KARMA_SKIP_UNCHANGED_ARTIFACTS = 'karma_skip_unchanged_artifacts'
+KARMA_SKIPPED = 'karma_skipped'
+KARMA_SLOWEST = 'karma_slowest'
+KARMA_SHARD_CONFIG_PATHS = 'karma_shard_config_paths'
+KARMA_SHARD_RETURN_CODES = 'karma_shard_return_codes'
+KARMA_SOURCE_MAP_KEYS = 'karma_source_map_keys'
 KARMA_SPEC_KEYS = 'karma_spec_keys'
+KARMA_STOP_SERVER = 'karma_stop_server'
+KARMA_TEST_CACHED = 'karma_test_cached'
+KARMA_TEST_FINGERPRINTS = 'karma_test_fingerprints'
+KARMA_TIMINGS = 'karma_timings'
+KARMA_WATCH = 'karma_watch'
 
 # templates
 
@@ -23,8 +55,29 @@ module.exports = function(config) {
 }
 '''
 
+# the config that loads the files and preprocessors from the manifest,
+# with its digest included such that the config changes along with it.
+KARMA_CONF_COMPACT_TEMPLATE = '''\
+// files and preprocessors from the manifest with sha256 digest
+// %(digest)s
+var manifest = require(%(manifest)s);
+var settings = %(config)s;
+settings.files = manifest.files;
+settings.preprocessors = manifest.preprocessors;
+
+module.exports = function(config) {
+    config.set(settings);
+}
+'''
+
 # other constants
 KARMA_CONF_JS = 'karma.conf.js'
+KARMA_FILES_JSON_SUFFIX = '.files.json'
+KARMA_BUILD_JSON = 'karma.build.json'
+KARMA_SERVER_JSON = 'karma.server.json'
+KARMA_SERVER_LOG = 'karma.server.log'
+# the line emitted by a karma server once a browser is captured.
+KARMA_SERVER_CAPTURED = 'Connected on socket'
 
 
 def build_base_config(
@@ -49,3 +102,112 @@ def build_base_config(
         'baseUrl', 'frameworks', 'reporters', 'port', 'colors', 'logLevel',
         'browsers', 'captureTimeout', 'singleRun',
     ]}
+
+
+_encode = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+
+
+def iter_files_manifest(files, preprocessors, batch=1000):
+    """
+    Generate the chunks of the compact JSON serialization of the files
+    and preprocessors for the manifest loaded by the compact config,
+    with every chunk holding up to batch number of entries.
+    """
+
+    # each batch is encoded as a whole, without the enclosing brackets.
+    yield '{"files":['
+    for idx in range(0, len(files), batch):
+        yield (',' if idx else '') + _encode(files[idx:idx + batch])[1:-1]
+    yield '],"preprocessors":{'
+    keys = sorted(preprocessors)
+    for idx in range(0, len(keys), batch):
+        yield (',' if idx else '') + _encode({
+            key: preprocessors[key] for key in keys[idx:idx + batch]})[1:-1]
+    yield '}}\n'
+
+
+# patterns for parsing the output produced by the spec and progress
+# reporters.
+_ansi_escape = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+_spec_result = re.compile(
+    u'^(?P<indent> *)(?P<prefix>\u2713|\u221a|\u2717|\u00d7|-) ' +
+    r'(?P<name>.*?)(?: \((?P<duration>\d+)ms\))?$'
+)
+_spec_status = {
+    u'\u2713': 'success',
+    u'\u221a': 'success',
+    u'\u2717': 'failed',
+    u'\u00d7': 'failed',
+    u'-': 'skipped',
+}
+_executed = re.compile(
+    r'Executed (?P<executed>\d+) of (?P<total>\d+)'
+    r'(?: \((?P<failed>\d+) FAILED\))?'
+    r'(?: \(skipped (?P<skipped>\d+)\))?'
+)
+
+
+class ResultCollector(object):
+    """
+    Collect the test results from the lines of output produced by karma
+    with the spec reporter enabled.
+    """
+
+    def __init__(self):
+        self.suites = []
+        self.tests = []
+        self.summary = {}
+
+    def feed(self, line):
+        # progress reporters will rewrite the line using carriage
+        # returns, only the final one will matter.
+        line = _ansi_escape.sub('', line).rstrip().split('\r')[-1]
+        executed = _executed.search(line)
+        if executed:
+            self.summary = {
+                k: int(v) for k, v in executed.groupdict(0).items()}
+            return
+
+        if not line.strip():
+            return
+
+        depth = (len(line) - len(line.lstrip(' '))) // 2
+        match = _spec_result.match(line)
+        if match:
+            duration = match.group('duration')
+            self.tests.append({
+                'suite': self.suites[:depth - 1],
+                'name': match.group('name'),
+                'status': _spec_status[match.group('prefix')],
+                'duration': int(duration) if duration else None,
+            })
+        elif depth and not line.lstrip().startswith(('FAILED', 'at ')):
+            # a suite heading for the spec reporter.
+            self.suites[depth - 1:] = [line.strip()]
+
+    @property
+    def results(self):
+        return {
+            'tests': list(self.tests),
+            'summary': dict(self.summary),
+        }
+
+
+def format_package_results(package_results):
+    """
+    Produce a report of the test results of each of the packages.
+    """
+
+    lines = ['results by package:']
+    for name in sorted(package_results):
+        result = package_results[name]
+        line = '  %s: %s, %d passed, %d failed, %d skipped' % (
+            name, 'FAILED' if result['return_code'] else 'ok',
+            result['success'], result['failed'], result['skipped'],
+        )
+        if 'coverage' in result:
+            covered, total = result['coverage']['statements']
+            line += ', %s%% statements covered' % (
+                '%g' % round(100.0 * covered / total, 2) if total else '100')
+        lines.append(line)
+    return '\n'.join(lines)
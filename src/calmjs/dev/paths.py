@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the classification of paths through sets of
+precompiled include and exclude rules, such that the paths selected for
+coverage and for the wrapping of the tests may be derived from a list
+of paths in a single pass, along with the compaction of lists of paths
+into glob patterns.
+"""
+
+import os
+import re
+from fnmatch import translate
+from os.path import isfile
+from os.path import join
+
+# the names of the classes of paths.
+COVER = 'cover'
+WRAP = 'wrap'
+
+# the sources that may be instrumented for coverage; the modules with
+# dunder names (e.g. __init__) are omitted.
+COVER_INCLUDE = ('*js',)
+COVER_EXCLUDE = (re.compile(r'__\w*__'),)
+# the template for the pattern of the test modules to be wrapped, for
+# the test filename prefix.
+WRAP_INCLUDE_TEMPLATE = r'%s[^\\\/]*js$'
+
+_pattern_type = type(re.compile(''))
+# the characters that are special to the glob patterns of karma.
+_glob_chars = re.compile(r'[*?\[\]{}()!+@\\]')
+
+
+def compile_rules(rules):
+    """
+    Compile the rules into a single callable that returns a true value
+    for the paths that match any one of them.  The rules are either
+    glob patterns as strings which must match the entire path, or
+    compiled regular expressions which may match anywhere in the path.
+    """
+
+    globs = [rule for rule in rules if not isinstance(rule, _pattern_type)]
+    regexes = [rule for rule in rules if isinstance(rule, _pattern_type)]
+    matchers = []
+    if globs:
+        matchers.append(re.compile(
+            '|'.join('(?:%s)' % translate(glob) for glob in globs)).match)
+    if regexes:
+        matchers.append(re.compile(
+            '|'.join('(?:%s)' % regex.pattern for regex in regexes)).search)
+
+    if not matchers:
+        return None
+    if len(matchers) == 1:
+        return matchers[0]
+    return lambda path: any(matcher(path) for matcher in matchers)
+
+
+class PathRules(object):
+    """
+    A set of include and exclude rules; a path is selected if it is
+    matched by any of the include rules, or if there are none, and by
+    none of the exclude rules.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = compile_rules(include)
+        self.exclude = compile_rules(exclude)
+
+    def __call__(self, path):
+        if self.include and not self.include(path):
+            return False
+        return not (self.exclude and self.exclude(path))
+
+
+class PathClassifier(object):
+    """
+    Classify paths by the named sets of rules.
+    """
+
+    def __init__(self, rules):
+        self.rules = sorted(rules.items())
+
+    def classify(self, paths):
+        """
+        Return a mapping of the name of each set of rules to the list
+        of the paths selected by them, in their original order.
+        """
+
+        result = {name: [] for name, rules in self.rules}
+        for path in paths:
+            for name, rules in self.rules:
+                if rules(path):
+                    result[name].append(path)
+        return result
+
+    def select(self, name, paths):
+        """
+        Return the list of the paths selected by the named rules.
+        """
+
+        rules = dict(self.rules)[name]
+        include, exclude = rules.include, rules.exclude
+        return [
+            path for path in paths
+            if (include is None or include(path)) and not (
+                exclude and exclude(path))
+        ]
+
+
+_classifiers = {}
+
+
+def get_classifier(test_filename_prefix, cover_exclude=()):
+    """
+    Return the classifier for the paths to cover and the test modules
+    to wrap, with the additional glob patterns for the paths that are to
+    be excluded from coverage.  The classifiers are compiled only once
+    for each combination of arguments.
+    """
+
+    key = (test_filename_prefix, tuple(cover_exclude))
+    if key not in _classifiers:
+        _classifiers[key] = PathClassifier({
+            COVER: PathRules(
+                include=COVER_INCLUDE,
+                exclude=COVER_EXCLUDE + tuple(cover_exclude),
+            ),
+            WRAP: PathRules(include=[
+                re.compile(WRAP_INCLUDE_TEMPLATE % test_filename_prefix)]),
+        })
+    return _classifiers[key]
+
+
+def _list_files(path, ext):
+    # the files with the extension in the directory, omitting the ones
+    # that are hidden as they are not matched by the glob patterns.
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return None
+    return set(
+        name for name in names
+        if name.endswith(ext) and not name.startswith('.') and
+        isfile(join(path, name))
+    )
+
+
+def compact_paths(files, preprocessors, base_dir):
+    """
+    Return the files and preprocessors for a karma config, with every
+    run of consecutive paths in files that are, in sorted order, all of
+    the files with the same extension in their directory replaced by a
+    glob pattern that matches them.  Their entries in preprocessors are
+    replaced likewise if they are all identical.  Relative paths are
+    resolved against base_dir.
+    """
+
+    runs = []
+    last = None
+    for f in files:
+        key = None
+        if not isinstance(f, dict) and not _glob_chars.search(f):
+            directory, sep, name = f.rpartition('/')
+            idx = name.rfind('.')
+            if idx > 0:
+                key = (directory + sep, name[idx:])
+        if key is not None and key == last:
+            runs[-1][1].append(f)
+        else:
+            runs.append((key, [f]))
+        last = key
+
+    preprocessors = dict(preprocessors)
+    result = []
+    for key, run in runs:
+        if key is None or len(run) < 2 or sorted(run) != run:
+            result.extend(run)
+            continue
+        directory, ext = key
+        names = _list_files(join(base_dir, directory or '.'), ext)
+        offset = len(directory)
+        if names is None or len(names) != len(run) or names != set(
+                f[offset:] for f in run):
+            result.extend(run)
+            continue
+        pattern = directory + '*' + ext
+        result.append(pattern)
+        values = [preprocessors.get(f) for f in run]
+        if all(value == values[0] for value in values):
+            for f in run:
+                preprocessors.pop(f, None)
+            if values[0] is not None:
+                preprocessors[pattern] = values[0]
+    return result, preprocessors
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the recording of the time spent in the phases of a
+test run, i.e. the advice groups handled for the spec, the toolchain
+steps between them and the steps of the driver, for reporting as a
+breakdown or as a trace for the Chrome trace viewer.
+"""
+
+import json
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from time import time
+
+from calmjs.dev import karma
+
+logger = logging.getLogger(__name__)
+
+BEFORE = 'before_'
+AFTER = 'after_'
+
+
+class PhaseRecorder(object):
+    """
+    Records the spans of time spent in the named phases, along with the
+    depth of their nesting.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._depth = 0
+        # the end time of the before advice group of each step, such
+        # that the step may be recorded as the span between that and
+        # the start of the after advice group.
+        self._step_starts = {}
+
+    def record(self, name, category, start, end):
+        self.spans.append({
+            'name': name,
+            'category': category,
+            'start': start,
+            'end': end,
+            'depth': self._depth,
+        })
+
+    @contextmanager
+    def span(self, name, category='driver'):
+        start = time()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.record(name, category, start, time())
+
+    def ordered(self):
+        return sorted(self.spans, key=lambda s: (s['start'], s['depth']))
+
+    def handle(self, handle, name):
+        if name.startswith(AFTER):
+            step = name[len(AFTER):]
+            if step in self._step_starts:
+                self.record(
+                    step, 'step', self._step_starts.pop(step), time())
+        with self.span(name, 'advice'):
+            handle(name)
+        if name.startswith(BEFORE):
+            self._step_starts[name[len(BEFORE):]] = time()
+
+    def instrument(self, spec):
+        """
+        Record the handling of every advice group for the spec.
+        """
+
+        handle = spec.handle
+
+        def instrumented_handle(name):
+            self.handle(handle, name)
+
+        spec.handle = instrumented_handle
+
+    def format_breakdown(self):
+        """
+        Produce the breakdown of the recorded phases, in the order they
+        were started, with the nested phases indented.
+        """
+
+        lines = ['time spent in phases:']
+        for span in self.ordered():
+            lines.append('  %9.3fs %s%s' % (
+                span['end'] - span['start'], '  ' * span['depth'],
+                span['name'] if span['category'] != 'step' else
+                '(%s)' % span['name'],
+            ))
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """
+        Return the recorded phases as complete events of the Chrome
+        trace event format.
+        """
+
+        pid = os.getpid()
+        return {
+            'traceEvents': [{
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': int(span['start'] * 1000000),
+                'dur': int((span['end'] - span['start']) * 1000000),
+                'pid': pid,
+                'tid': 0,
+            } for span in self.ordered()],
+            'displayTimeUnit': 'ms',
+        }
+
+    def write_trace(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.trace_events(), fd)
+
+
+def profile_enabled(spec):
+    return any(spec.get(key) for key in (
+        karma.KARMA_PROFILE, karma.KARMA_PROFILE_STATS,
+        karma.KARMA_PROFILE_TRACE,
+    ))
+
+
+def get_recorder(spec):
+    """
+    Return the phase recorder for the spec, created if profiling is
+    enabled for the spec; None otherwise.
+    """
+
+    recorder = spec.get(karma.KARMA_PHASE_RECORDER)
+    if recorder is None and profile_enabled(spec):
+        recorder = spec[karma.KARMA_PHASE_RECORDER] = PhaseRecorder()
+    return recorder
+
+
+@contextmanager
+def span(spec, name, category='driver'):
+    """
+    Record the time spent within as the named phase, if profiling is
+    enabled for the spec.
+    """
+
+    recorder = spec.get(karma.KARMA_PHASE_RECORDER)
+    if recorder is None:
+        yield
+        return
+    with recorder.span(name, category):
+        yield
+
+
+@contextmanager
+def profile(spec, name='run'):
+    """
+    Profile the execution within for the spec, if enabled.  The advice
+    groups handled for the spec are recorded, and the breakdown of the
+    recorded phases is written out at the end, along with the trace and
+    the statistics from cProfile if their paths were specified.
+    """
+
+    recorder = get_recorder(spec)
+    if recorder is None:
+        yield
+        return
+
+    profiler = None
+    if spec.get(karma.KARMA_PROFILE_STATS):
+        import cProfile
+        profiler = cProfile.Profile()
+
+    recorder.instrument(spec)
+    try:
+        with recorder.span(name):
+            if profiler:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler:
+                    profiler.disable()
+    finally:
+        sys.stdout.write(recorder.format_breakdown() + '\n')
+        if profiler:
+            profiler.dump_stats(spec[karma.KARMA_PROFILE_STATS])
+            logger.info(
+                "wrote profiler statistics to '%s'",
+                spec[karma.KARMA_PROFILE_STATS])
+        if spec.get(karma.KARMA_PROFILE_TRACE):
+            recorder.write_trace(spec[karma.KARMA_PROFILE_TRACE])
+            logger.info(
+                "wrote trace of phases to '%s'",
+                spec[karma.KARMA_PROFILE_TRACE])
@@ -0,0 +1,66 @@
+'use strict';
+
+/*
+ * Loaded into the browser ahead of the test modules, this records the
+ * instrumented files executed by every test, grouped by the top level
+ * suite of the test.  The result is attached to the results reported
+ * on completion as `calmjsImpact`, for the calmjs-impact reporter.
+ */
+
+(function(global) {
+    var touched = {};
+    var before = {};
+
+    var counts = function() {
+        var coverage = global.__coverage__ || {};
+        var result = {};
+        Object.keys(coverage).forEach(function(path) {
+            var statements = coverage[path].s || {};
+            var total = 0;
+            Object.keys(statements).forEach(function(key) {
+                total += statements[key];
+            });
+            result[path] = total;
+        });
+        return result;
+    };
+
+    var topSuite = function(test) {
+        var suite = test.parent;
+        if (!suite || suite.root) {
+            return null;
+        }
+        while (suite.parent && !suite.parent.root) {
+            suite = suite.parent;
+        }
+        return suite.title;
+    };
+
+    beforeEach(function() {
+        before = counts();
+    });
+
+    afterEach(function() {
+        var title = topSuite(this.currentTest);
+        if (title === null) {
+            return;
+        }
+        var after = counts();
+        var paths = touched[title] = touched[title] || {};
+        Object.keys(after).forEach(function(path) {
+            if (after[path] !== (before[path] || 0)) {
+                paths[path] = true;
+            }
+        });
+    });
+
+    var complete = global.__karma__.complete;
+    global.__karma__.complete = function(result) {
+        result = result || {};
+        result.calmjsImpact = {};
+        Object.keys(touched).forEach(function(title) {
+            result.calmjsImpact[title] = Object.keys(touched[title]);
+        });
+        return complete.call(this, result);
+    };
+}(this));
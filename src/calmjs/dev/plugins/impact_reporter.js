@@ -0,0 +1,47 @@
+'use strict';
+
+/*
+ * A karma reporter that records the instrumented files executed by the
+ * tests of every top level suite, as reported by the impact hooks, into
+ * the JSON file specified by the `outputFile` of the
+ * `calmjsImpactReporter` configuration.
+ */
+
+var fs = require('fs');
+
+var ImpactReporter = function(baseReporterDecorator, config) {
+    var options = config.calmjsImpactReporter || {};
+    var results = {};
+
+    baseReporterDecorator(this);
+    // this reporter produces no console output.
+    this.adapters = [];
+
+    this.onRunStart = function() {
+        results = {};
+    };
+
+    this.onBrowserComplete = function(browser, result) {
+        var impact = (result && result.calmjsImpact) || {};
+        Object.keys(impact).forEach(function(title) {
+            var paths = results[title] = results[title] || [];
+            impact[title].forEach(function(path) {
+                if (paths.indexOf(path) < 0) {
+                    paths.push(path);
+                }
+            });
+        });
+    };
+
+    this.onRunComplete = function() {
+        if (options.outputFile) {
+            fs.writeFileSync(options.outputFile, JSON.stringify(results));
+        }
+    };
+};
+
+ImpactReporter.$inject = ['baseReporterDecorator', 'config'];
+
+module.exports = {
+    'reporter:calmjs-impact': ['type', ImpactReporter]
+};
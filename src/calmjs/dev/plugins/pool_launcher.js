@@ -0,0 +1,79 @@
+'use strict';
+
+/*
+ * A karma launcher that opens the karma client in a new tab of a
+ * browser already running with remote debugging enabled, at the
+ * `endpoint` specified by the `calmjsBrowserPool` configuration, rather
+ * than launching a new browser.  The tab is closed once karma is done.
+ */
+
+var http = require('http');
+var url = require('url');
+
+var request = function(target, method, callback) {
+    var options = url.parse(target);
+    options.method = method;
+    var req = http.request(options, function(res) {
+        var body = '';
+        res.setEncoding('utf8');
+        res.on('data', function(chunk) {
+            body += chunk;
+        });
+        res.on('end', function() {
+            callback(null, body);
+        });
+    });
+    req.on('error', callback);
+    req.end();
+};
+
+var PoolBrowser = function(baseBrowserDecorator, config, logger) {
+    var options = config.calmjsBrowserPool || {};
+    var log = logger.create('launcher.calmjs-pool');
+    var self = this;
+    var targetId = null;
+
+    baseBrowserDecorator(this);
+
+    this.name = 'CalmjsPool';
+
+    // the browser is already running, so no process is spawned.
+    this._start = function(clientUrl) {
+        var target = options.endpoint + '/json/new?' + clientUrl;
+        request(target, 'PUT', function(error, body) {
+            if (error) {
+                log.error('cannot reach pooled browser at %s: %s',
+                    options.endpoint, error);
+                return;
+            }
+            try {
+                targetId = JSON.parse(body).id;
+            } catch (e) {
+                log.error('unexpected response from pooled browser: %s',
+                    body);
+            }
+        });
+    };
+
+    this.on('kill', function(done) {
+        if (!targetId) {
+            return process.nextTick(done);
+        }
+        var target = options.endpoint + '/json/close/' + targetId;
+        targetId = null;
+        request(target, 'GET', function() {
+            done();
+        });
+    });
+};
+
+PoolBrowser.prototype = {
+    name: 'CalmjsPool',
+    DEFAULT_CMD: {}
+};
+
+PoolBrowser.$inject = ['baseBrowserDecorator', 'config', 'logger'];
+
+module.exports = {
+    'launcher:CalmjsPool': ['type', PoolBrowser]
+};
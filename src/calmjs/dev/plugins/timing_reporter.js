@@ -0,0 +1,47 @@
+'use strict';
+
+/*
+ * A karma reporter that records the result and duration of every test
+ * into the JSON file specified by the `outputFile` of the
+ * `calmjsTimingReporter` configuration.
+ */
+
+var fs = require('fs');
+
+var TimingReporter = function(baseReporterDecorator, config) {
+    var options = config.calmjsTimingReporter || {};
+    var results = [];
+
+    baseReporterDecorator(this);
+    // this reporter produces no console output.
+    this.adapters = [];
+
+    this.onRunStart = function() {
+        results = [];
+    };
+
+    this.onSpecComplete = function(browser, result) {
+        results.push({
+            'browser': browser.name,
+            'suite': result.suite,
+            'name': result.description,
+            'duration': result.time,
+            'status': (
+                result.skipped ? 'skipped' :
+                result.success ? 'success' : 'failed'
+            )
+        });
+    };
+
+    this.onRunComplete = function() {
+        if (options.outputFile) {
+            fs.writeFileSync(options.outputFile, JSON.stringify(results));
+        }
+    };
+};
+
+TimingReporter.$inject = ['baseReporterDecorator', 'config'];
+
+module.exports = {
+    'reporter:calmjs-timing': ['type', TimingReporter]
+};
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides a pool of pre-launched headless browsers, which
+the karma runs attach to through the bundled launcher plugin rather
+than launching a new browser every run.
+
+The browsers are controlled through the remote debugging protocol of
+Chrome; the launcher opens the karma client in a new tab of a pooled
+browser, and closes the tab once karma is done with it.  The state of
+the pool is kept in a directory such that the browsers may be reused
+across invocations.
+"""
+
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+from os.path import exists
+from os.path import join
+from shutil import rmtree
+from subprocess import Popen
+from subprocess import STDOUT
+from time import sleep
+from time import time
+
+from pkg_resources import resource_filename
+
+from calmjs.base import which
+
+from calmjs.dev import cache
+
+try:  # pragma: no cover
+    from urllib.request import urlopen
+except ImportError:  # pragma: no cover
+    from urllib2 import urlopen
+
+logger = logging.getLogger(__name__)
+
+POOL_LAUNCHER = 'CalmjsPool'
+POOL_LAUNCHER_CONFIG = 'calmjsBrowserPool'
+POOL_JSON = 'pool.json'
+# the directory within the cache directory for the pool.
+BROWSER_POOL_CACHE = 'browser-pool'
+# the default number of runs a browser is used for before recycling.
+RECYCLE_DEFAULT = 50
+
+# the browser binaries tried in order, after the CHROME_BIN environment
+# variable as used by karma-chrome-launcher.
+BROWSER_BINARIES = (
+    'chromium', 'chromium-browser', 'google-chrome', 'google-chrome-stable',
+)
+
+
+def get_pool_launcher_path():
+    """
+    Return the path to the bundled karma launcher plugin for the pooled
+    browsers.
+    """
+
+    return resource_filename('calmjs.dev', 'plugins/pool_launcher.js')
+
+
+def find_browser_binary():
+    """
+    Return the path to the headless capable browser to launch for the
+    pool, or None if not found.
+    """
+
+    if os.environ.get('CHROME_BIN'):
+        return which(os.environ['CHROME_BIN'])
+    for name in BROWSER_BINARIES:
+        binary = which(name)
+        if binary:
+            return binary
+    return None
+
+
+def free_port():
+    """
+    Return a port that is currently not in use.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def endpoint(port):
+    return 'http://127.0.0.1:%d' % port
+
+
+def check_browser(port, timeout=1):
+    """
+    Return True if the browser listening on the remote debugging port
+    responds to the version request of the protocol.
+    """
+
+    try:
+        fd = urlopen(endpoint(port) + '/json/version', timeout=timeout)
+        try:
+            json.loads(fd.read().decode('utf8'))
+        finally:
+            fd.close()
+    except (IOError, OSError, ValueError, socket.error):
+        return False
+    return True
+
+
+def check_pid(pid):
+    """
+    Return True if a process with the pid exists.
+    """
+
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class BrowserPool(object):
+    """
+    A pool of headless browsers, with its state kept in pool_dir.
+    Each of the browsers will be recycled once it was used for the
+    number of runs specified by recycle.
+    """
+
+    def __init__(
+            self, pool_dir, size=1, recycle=RECYCLE_DEFAULT, binary=None,
+            timeout=30):
+        self.pool_dir = pool_dir
+        self.size = size
+        self.recycle = recycle
+        self.binary = binary
+        self.timeout = timeout
+
+    def load(self):
+        browsers = cache.read_json(self.pool_dir, POOL_JSON, [])
+        return browsers if isinstance(browsers, list) else []
+
+    def save(self, browsers):
+        cache.write_json(self.pool_dir, POOL_JSON, browsers)
+
+    def launch(self):
+        """
+        Launch a new browser for the pool, and return its entry.
+        """
+
+        if not exists(self.pool_dir):
+            os.makedirs(self.pool_dir)
+        port = free_port()
+        profile_dir = join(self.pool_dir, 'profile-%d' % port)
+        log_fn = join(self.pool_dir, 'browser-%d.log' % port)
+        logger.info("launching pooled browser '%s' on port %d", (
+            self.binary), port)
+        with open(log_fn, 'wb') as log_fd:
+            proc = Popen([
+                self.binary, '--headless', '--disable-gpu',
+                '--no-first-run', '--no-default-browser-check',
+                '--remote-debugging-port=%d' % port,
+                '--user-data-dir=%s' % profile_dir,
+                'about:blank',
+            ], stdout=log_fd, stderr=STDOUT)
+        return {'pid': proc.pid, 'port': port, 'runs': 0}
+
+    def terminate(self, browser):
+        logger.info(
+            'stopping pooled browser on port %d after %d runs',
+            browser['port'], browser['runs'])
+        try:
+            os.kill(browser['pid'], signal.SIGTERM)
+        except OSError:
+            logger.debug('pooled browser pid %s already gone', browser['pid'])
+        profile_dir = join(self.pool_dir, 'profile-%d' % browser['port'])
+        if exists(profile_dir):
+            rmtree(profile_dir, ignore_errors=True)
+
+    def healthy(self, browser):
+        return check_pid(browser['pid']) and check_browser(browser['port'])
+
+    def _wait(self, browsers):
+        deadline = time() + self.timeout
+        pending = list(browsers)
+        while pending and time() < deadline:
+            pending = [
+                browser for browser in pending
+                if not check_browser(browser['port'])]
+            if pending:
+                sleep(0.1)
+        for browser in pending:
+            logger.warning(
+                'pooled browser on port %d failed to respond within %s '
+                'seconds', browser['port'], self.timeout)
+            self.terminate(browser)
+        return [browser for browser in browsers if browser not in pending]
+
+    def ensure(self):
+        """
+        Ensure that the pool has the specified number of healthy
+        browsers, with the unhealthy ones and the ones due for recycling
+        replaced; returns the list of entries for the browsers.
+        """
+
+        browsers = []
+        for browser in self.load():
+            if not self.healthy(browser):
+                logger.info(
+                    'pooled browser on port %d failed health check',
+                    browser['port'])
+                self.terminate(browser)
+            elif browser['runs'] >= self.recycle:
+                self.terminate(browser)
+            else:
+                browsers.append(browser)
+
+        for browser in browsers[self.size:]:
+            self.terminate(browser)
+        browsers = browsers[:self.size]
+
+        if len(browsers) < self.size:
+            if not self.binary:
+                logger.warning(
+                    'no browser binary available for the browser pool; set '
+                    'the CHROME_BIN environment variable')
+            else:
+                browsers.extend(self._wait([
+                    self.launch() for i in range(self.size - len(browsers))
+                ]))
+        self.save(browsers)
+        return browsers
+
+    def acquire(self, count=1):
+        """
+        Return the endpoints of up to count browsers from the pool, the
+        least used first, with their use recorded.
+        """
+
+        browsers = self.ensure()
+        selected = sorted(browsers, key=lambda b: b['runs'])[:count]
+        for browser in selected:
+            browser['runs'] += 1
+        self.save(browsers)
+        return [endpoint(browser['port']) for browser in selected]
+
+    def stop(self):
+        """
+        Stop all the browsers in the pool.
+        """
+
+        for browser in self.load():
+            self.terminate(browser)
+        self.save([])
@@ -6,60 +6,151 @@ select the resulting spec targets for usage
 """
 
 import logging
+import os
+import shlex
 from itertools import chain
-from os.path import exists
+from subprocess import CalledProcessError
+from os.path import join
 from os.path import pathsep
-from os.path import realpath
 from argparse import SUPPRESS
+from time import time
 
 from calmjs.argparse import StoreDelimitedList
 from calmjs.argparse import StorePathSepDelimitedList
 from calmjs.argparse import StoreRequirementList
 from calmjs.toolchain import ADVICE_PACKAGES
 from calmjs.toolchain import ARTIFACT_PATHS
+from calmjs.toolchain import BUILD_DIR
 from calmjs.toolchain import CALMJS_TEST_REGISTRY_NAMES
 from calmjs.toolchain import TEST_PACKAGE_NAMES
+from calmjs.runtime import BaseRuntime
 from calmjs.runtime import ToolchainRuntime
 from calmjs.runtime import DriverRuntime
 from calmjs.runtime import Runtime
 
+from calmjs.dev import artifacts
+from calmjs.dev import cache
+from calmjs.dev import coverage
+from calmjs.dev import phases
+from calmjs.dev import pool
+from calmjs.dev import utils
+from calmjs.dev import watch
+from calmjs.dev.cli import IstanbulDriver
 from calmjs.dev.cli import KarmaDriver
 from calmjs.dev.toolchain import KarmaToolchain
+from calmjs.dev.toolchain import CACHE_DIR
 from calmjs.dev.toolchain import COVERAGE_ENABLE
 from calmjs.dev.toolchain import COVERAGE_TYPE
 from calmjs.dev.toolchain import COVERAGE_TYPE_DEFAULT
+from calmjs.dev.toolchain import COVER_REPORT_DIR_DEFAULT
 from calmjs.dev.toolchain import COVER_ARTIFACT
 from calmjs.dev.toolchain import COVER_BUNDLE
+from calmjs.dev.toolchain import COVER_CACHE
+from calmjs.dev.toolchain import COVER_EXCLUDE
+from calmjs.dev.toolchain import COVER_NATIVE
+from calmjs.dev.toolchain import COVER_RAW_DIR
 from calmjs.dev.toolchain import COVER_REPORT_DIR
 from calmjs.dev.toolchain import COVER_REPORT_FILE
 from calmjs.dev.toolchain import COVER_TEST
 from calmjs.dev.toolchain import NO_WRAP_TESTS
+from calmjs.dev.toolchain import TEST_CHANGED_FILES
+from calmjs.dev.toolchain import TEST_CHANGED_SINCE
+from calmjs.dev.toolchain import TEST_IMPACT_INDEX
+from calmjs.dev.toolchain import TEST_NO_CACHE
 from calmjs.dev.karma import KARMA_ABORT_ON_TEST_FAILURE
+from calmjs.dev.karma import KARMA_ARTIFACT_MANIFEST
 from calmjs.dev.karma import KARMA_BROWSERS
+from calmjs.dev.karma import KARMA_BROWSER_POOL
+from calmjs.dev.karma import KARMA_BROWSER_POOL_RECYCLE
+from calmjs.dev.karma import KARMA_BUNDLE_TESTS
+from calmjs.dev.karma import KARMA_COMPACT_CONFIG
 from calmjs.dev.karma import KARMA_EXTRA_FRAMEWORKS
+from calmjs.dev.karma import KARMA_PERSISTENT_SERVER
+from calmjs.dev.karma import KARMA_PROFILE
+from calmjs.dev.karma import KARMA_PROFILE_STATS
+from calmjs.dev.karma import KARMA_PROFILE_TRACE
+from calmjs.dev.karma import KARMA_REUSE_BUILD
+from calmjs.dev.karma import KARMA_SHARDS
+from calmjs.dev.karma import KARMA_SKIP_UNCHANGED_ARTIFACTS
+from calmjs.dev.karma import KARMA_SLOWEST
+from calmjs.dev.karma import KARMA_STOP_SERVER
+from calmjs.dev.karma import KARMA_WATCH
 
 logger = logging.getLogger(__name__)
 
 CALMJS_DEV_RUNTIME_KARMA = 'calmjs.dev.runtime.karma'
+# the environment variable for the directory to cache the metadata of
+# the entry points for the karma runtime in.
+CALMJS_DEV_CACHE_DIR = 'CALMJS_DEV_CACHE_DIR'
+ENTRY_POINTS_CACHE = 'runtime.entry_points.json'
 
 __all__ = ['KarmaRuntime', 'karma']
 
 
 def prepare_spec_artifacts(spec):
 
-    def checkpaths(paths):
-        for p in paths:
-            realp = realpath(p)
-            if not exists(realp):
-                logger.warning(
-                    "specified artifact '%s' does not exists", realp)
-                continue
-            yield realp
+    if not spec.get(ARTIFACT_PATHS):
+        return
+
+    # the manifest of the artifacts is only kept where it may persist.
+    manifest_dir = spec.get(BUILD_DIR) or spec.get(CACHE_DIR)
+    manifest_path = join(
+        manifest_dir, artifacts.ARTIFACTS_JSON) if manifest_dir else None
+    resolved = artifacts.resolve_artifacts(
+        spec[ARTIFACT_PATHS],
+        previous=artifacts.load_manifest(manifest_path).get(
+            'artifacts') if manifest_path else None,
+        digest=bool(manifest_path),
+    )
 
     # do not sort this list, it is provided with a specific order
-    if spec.get(ARTIFACT_PATHS):
-        # do this to conform to usage for artifact_paths in spec.
-        spec[ARTIFACT_PATHS] = list(checkpaths(spec.get(ARTIFACT_PATHS)))
+    paths = []
+    records = {}
+    for realp, record in resolved:
+        if record is None:
+            logger.warning(
+                "specified artifact '%s' does not exists", realp)
+            continue
+        paths.append(realp)
+        records[realp] = record
+    # do this to conform to usage for artifact_paths in spec.
+    spec[ARTIFACT_PATHS] = paths
+
+    if not (manifest_path and records):
+        return
+    added, changed = artifacts.compare(
+        artifacts.update_manifest(manifest_path, records), records)
+    for path in changed:
+        logger.info("artifact '%s' changed since the previous run", path)
+    for path in added:
+        logger.info("artifact '%s' recorded for the first time", path)
+    unchanged = len(records) - len(added) - len(changed)
+    if unchanged:
+        logger.info(
+            '%d of %d artifacts unchanged since the previous run',
+            unchanged, len(records))
+    spec[KARMA_ARTIFACT_MANIFEST] = manifest_path
+
+
+def prepare_spec_changed_files(spec):
+    ref = spec.get(TEST_CHANGED_SINCE)
+    if not ref:
+        return
+
+    try:
+        changed_files = utils.get_git_changed_files(ref)
+    except (OSError, CalledProcessError) as e:
+        logger.error(
+            "unable to derive the files changed since '%s': %s; %s", ref, e,
+            "all test modules will be selected"
+            if spec.get(TEST_CHANGED_FILES) is None else
+            "only the test modules affected by the changed files specified "
+            "will be selected",
+        )
+        return
+
+    spec[TEST_CHANGED_FILES] = list(
+        spec.get(TEST_CHANGED_FILES) or []) + changed_files
 
 
 def init_argparser_common(argparser):
@@ -143,7 +234,7 @@ def init_argparser_common(argparser):
         dest=COVERAGE_TYPE, default=COVERAGE_TYPE_DEFAULT,
         choices=[
             COVERAGE_TYPE_DEFAULT,
-            'html', 'lcov', 'lcovonly', 'text', 'text-summary',
+            'html', 'lcov', 'lcovonly', 'text', 'text-summary', 'cobertura',
         ],
         help="the type of coverage report to generate; "
              "defaults to '%s'; which is a custom multi "
@@ -156,6 +247,15 @@ def init_argparser_common(argparser):
         help="include test sources for coverage report",
     )
 
+    argparser.add_argument(
+        '--cover-exclude', default=[],
+        dest=COVER_EXCLUDE, action=StoreDelimitedList,
+        metavar='PATTERN[,PATTERN...]',
+        help="comma separated list of glob patterns for the paths of the "
+             "sources to exclude from the coverage report, matched against "
+             "the full path, e.g. '*/vendor/*'",
+    )
+
     argparser.add_argument(
         '--artifact', default=[],
         dest=ARTIFACT_PATHS, action=StorePathSepDelimitedList,
@@ -260,6 +360,153 @@ class TestToolchainRuntime(ToolchainRuntime):
         """
 
 
+class CoverageMergeRuntime(DriverRuntime):
+    """
+    merge the raw coverage reports produced by karma runs
+    """
+
+    def init_argparser(self, argparser):
+        super(CoverageMergeRuntime, self).init_argparser(argparser)
+
+        argparser.add_argument(
+            dest='coverage_paths', nargs='+', metavar='PATH',
+            help='raw coverage report files, or directories containing '
+                 'them, such as the ones specified with --cover-raw-dir for '
+                 'the karma runs',
+        )
+
+        argparser.add_argument(
+            '--cover-report-dir',
+            dest=COVER_REPORT_DIR, action='store', default='coverage',
+            metavar='DIR',
+            help="location to store the merged coverage report; "
+                 "defaults to 'coverage'",
+        )
+
+        argparser.add_argument(
+            '--reporters', default=['json', 'lcov', 'html'],
+            dest='reporters', action=StoreDelimitedList,
+            metavar='REPORTER[,REPORTER...]',
+            help='comma separated list of the reporters for the merged '
+                 'coverage report, from json, lcov, cobertura, text, '
+                 "text-summary and html; defaults to 'json,lcov,html'",
+        )
+
+    def run(self, argparser=None, coverage_paths=(), reporters=(), **kwargs):
+        paths = coverage.find_coverage_files(coverage_paths)
+        if not paths:
+            logger.error('no coverage reports found to merge')
+            return None
+        logger.info('merging %d coverage reports', len(paths))
+        merged = coverage.merge_coverage_files(paths)
+        coverage.write_reports(
+            merged, kwargs.get(COVER_REPORT_DIR) or COVER_REPORT_DIR_DEFAULT,
+            reporters, self.cli_driver)
+        return merged
+
+
+class ConcurrentRuntime(BaseRuntime):
+    """
+    run multiple karma runtime commands concurrently
+    """
+
+    def init_argparser(self, argparser):
+        super(ConcurrentRuntime, self).init_argparser(argparser)
+
+        argparser.add_argument(
+            dest='commands', nargs='+', metavar='COMMAND',
+            help='the arguments for the karma runtime for each of the '
+                 'test runs to be executed concurrently, each quoted as a '
+                 'single argument, e.g. "--coverage run example.package"',
+        )
+
+        argparser.add_argument(
+            '-j', '--concurrency', type=int, default=None,
+            dest='concurrency', metavar='N',
+            help='the maximum number of test runs to be executed at any '
+                 'given time; defaults to all of them',
+        )
+
+    def run(self, argparser=None, karma_runtime=None, commands=(),
+            concurrency=None, **kwargs):
+        try:
+            from calmjs.dev import aio
+        except (ImportError, SyntaxError):
+            logger.error(
+                'concurrent execution of test runs requires Python 3.5.1 '
+                'or later')
+            return None
+
+        runtime_kwargs = []
+        for command in commands:
+            command_kwargs = vars(karma_runtime.argparser.parse_args(
+                shlex.split(command)))
+            action = command_kwargs.pop(karma_runtime.action_key, None)
+            runtime = karma_runtime.get_runtime(action)
+            if not isinstance(runtime, ToolchainRuntime):
+                logger.error(
+                    "command '%s' does not lead to a toolchain runtime; "
+                    "aborting", command)
+                return None
+            if command_kwargs.get(KARMA_WATCH):
+                logger.warning(
+                    "watch mode is not supported for concurrent test runs; "
+                    "ignoring --watch for command '%s'", command)
+                command_kwargs.pop(KARMA_WATCH)
+            runtime_kwargs.append((runtime, command_kwargs))
+
+        logger.info(
+            'running %d test runs with a concurrency of %s',
+            len(runtime_kwargs), concurrency or len(runtime_kwargs))
+        return aio.run_runtimes(
+            karma_runtime, runtime_kwargs, concurrency=concurrency,
+            driver=aio.AsyncKarmaDriver.from_driver(karma_runtime.cli_driver),
+        )
+
+
+def entry_point_target(entry_point):
+    return '%s:%s' % (entry_point.module_name, '.'.join(entry_point.attrs))
+
+
+class LazyRuntime(object):
+    """
+    Stands in for the runtime at an entry point, such that the subcommand
+    may be registered without importing it; the runtime is loaded and
+    its arguments added to the subparser only once the subcommand is
+    selected.
+    """
+
+    def __init__(self, loader, entry_point, description):
+        self.loader = loader
+        self.entry_point = entry_point
+        self.description = description
+        self._runtime = None
+
+    @property
+    def runtime(self):
+        if self._runtime is None:
+            self._runtime = self.loader(self.entry_point)
+        return self._runtime
+
+    def init_argparser(self, argparser):
+        parse_known_args = argparser.parse_known_args
+
+        def lazy_parse_known_args(*a, **kw):
+            # drop this override from the instance before anything else
+            # to have the real method used from now on.
+            del argparser.parse_known_args
+            if not self.runtime:
+                argparser.error(
+                    "cannot load entry point '%s'" % self.entry_point)
+            logger.debug(
+                "initializing arguments for entry point '%s'",
+                self.entry_point)
+            self.runtime.init_argparser(argparser)
+            return parse_known_args(*a, **kw)
+
+        argparser.parse_known_args = lazy_parse_known_args
+
+
 class KarmaRuntime(Runtime, DriverRuntime):
     """
     The runtime class for karma
@@ -271,17 +518,28 @@ class KarmaRuntime(Runtime, DriverRuntime):
             description='karma testrunner integration for calmjs',
             *a, **kw):
         self.karma_entry_point_group = karma_entry_point_group
+        self._entry_point_metadata = None
+        self._loaded_runtimes = {}
+        self._lazy_runtimes = {}
+        self._init_argparser_span = None
         super(KarmaRuntime, self).__init__(
             cli_driver=cli_driver, description=description, *a, **kw)
 
-    def entry_point_load_validated(self, entry_point):
-        # to avoid trying to import this again, check entry_point first
-        if entry_point.name == 'karma':
-            return False
+    def load_validated(self, entry_point):
+        """
+        Load and validate the runtime at the entry point, only once.
+        """
+
+        target = entry_point_target(entry_point)
+        if target not in self._loaded_runtimes:
+            self._loaded_runtimes[target] = self._load_validated(entry_point)
+        return self._loaded_runtimes[target]
 
+    def _load_validated(self, entry_point):
         inst = super(KarmaRuntime, self).entry_point_load_validated(
             entry_point)
-        if not isinstance(inst, ToolchainRuntime):
+        if not isinstance(inst, (
+                ToolchainRuntime, ConcurrentRuntime, CoverageMergeRuntime)):
             logger.debug(
                 "filtering out entry point '%s' as it does not lead to a "
                 "calmjs.runtime.ToolchainRuntime in KarmaRuntime.",
@@ -290,6 +548,50 @@ class KarmaRuntime(Runtime, DriverRuntime):
             return False
         return inst
 
+    def get_entry_point_metadata(self):
+        """
+        Return a mapping of the entry points that lead to a runtime
+        usable by the karma runtime to their descriptions.  If the
+        CALMJS_DEV_CACHE_DIR environment variable is set, the mapping is
+        cached in that directory for the current working set, such that
+        the runtimes are not imported to produce it again.
+        """
+
+        def factory():
+            return {
+                str(entry_point): inst.description
+                for entry_point, inst in (
+                    (entry_point, self.load_validated(entry_point))
+                    for entry_point in self.iter_entry_points()
+                    if entry_point.name != 'karma'
+                ) if inst
+            }
+
+        if self._entry_point_metadata is None:
+            cache_dir = os.environ.get(CALMJS_DEV_CACHE_DIR)
+            self._entry_point_metadata = cache.cached(
+                cache_dir, ENTRY_POINTS_CACHE, [
+                    self.karma_entry_point_group, self.entry_point_group],
+                factory, working_set=self.working_set,
+            ) if cache_dir else factory()
+        return self._entry_point_metadata
+
+    def entry_point_load_validated(self, entry_point):
+        # to avoid trying to import this again, check entry_point first
+        if entry_point.name == 'karma':
+            return False
+
+        metadata = self.get_entry_point_metadata()
+        if str(entry_point) not in metadata:
+            return False
+        # the same target registered through multiple entry points must
+        # lead to the same instance.
+        target = entry_point_target(entry_point)
+        if target not in self._lazy_runtimes:
+            self._lazy_runtimes[target] = LazyRuntime(
+                self.load_validated, entry_point, metadata[str(entry_point)])
+        return self._lazy_runtimes[target]
+
     def iter_entry_points(self):
         for ep in sorted(
                 chain(*tuple(map(self.working_set.iter_entry_points, (
@@ -297,7 +599,23 @@ class KarmaRuntime(Runtime, DriverRuntime):
                 key=lambda ep: ep.name):
             yield ep
 
+    def get_runtime(self, action):
+        """
+        Return the runtime registered for the subcommand.
+        """
+
+        details = self.get_argparser_details(self.argparser)
+        runtime = details.runtimes.get(action)
+        if isinstance(runtime, LazyRuntime):
+            return runtime.runtime
+        return runtime
+
     def init_argparser(self, argparser):
+        start = time()
+        self._init_argparser(argparser)
+        self._init_argparser_span = (start, time())
+
+    def _init_argparser(self, argparser):
         super(KarmaRuntime, self).init_argparser(argparser)
 
         init_argparser_common(argparser)
@@ -308,12 +626,223 @@ class KarmaRuntime(Runtime, DriverRuntime):
             help="include bundled sources for coverage report",
         )
 
+        argparser.add_argument(
+            '--cover-cache',
+            dest=COVER_CACHE, action='store_true',
+            help="instrument the sources for the coverage report through "
+                 "istanbul ahead of karma, with the instrumented copies "
+                 "kept in the cache directory such that unchanged sources "
+                 "are not instrumented again; requires --cache-dir",
+        )
+
+        argparser.add_argument(
+            '--cover-native',
+            dest=COVER_NATIVE, action='store_true',
+            help="only have karma write the raw coverage report, with the "
+                 "reports for the coverage type produced from it without "
+                 "going through the istanbul reporters; for the default "
+                 "coverage type, these are the json, lcov, cobertura and "
+                 "text reports, with the html report to be produced from "
+                 "the json report with the 'merge' command when needed",
+        )
+
         argparser.add_argument(
             '-I', '--ignore-errors',
             dest=KARMA_ABORT_ON_TEST_FAILURE, action='store_false',
             help='do not abort execution on failure',
         )
 
+        argparser.add_argument(
+            '--cover-raw-dir',
+            dest=COVER_RAW_DIR, action='store', default=None,
+            metavar='DIR',
+            help="directory to write the raw coverage report of the run to, "
+                 "with a unique name such that the reports of separate runs "
+                 "may be merged using the 'merge' command",
+        )
+
+        argparser.add_argument(
+            '--cache-dir',
+            dest=CACHE_DIR, action='store', default=None,
+            metavar='DIR',
+            help="directory to persist data that may be reused across test "
+                 "runs, such as the resolved test modules for the packages "
+                 "and registries selected; caching is disabled if "
+                 "unspecified",
+        )
+
+        argparser.add_argument(
+            '--changed-files', default=None,
+            dest=TEST_CHANGED_FILES, action=StorePathSepDelimitedList,
+            metavar='FILE[%sFILE...]' % pathsep,
+            help="only run the test modules affected by the listed "
+                 "files, which are the test modules that were changed, "
+                 "that reference the changed source modules, or that "
+                 "are in the same namespace as the changed source modules; "
+                 "multiple paths are to be separated by platform's path "
+                 "separation character '%s'" % pathsep,
+        )
+
+        argparser.add_argument(
+            '--changed-since', default=None,
+            dest=TEST_CHANGED_SINCE, metavar='REF',
+            help="only run the test modules affected by the files that "
+                 "have been changed in the git working tree since REF; "
+                 "may be combined with --changed-files",
+        )
+
+        argparser.add_argument(
+            '--test-impact',
+            dest=TEST_IMPACT_INDEX, action='store_true',
+            help="record the source modules executed by every test module "
+                 "according to the coverage into an index kept in the "
+                 "cache directory; the test modules affected by the "
+                 "changed files are then selected through this index, "
+                 "along with the test modules not yet recorded; requires "
+                 "--coverage and --cache-dir",
+        )
+
+        argparser.add_argument(
+            '--reuse-build',
+            dest=KARMA_REUSE_BUILD, action='store_true',
+            help='reuse the build from a previous run in the specified build '
+                 'directory, skipping the toolchain and going straight to '
+                 'karma, if it was produced with identical arguments and '
+                 'none of the files involved have changed since',
+        )
+
+        argparser.add_argument(
+            '--watch',
+            dest=KARMA_WATCH, action='store_true',
+            help='after the initial run, keep watching the source and test '
+                 'files for changes; the changed modules are recompiled '
+                 'through the toolchain and the tests are rerun on a '
+                 'persistent karma server until interrupted',
+        )
+
+        argparser.add_argument(
+            '--slowest', type=int, default=None,
+            dest=KARMA_SLOWEST, metavar='N',
+            help='record the duration of every test and report the N '
+                 'slowest tests and test files; durations are accumulated '
+                 'across runs in the cache directory, or the build '
+                 'directory if no cache directory is specified, so only the '
+                 'current run is reported if neither is specified; '
+                 'durations are always recorded if a cache directory is '
+                 'specified',
+        )
+
+        argparser.add_argument(
+            '--persistent-server',
+            dest=KARMA_PERSISTENT_SERVER, action='store_true',
+            help='start karma as a persistent server that keeps the '
+                 'browsers captured, and trigger test executions through '
+                 '"karma run"; subsequent invocations with the same build '
+                 'directory and an identical configuration will reuse the '
+                 'running server; requires the build directory to be '
+                 'specified',
+        )
+
+        argparser.add_argument(
+            '--stop-server',
+            dest=KARMA_STOP_SERVER, action='store_true',
+            help='stop the persistent karma server recorded in the specified '
+                 'build directory, without building or running any tests',
+        )
+
+        argparser.add_argument(
+            '--profile',
+            dest=KARMA_PROFILE, action='store_true',
+            help='report the time spent in each of the phases of the run, '
+                 'i.e. the advice groups, the toolchain steps and the steps '
+                 'of the karma driver',
+        )
+
+        argparser.add_argument(
+            '--profile-trace', default=None,
+            dest=KARMA_PROFILE_TRACE, metavar='FILE',
+            help='write the phases of the run into the file in the trace '
+                 'event format as loaded by the Chrome trace viewer; '
+                 'implies --profile',
+        )
+
+        argparser.add_argument(
+            '--profile-stats', default=None,
+            dest=KARMA_PROFILE_STATS, metavar='FILE',
+            help='profile the run through cProfile, with the statistics '
+                 'dumped into the file for the pstats module; implies '
+                 '--profile',
+        )
+
+        argparser.add_argument(
+            '--browser-pool', type=int, default=None,
+            dest=KARMA_BROWSER_POOL, metavar='N',
+            help='keep a pool of N headless Chrome browsers running, which '
+                 'karma will attach to rather than launching new browsers '
+                 'for every run; the browser is specified through the '
+                 'CHROME_BIN environment variable if it cannot be found, '
+                 'and the pool is tracked in the cache directory; a size '
+                 'of 0 stops the pooled browsers',
+        )
+
+        argparser.add_argument(
+            '--browser-pool-recycle', type=int, default=None,
+            dest=KARMA_BROWSER_POOL_RECYCLE, metavar='N',
+            help='the number of runs a pooled browser is used for before it '
+                 'is replaced by a new one; defaults to %d' % (
+                     pool.RECYCLE_DEFAULT),
+        )
+
+        argparser.add_argument(
+            '--shards', type=int, default=None,
+            dest=KARMA_SHARDS, metavar='N',
+            help='partition the test modules into N shards, each to be '
+                 'executed concurrently by its own karma process; the '
+                 'coverage reports of the shards are merged into the '
+                 'coverage report directory; cannot be combined with a '
+                 'persistent server',
+        )
+
+        argparser.add_argument(
+            '--bundle-tests', type=int, default=None,
+            dest=KARMA_BUNDLE_TESTS, metavar='N',
+            help='bundle the test modules into at most N chunk files with '
+                 'source maps, written to the build directory, such that '
+                 'the browser loads them as a few scripts rather than each '
+                 'test module individually; not applied when the test '
+                 'modules are covered or watched',
+        )
+
+        argparser.add_argument(
+            '--compact-config',
+            dest=KARMA_COMPACT_CONFIG, action='store_true',
+            help='write the files and preprocessors of the karma '
+                 'configuration into a compact manifest loaded by it, with '
+                 'every complete directory of files of the same type '
+                 'listed as a single glob pattern',
+        )
+
+        argparser.add_argument(
+            '--skip-unchanged-artifacts',
+            dest=KARMA_SKIP_UNCHANGED_ARTIFACTS, action='store_true',
+            help='do not execute karma if the tests have passed in a '
+                 'previous run against identical artifacts, test modules '
+                 'and configuration, as recorded in the manifest of the '
+                 'artifacts kept in the build directory if specified, '
+                 'otherwise the cache directory; not applicable with '
+                 'coverage enabled',
+        )
+
+        argparser.add_argument(
+            '--no-test-cache',
+            dest=TEST_NO_CACHE, action='store_true',
+            help='run every selected test module, rather than skipping the '
+                 'test modules that have passed in a previous run with '
+                 'identical contents, targets, artifacts and configuration, '
+                 'as recorded in the cache directory; the test modules are '
+                 'never skipped without --cache-dir or with coverage enabled',
+        )
+
     def _update_spec_for_karma(self, spec, **kwargs):
         # This method assigns default values of the specific type to
         # the spec.  Ensure they are added correctly.
@@ -321,18 +850,41 @@ class KarmaRuntime(Runtime, DriverRuntime):
             # default value, and keys to be assigned that
             (None, [
                 KARMA_ABORT_ON_TEST_FAILURE,
+                KARMA_BROWSER_POOL,
+                KARMA_BROWSER_POOL_RECYCLE,
+                KARMA_BUNDLE_TESTS,
+                KARMA_COMPACT_CONFIG,
+                CACHE_DIR,
                 COVERAGE_ENABLE,
+                COVER_RAW_DIR,
                 COVER_REPORT_DIR,
                 COVER_REPORT_FILE,
                 COVERAGE_TYPE,
                 COVER_ARTIFACT,
                 COVER_BUNDLE,
+                COVER_CACHE,
+                COVER_NATIVE,
                 COVER_TEST,
                 NO_WRAP_TESTS,
+                KARMA_PERSISTENT_SERVER,
+                KARMA_PROFILE,
+                KARMA_PROFILE_STATS,
+                KARMA_PROFILE_TRACE,
+                KARMA_REUSE_BUILD,
+                KARMA_SHARDS,
+                KARMA_SKIP_UNCHANGED_ARTIFACTS,
+                KARMA_SLOWEST,
+                KARMA_STOP_SERVER,
+                KARMA_WATCH,
+                TEST_CHANGED_FILES,
+                TEST_CHANGED_SINCE,
+                TEST_IMPACT_INDEX,
+                TEST_NO_CACHE,
             ]),
             # For all list types.
             ([], [
                 ARTIFACT_PATHS,
+                COVER_EXCLUDE,
                 CALMJS_TEST_REGISTRY_NAMES,
                 TEST_PACKAGE_NAMES,
                 KARMA_BROWSERS,
@@ -355,12 +907,22 @@ class KarmaRuntime(Runtime, DriverRuntime):
         # runtime require/supply, plug them back in like so:
         self._update_spec_for_karma(spec, **kwargs)
         prepare_spec_artifacts(spec)
+        prepare_spec_changed_files(spec)
 
         return spec
 
     def _run_runtime(self, runtime, **kwargs):
+        start = time()
         spec = self._prepare_spec_from_runtime(runtime, **kwargs)
+        recorder = phases.get_recorder(spec)
+        if recorder:
+            if self._init_argparser_span:
+                recorder.record(
+                    'init_argparser', 'runtime', *self._init_argparser_span)
+            recorder.record('prepare_spec', 'runtime', start, time())
         toolchain = runtime.toolchain
+        if spec.get(KARMA_WATCH):
+            return watch.watch(self.cli_driver, toolchain, spec)
         self.cli_driver.run(toolchain, spec)
         return spec
 
@@ -368,9 +930,17 @@ class KarmaRuntime(Runtime, DriverRuntime):
         # have to rely on the local one, because the passed in one will
         # be the root one.
         details = self.get_argparser_details(self.argparser)
-        runtime = details.runtimes.get(kwargs.pop(self.action_key))
-        if runtime:
+        action = kwargs.pop(self.action_key)
+        runtime = self.get_runtime(action)
+        if isinstance(runtime, ToolchainRuntime):
             return self._run_runtime(runtime, **kwargs)
+        if isinstance(runtime, ConcurrentRuntime):
+            return runtime.run(
+                argparser=details.subparsers.get(action), karma_runtime=self,
+                **kwargs)
+        if runtime:
+            return runtime.run(
+                argparser=details.subparsers.get(action), **kwargs)
 
         argparser.print_help()
         return
@@ -379,3 +949,5 @@ class KarmaRuntime(Runtime, DriverRuntime):
 # this will be registered to the karma specific thing.
 run = TestToolchainRuntime(KarmaToolchain())
 karma = KarmaRuntime(KarmaDriver.create())
+merge = CoverageMergeRuntime(IstanbulDriver.create())
+concurrent = ConcurrentRuntime()
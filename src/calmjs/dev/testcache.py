@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the cache of the test modules that have passed,
+which records the fingerprint of the inputs of every test module as of
+its last passing run, such that the test modules may be skipped in the
+following runs for as long as their inputs remain identical.
+"""
+
+from os.path import isfile
+
+from calmjs.dev import cache
+from calmjs.dev import utils
+
+TEST_CACHE_JSON = 'test_cache.json'
+
+
+def fingerprints(base, test_module_paths_map, processes=None):
+    """
+    Return the mapping of the names of the test modules to the digest
+    of their contents combined with base, which is the digest of the
+    inputs shared by all test modules.  The test modules that do not
+    exist are omitted.
+    """
+
+    items = sorted(test_module_paths_map.items())
+
+    def fingerprint(item):
+        modname, path = item
+        if not isfile(path):
+            return modname, None
+        return modname, cache.digest([base, cache.file_digest(path)])
+
+    return {
+        modname: value
+        for modname, value in utils.thread_map(fingerprint, items, processes)
+        if value is not None
+    }
+
+
+def load_cache(cache_dir):
+    passed = cache.read_json(cache_dir, TEST_CACHE_JSON, {})
+    return passed if isinstance(passed, dict) else {}
+
+
+def save_cache(cache_dir, passed):
+    cache.write_json(cache_dir, TEST_CACHE_JSON, passed)
+
+
+def select_cached(passed, test_fingerprints):
+    """
+    Return the sorted list of the names of the test modules with the
+    fingerprint as recorded in passed.
+    """
+
+    return sorted(
+        modname for modname, value in test_fingerprints.items()
+        if passed.get(modname) == value
+    )
+
+
+def attribute_results(tests, suite_files, path_names):
+    """
+    Attribute the results of the tests to the test modules through the
+    mapping of the suite names to the paths to the test modules and of
+    those paths to the names of the test modules.  Return the sets of
+    the names of the test modules with only successful or skipped tests
+    and with any failed tests, along with the number of the failed tests
+    that could not be attributed to any of the test modules.
+    """
+
+    succeeded = set()
+    failed = set()
+    unattributed = 0
+    for test in tests:
+        modname = path_names.get(
+            suite_files.get((test.get('suite') or [None])[0]))
+        if test.get('status') == 'failed':
+            if modname is None:
+                unattributed += 1
+            else:
+                failed.add(modname)
+        elif modname is not None:
+            succeeded.add(modname)
+    return succeeded - failed, failed, unattributed
+
+
+def update_cache(cache_dir, test_fingerprints, succeeded, failed):
+    """
+    Record the fingerprints of the succeeded test modules into the
+    cache, and remove the records of the failed test modules.
+    """
+
+    passed = load_cache(cache_dir)
+    for modname in failed:
+        passed.pop(modname, None)
+    for modname in succeeded:
+        if modname in test_fingerprints:
+            passed[modname] = test_fingerprints[modname]
+    save_cache(cache_dir, passed)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import unittest
+import sys
+from os.path import join
+
+from calmjs.toolchain import NullToolchain
+from calmjs.toolchain import Spec
+
+from calmjs.dev import cli
+from calmjs.dev.runtime import KarmaRuntime
+from calmjs.dev.runtime import TestToolchainRuntime
+
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_mod_call
+from calmjs.testing.utils import stub_stdouts
+
+from calmjs.dev.tests.test_cli import make_fake_karma
+
+try:
+    from calmjs.dev import aio
+except (ImportError, SyntaxError):  # pragma: no cover
+    aio = None
+
+# a tail for the fake karma that only exits successfully if another one
+# is running at the same time.
+WAIT_FOR_PEER = '''import os
+marker = os.path.join(%r, str(os.getpid()))
+open(marker, 'w').close()
+for i in range(100):
+    if len(os.listdir(%r)) > 1:
+        sys.exit(0)
+    time.sleep(0.05)
+sys.exit(1)
+'''
+
+# a tail for the fake karma that fails if another one is running.
+EXCLUSIVE = '''import os
+lock = %r
+if os.path.exists(lock):
+    sys.exit(9)
+open(lock, 'w').close()
+time.sleep(0.2)
+os.remove(lock)
+sys.exit(0)
+'''
+
+
+@unittest.skipIf(aio is None, 'requires Python 3.5.1 or later')
+@unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+class AsyncKarmaDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stub_stdouts(self)
+
+    def make_specs(self, count, **kw):
+        return [
+            (NullToolchain(), Spec(build_dir=mkdtemp(self), **kw))
+            for i in range(count)
+        ]
+
+    def test_run_specs_results(self):
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output=(
+                u'  Suite\n'
+                u'    \u2713 passes (5ms)\n'
+                u'Executed 1 of 1 SUCCESS\n'
+            ),
+            tail='sys.exit(0)\n',
+        ))
+        specs = aio.run_specs(driver, self.make_specs(2))
+        self.assertEqual(len(specs), 2)
+        for spec in specs:
+            self.assertEqual(spec['karma_return_code'], 0)
+            self.assertEqual(spec['karma_results']['summary'], {
+                'executed': 1, 'total': 1, 'failed': 0, 'skipped': 0})
+            self.assertNotIn(aio.EVENT_LOOP, spec)
+        self.assertEqual(
+            sys.stdout.getvalue().count('Executed 1 of 1 SUCCESS'), 2)
+
+    def test_run_specs_concurrent(self):
+        markers = mkdtemp(self)
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='', tail=WAIT_FOR_PEER % (markers, markers)))
+        specs = aio.run_specs(driver, self.make_specs(2), concurrency=2)
+        self.assertEqual([s['karma_return_code'] for s in specs], [0, 0])
+
+    def test_run_specs_concurrency_limit(self):
+        lock = join(mkdtemp(self), 'lock')
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='', tail=EXCLUSIVE % lock))
+        specs = aio.run_specs(driver, self.make_specs(3), concurrency=1)
+        self.assertEqual([s['karma_return_code'] for s in specs], [0, 0, 0])
+
+    def test_run_specs_failure_completes_others(self):
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='', tail='sys.exit(0)\n'))
+        toolchain_specs = self.make_specs(1)
+        toolchain_specs.append((NullToolchain(), Spec(
+            build_dir=join(mkdtemp(self), 'missing'))))
+        with self.assertRaises(OSError):
+            aio.run_specs(driver, toolchain_specs)
+        self.assertEqual(toolchain_specs[0][1]['karma_return_code'], 0)
+
+    def test_run_specs_shards(self):
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='ran shard\n',
+            tail='sys.exit(3 if "shard1" in sys.argv[2] else 0)\n',
+        ))
+        spec = Spec(
+            build_dir=mkdtemp(self), karma_shards=2,
+            test_module_paths_map={'test_a': 'test_a.js', 'test_b': 'b.js'},
+        )
+        aio.run_specs(driver, [(NullToolchain(), spec)])
+        self.assertEqual(spec['karma_shard_return_codes'], [0, 3])
+        self.assertEqual(spec['karma_return_code'], 3)
+        self.assertEqual(sys.stdout.getvalue().count('ran shard'), 2)
+
+    def test_run_runtimes(self):
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='', tail='sys.exit(0)\n'))
+        karma_runtime = KarmaRuntime(driver)
+        runtime = TestToolchainRuntime(NullToolchain())
+        specs = aio.run_runtimes(karma_runtime, [
+            (runtime, {'build_dir': mkdtemp(self)}),
+            (runtime, {'build_dir': mkdtemp(self), 'karma_shards': 2}),
+        ], driver=driver)
+        self.assertEqual([s['karma_return_code'] for s in specs], [0, 0])
+        self.assertNotIn('karma_shards', specs[0])
+        self.assertEqual(specs[1]['karma_shards'], 2)
+
+    def test_run_specs_long_line(self):
+        line = 'x' * (aio.CHUNK_SIZE * 3)
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output=line + '\nExecuted 1 of 1 SUCCESS',
+            tail='sys.exit(0)\n'))
+        spec, = aio.run_specs(driver, self.make_specs(1))
+        self.assertEqual(spec['karma_return_code'], 0)
+        self.assertEqual(spec['karma_results']['summary']['executed'], 1)
+        self.assertIn(line + '\n', sys.stdout.getvalue())
+
+    def test_run_specs_reuse_build(self):
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(
+            self, output='', tail='sys.exit(0)\n'))
+        build_dir = mkdtemp(self)
+
+        def run():
+            spec = Spec(build_dir=build_dir, karma_reuse_build=True)
+            aio.run_specs(driver, [(NullToolchain(), spec)])
+            return spec
+
+        self.assertEqual(run()['link'], 'linked')
+        second = run()
+        self.assertNotIn('link', second)
+        self.assertEqual(second['karma_return_code'], 0)
+
+    def test_from_driver(self):
+        driver = aio.AsyncKarmaDriver.from_driver(cli.KarmaDriver(
+            binary='fake_karma', working_dir='somewhere'))
+        self.assertTrue(isinstance(driver, aio.AsyncKarmaDriver))
+        self.assertEqual(driver.binary, 'fake_karma')
+        self.assertEqual(driver.working_dir, 'somewhere')
+
+    def test_test_spec_without_loop(self):
+        stub_mod_call(self, cli)
+        driver = aio.AsyncKarmaDriver(binary=make_fake_karma(self))
+        spec = Spec(build_dir=mkdtemp(self))
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        driver.test_spec(spec)
+        self.assertEqual(self.call_args[0][0][1], 'start')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+from os.path import join
+
+from calmjs.dev import artifacts
+from calmjs.dev import cache
+
+from calmjs.testing.utils import mkdtemp
+
+
+class ArtifactsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+
+    def write(self, name, contents):
+        path = join(self.root, name)
+        with open(path, 'w') as fd:
+            fd.write(contents)
+        return path
+
+    def test_stat_artifact(self):
+        path = self.write('a.js', 'var a = 1;')
+        record = artifacts.stat_artifact(path)
+        self.assertEqual(record['size'], 10)
+        self.assertEqual(record['sha256'], cache.file_digest(path))
+        # the digest is reused for the same size and modification time.
+        previous = dict(record, sha256='cached')
+        self.assertEqual(
+            'cached', artifacts.stat_artifact(path, previous)['sha256'])
+        os.utime(path, (1000, 1000))
+        self.assertEqual(
+            record['sha256'],
+            artifacts.stat_artifact(path, previous)['sha256'])
+
+    def test_resolve_artifacts(self):
+        paths = [self.write('%d.js' % i, str(i)) for i in range(5)]
+        missing = join(self.root, 'missing.js')
+        results = artifacts.resolve_artifacts(
+            paths[:2] + [missing] + paths[2:], processes=2)
+        self.assertEqual(
+            [path for path, record in results],
+            paths[:2] + [missing] + paths[2:])
+        self.assertIsNone(results[2][1])
+        self.assertEqual(
+            results[0][1]['sha256'], cache.file_digest(paths[0]))
+        self.assertEqual([(paths[0], {})], artifacts.resolve_artifacts(
+            paths[:1], digest=False))
+
+    def test_update_manifest_compare(self):
+        manifest_path = join(self.root, 'build', artifacts.ARTIFACTS_JSON)
+        records = {'a.js': {'sha256': 'a'}, 'b.js': {'sha256': 'b'}}
+        self.assertEqual({}, artifacts.update_manifest(manifest_path, records))
+        previous = artifacts.update_manifest(manifest_path, {
+            'a.js': {'sha256': 'A'}, 'c.js': {'sha256': 'c'}})
+        self.assertEqual({'a.js': {'sha256': 'a'}}, previous)
+        self.assertEqual((['c.js'], ['a.js']), artifacts.compare(previous, {
+            'a.js': {'sha256': 'A'}, 'c.js': {'sha256': 'c'}}))
+        # records of the other artifacts are retained.
+        self.assertEqual(
+            ['a.js', 'b.js', 'c.js'],
+            sorted(artifacts.load_manifest(manifest_path)['artifacts']))
+
+    def test_run_key(self):
+        key = artifacts.run_key(
+            ['a'], {'files': ['/tmp/build1/src.js']}, {}, '/tmp/build1')
+        self.assertEqual(key, artifacts.run_key(
+            ['a'], {'files': ['/tmp/build2/src.js']}, {}, '/tmp/build2'))
+        self.assertNotEqual(key, artifacts.run_key(
+            ['b'], {'files': ['/tmp/build1/src.js']}, {}, '/tmp/build1'))
+
+    def test_record_passed(self):
+        manifest_path = join(self.root, artifacts.ARTIFACTS_JSON)
+        self.assertFalse(artifacts.has_passed(manifest_path, 'key'))
+        artifacts.record_passed(manifest_path, 'key')
+        self.assertTrue(artifacts.has_passed(manifest_path, 'key'))
+        for i in range(artifacts.PASSED_LIMIT):
+            artifacts.record_passed(manifest_path, str(i))
+        self.assertFalse(artifacts.has_passed(manifest_path, 'key'))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import unittest
+import json
+from os.path import join
+
+from calmjs.registry import get
+
+from calmjs.dev import benchmark
+from calmjs.dev import dist
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+
+
+class SyntheticTestCase(unittest.TestCase):
+
+    def test_registered(self):
+        synthetic = benchmark.Synthetic(10, packages=4, registries=2)
+        self.assertEqual(10, len(synthetic.sources))
+        with synthetic.registered():
+            results = dist.get_module_registries_dependencies(
+                ['pkg1'], synthetic.test_registry_names)
+            self.assertEqual(sorted(results), [
+                'pkg1/tests/test_mod1',
+                'pkg1/tests/test_mod5',
+                'pkg1/tests/test_mod9',
+            ])
+            self.assertEqual(
+                '/synthetic/pkg1/tests/test_mod5.js',
+                results['pkg1/tests/test_mod5'])
+        self.assertIsNone(get(synthetic.test_registry_names[0]))
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        results = benchmark.run_benchmarks(
+            modules=[10, 20], packages=2, repeat=1)
+        self.assertEqual(
+            sorted(name for name, factory in benchmark.BENCHMARKS),
+            sorted(results))
+        for durations in results.values():
+            self.assertEqual(['10', '20'], sorted(durations))
+
+        results = benchmark.run_benchmarks(
+            modules=[10], packages=2, repeat=1, names=['create_config'])
+        self.assertEqual(['create_config'], list(results))
+
+    def test_scaling(self):
+        self.assertEqual(1.0, benchmark.scaling({'10': 1.0, '100': 10.0}))
+        self.assertEqual(2.0, benchmark.scaling({'10': 1.0, '100': 100.0}))
+        self.assertIsNone(benchmark.scaling({'10': 1.0}))
+        self.assertIsNone(benchmark.scaling({'10': 0.0, '100': 1.0}))
+
+    def test_compare(self):
+        baseline = {'create_config': {'10': 1.0, '20': 2.0}}
+        self.assertEqual([], benchmark.compare(
+            {'create_config': {'10': 1.4, '20': 2.0}}, baseline))
+        self.assertEqual([('create_config', 20, 2.0, 4.0)], benchmark.compare(
+            {'create_config': {'10': 1.0, '20': 4.0}, 'other': {'10': 9.0}},
+            baseline))
+
+    def test_main_save_baseline(self):
+        baseline = join(mkdtemp(self), 'baseline.json')
+        stream = mocks.StringIO()
+        self.assertEqual(0, benchmark.main([
+            '--modules=10,20', '--packages=2', '--repeat=1',
+            '--benchmark=create_config', '--save', baseline,
+        ], stream=stream))
+        self.assertIn('create_config:', stream.getvalue())
+        self.assertIn('scaling exponent', stream.getvalue())
+        with open(baseline) as fd:
+            recorded = json.load(fd)
+        self.assertEqual(2, recorded['parameters']['packages'])
+        self.assertEqual(['10', '20'], sorted(
+            recorded['results']['create_config']))
+
+        # an impossibly fast baseline.
+        recorded['results']['create_config']['20'] = 1e-9
+        with open(baseline, 'w') as fd:
+            json.dump(recorded, fd)
+        stream = mocks.StringIO()
+        self.assertEqual(1, benchmark.main([
+            '--modules=10,20', '--packages=2', '--repeat=1',
+            '--benchmark=create_config', '--baseline', baseline,
+        ], stream=stream))
+        self.assertIn('x baseline', stream.getvalue())
+        self.assertIn(
+            'regression: create_config with 20 modules', stream.getvalue())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+from os.path import exists
+from os.path import join
+
+from pkg_resources import WorkingSet
+
+from calmjs.utils import pretty_logging
+
+from calmjs.dev import cache
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+
+
+class DigestTestCase(unittest.TestCase):
+
+    def test_digest_stable(self):
+        self.assertEqual(
+            cache.digest({'b': 1, 'a': [1, 2]}),
+            cache.digest({'a': [1, 2], 'b': 1}),
+        )
+        self.assertNotEqual(cache.digest([1, 2]), cache.digest([2, 1]))
+
+    def test_file_digest(self):
+        tmpdir = mkdtemp(self)
+        target = join(tmpdir, 'file.js')
+        with open(target, 'w') as fd:
+            fd.write('var a = 1;')
+        self.assertEqual(
+            cache.file_digest(target), cache.file_digest(target))
+        original = cache.file_digest(target)
+        with open(target, 'w') as fd:
+            fd.write('var a = 2;')
+        self.assertNotEqual(original, cache.file_digest(target))
+
+    def test_files_digests(self):
+        tmpdir = mkdtemp(self)
+        os.mkdir(join(tmpdir, 'dir'))
+        a = join(tmpdir, 'a.js')
+        b = join(tmpdir, 'dir', 'b.js')
+        for path in (a, b):
+            with open(path, 'w') as fd:
+                fd.write('var a = 1;')
+        result = cache.files_digests([
+            a, join(tmpdir, 'dir'), join(tmpdir, 'missing.js')])
+        self.assertEqual(sorted(result), [a, b])
+        self.assertEqual(result[a], cache.file_digest(a))
+
+    def test_spec_digest(self):
+        self.assertEqual(
+            cache.spec_digest({'a': 1, 'b': object()}),
+            cache.spec_digest({'a': 1}),
+        )
+        self.assertNotEqual(
+            cache.spec_digest({'a': 1}), cache.spec_digest({'a': 2}))
+
+    def test_working_set_fingerprint(self):
+        self.assertEqual(
+            cache.working_set_fingerprint(), cache.working_set_fingerprint())
+        self.assertNotEqual(
+            cache.working_set_fingerprint(),
+            cache.working_set_fingerprint(WorkingSet([])),
+        )
+
+
+class JsonCacheTestCase(unittest.TestCase):
+
+    def test_read_missing(self):
+        tmpdir = mkdtemp(self)
+        self.assertEqual(cache.read_json(tmpdir, 'missing.json', {}), {})
+
+    def test_read_write(self):
+        tmpdir = join(mkdtemp(self), 'cache')
+        cache.write_json(tmpdir, 'value.json', {'a': 1})
+        self.assertEqual(cache.read_json(tmpdir, 'value.json'), {'a': 1})
+        cache.write_json(tmpdir, 'value.json', {'a': 2})
+        self.assertEqual(cache.read_json(tmpdir, 'value.json'), {'a': 2})
+
+    def test_read_corrupted(self):
+        tmpdir = mkdtemp(self)
+        with open(join(tmpdir, 'bad.json'), 'w') as fd:
+            fd.write('{')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            self.assertIsNone(cache.read_json(tmpdir, 'bad.json'))
+        self.assertIn('ignoring unreadable cache file', log.getvalue())
+
+    def test_cached(self):
+        tmpdir = mkdtemp(self)
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        self.assertEqual(
+            cache.cached(tmpdir, 'c.json', ['key'], factory), {'value': 1})
+        self.assertEqual(
+            cache.cached(tmpdir, 'c.json', ['key'], factory), {'value': 1})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            cache.cached(tmpdir, 'c.json', ['other'], factory), {'value': 2})
+        # a different working set invalidates everything.
+        self.assertEqual(cache.cached(
+            tmpdir, 'c.json', ['key'], factory, working_set=WorkingSet([])),
+            {'value': 3})
+        self.assertEqual(
+            len(cache.read_json(tmpdir, 'c.json')), 1)
+
+    def test_cached_stamps(self):
+        tmpdir = mkdtemp(self)
+        srcdir = mkdtemp(self)
+        target = join(srcdir, 'test_a.js')
+        with open(target, 'w'):
+            pass
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return {'test_a': target}
+
+        def stamp_paths(value):
+            return value.values()
+
+        cache.cached(tmpdir, 'c.json', 'k', factory, stamp_paths=stamp_paths)
+        cache.cached(tmpdir, 'c.json', 'k', factory, stamp_paths=stamp_paths)
+        self.assertEqual(len(calls), 1)
+
+        # simulate the addition of a new file to the directory.
+        os.utime(srcdir, (0, 0))
+        cache.cached(tmpdir, 'c.json', 'k', factory, stamp_paths=stamp_paths)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(exists(join(tmpdir, 'c.json')))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import unittest
+import codecs
+import json
+from os.path import join
+
+from calmjs.dev import chunks
+
+from calmjs.testing.utils import mkdtemp
+
+
+class ChunksTestCase(unittest.TestCase):
+
+    def test_encode_vlq(self):
+        self.assertEqual('A', chunks.encode_vlq(0))
+        self.assertEqual('C', chunks.encode_vlq(1))
+        self.assertEqual('D', chunks.encode_vlq(-1))
+        self.assertEqual('gB', chunks.encode_vlq(16))
+        self.assertEqual('2H', chunks.encode_vlq(123))
+
+    def test_split(self):
+        self.assertEqual(
+            [[1, 2], [3, 4], [5]], chunks.split([1, 2, 3, 4, 5], 3))
+        self.assertEqual([[1], [2]], chunks.split([1, 2], 4))
+        self.assertEqual([], chunks.split([], 2))
+
+    def test_build_chunk(self):
+        root = mkdtemp(self)
+        test_a = join(root, 'test_a.js')
+        test_b = join(root, 'test_b.js')
+        with codecs.open(test_a, 'w', encoding='utf8') as fd:
+            fd.write(u'var a = 1;\nvar b = "✓";\n')
+        with codecs.open(test_b, 'w', encoding='utf8') as fd:
+            fd.write(u'var c = 1;')
+        source, source_map = chunks.build_chunk(
+            [test_a, test_b], [test_b], join(root, 'out', 'chunk.js'))
+        self.assertEqual(source, (
+            u';\n'
+            u'var a = 1;\n'
+            u'var b = "✓";\n'
+            u';(function () {\n'
+            u'var c = 1;\n'
+            u'})();\n'
+            u'//# sourceMappingURL=chunk.js.map\n'
+        ))
+        self.assertEqual(source_map['sources'], [
+            join('..', 'test_a.js'), join('..', 'test_b.js')])
+        self.assertEqual(source_map['sourcesContent'][1], u'var c = 1;')
+        # the second line of test_a, then the first line of test_b.
+        self.assertEqual(source_map['mappings'], ';AAAA;AACA;;ACDA;')
+
+    def test_write_chunks(self):
+        root = mkdtemp(self)
+        paths = []
+        for idx in range(3):
+            paths.append(join(root, 'test_%d.js' % idx))
+            with open(paths[-1], 'w') as fd:
+                fd.write('var x = %d;\n' % idx)
+        results = chunks.write_chunks(root, 'karma.conf', paths, 2)
+        self.assertEqual(results, [
+            join(root, 'karma.conf.bundle0.js'),
+            join(root, 'karma.conf.bundle1.js'),
+        ])
+        with open(results[0]) as fd:
+            self.assertEqual(fd.read(), (
+                ';\nvar x = 0;\n;\nvar x = 1;\n'
+                '//# sourceMappingURL=karma.conf.bundle0.js.map\n'))
+        with open(results[1] + '.map') as fd:
+            self.assertEqual(json.load(fd)['file'], 'karma.conf.bundle1.js')
@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 import unittest
 import json
+import os
+import sys
 from os.path import basename
 from os.path import curdir
 from os.path import exists
+from os.path import getmtime
 from os.path import join
 from os.path import realpath
 
+from pkg_resources import resource_filename
+
 from calmjs.cli import node
 from calmjs.cli import get_node_version
 from calmjs.exc import ToolchainAbort
@@ -17,15 +22,74 @@ from calmjs.toolchain import AFTER_TEST
 from calmjs.utils import pretty_logging
 
 from calmjs.dev import cli
+from calmjs.dev import coverage
+from calmjs.dev import impact
+from calmjs.dev import pool
+from calmjs.dev import runtime
+from calmjs.dev import testcache
+from calmjs.dev import timing
+from calmjs.dev import utils
+from calmjs.dev.tests.test_pool import make_fake_browser
 
 from calmjs.testing import mocks
 from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import stub_mod_call
+from calmjs.testing.utils import stub_os_environ
 from calmjs.testing.utils import stub_base_which
+from calmjs.testing.utils import stub_item_attr_value
+from calmjs.testing.utils import stub_stdouts
 
 node_version = get_node_version()
 
 
+def make_fake_karma(
+        testcase, output='Connected on socket fake\n',
+        tail='time.sleep(30)\n'):
+    """
+    Create a fake karma executable that emits the output and then idle
+    like a persistent karma server would, unless a different tail is
+    provided.
+    """
+
+    target = join(mkdtemp(testcase), 'karma')
+    with open(target, 'w') as fd:
+        fd.write(
+            '#!%s\n'
+            'import sys, time\n'
+            'out = getattr(sys.stdout, "buffer", sys.stdout)\n'
+            'out.write(%r)\n'
+            'out.flush()\n'
+            '%s' % (sys.executable, output.encode('utf8'), tail)
+        )
+    os.chmod(target, 0o755)
+    return target
+
+
+def make_fake_istanbul(testcase):
+    """
+    Create a fake istanbul executable that produces the instrumented
+    file by prefixing the source with a comment, recording the sources
+    it was invoked with in the returned log file.
+    """
+
+    root = mkdtemp(testcase)
+    target = join(root, 'istanbul')
+    log = join(root, 'instrumented.log')
+    with open(target, 'w') as fd:
+        fd.write(
+            '#!%s\n'
+            'import sys\n'
+            'output, source = sys.argv[3], sys.argv[4]\n'
+            'with open(%r, "a") as fd:\n'
+            '    fd.write(source + "\\n")\n'
+            'with open(source) as src, open(output, "w") as fd:\n'
+            '    fd.write("/* instrumented */" + src.read())\n'
+            % (sys.executable, log)
+        )
+    os.chmod(target, 0o755)
+    return target, log
+
+
 class KarmaDriverTestSpecTestCase(unittest.TestCase):
     """
     Test the basic test_spec method, which accepts the spec to prepare
@@ -162,6 +226,677 @@ class KarmaDriverTestSpecTestCase(unittest.TestCase):
         driver.create_config(spec)
         self.assertEqual(spec['karma_config']['files'], [])
 
+    def test_create_config_persistent_server(self):
+        spec = Spec(karma_persistent_server=True)
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        self.assertFalse(spec['karma_config']['singleRun'])
+        self.assertFalse(spec['karma_config']['autoWatch'])
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_persistent_server_start_reuse(self):
+        stub_mod_call(self, cli)
+        build_dir = mkdtemp(self)
+        listening = []
+        stub_item_attr_value(
+            self, utils, 'check_port', lambda *a, **kw: bool(listening))
+        driver = cli.KarmaDriver(binary=make_fake_karma(self))
+        self.addCleanup(driver.stop_servers)
+
+        spec = Spec(build_dir=build_dir, karma_persistent_server=True)
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        driver.test_spec(spec)
+        self.assertEqual(list(driver.servers), [9876])
+        server = driver.servers[9876]
+        self.assertIsNone(server.poll())
+        args = self.call_args[0][0]
+        self.assertEqual(args[1:], [
+            'run', join(build_dir, 'karma.conf.js'), '--port', '9876',
+            '--color',
+        ])
+        self.assertTrue(exists(join(build_dir, 'karma.server.json')))
+
+        # the running server is reused for the identical configuration.
+        listening.append(True)
+        spec = Spec(build_dir=build_dir, karma_persistent_server=True)
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.test_spec(spec)
+        self.assertIn('reusing karma server', log.getvalue())
+        self.assertIs(driver.servers[9876], server)
+
+        driver.stop_servers()
+        self.assertEqual(driver.servers, {})
+        self.assertIsNotNone(server.poll())
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_persistent_server_early_exit(self):
+        stub_mod_call(self, cli)
+        stub_item_attr_value(self, utils, 'check_port', lambda *a, **kw: 0)
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='Failed\n', tail='sys.exit(1)\n'))
+        spec = Spec(build_dir=build_dir, karma_persistent_server=True)
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        with self.assertRaises(ToolchainAbort):
+            driver.test_spec(spec)
+        self.assertNotIn('karma_return_code', spec)
+
+    def test_persistent_server_port_conflict(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        stub_item_attr_value(self, utils, 'check_port', lambda *a, **kw: 1)
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver.create()
+        spec = Spec(build_dir=build_dir, karma_persistent_server=True)
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        with self.assertRaises(ToolchainAbort):
+            driver.test_spec(spec)
+        self.assertIsNone(self.call_args)
+
+    def test_persistent_server_requires_build_dir(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        driver = cli.KarmaDriver.create()
+        spec = Spec(karma_persistent_server=True)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.run(NullToolchain(), spec)
+        self.assertIn(
+            'persistent karma server requires a build directory',
+            log.getvalue())
+        self.assertNotIn('karma_persistent_server', spec)
+        self.assertEqual(self.call_args[0][0][1], 'start')
+        self.assertEqual(driver.servers, {})
+
+    def test_run_profile(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        stub_stdouts(self)
+        trace = join(mkdtemp(self), 'trace.json')
+        driver = cli.KarmaDriver.create()
+        spec = Spec(build_dir=mkdtemp(self), karma_profile_trace=trace)
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            driver.run(NullToolchain(), spec)
+        self.assertIn('time spent in phases:', sys.stdout.getvalue())
+        with open(trace) as fd:
+            names = [e['name'] for e in json.load(fd)['traceEvents']]
+        for name in (
+                'run', 'prepare_run', 'toolchain', 'create_config',
+                'write_config', 'karma', 'test', 'link'):
+            self.assertIn(name, names)
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_stop_recorded_server(self):
+        stub_mod_call(self, cli)
+        build_dir = mkdtemp(self)
+        stub_item_attr_value(
+            self, utils, 'check_port', lambda *a, **kw: False)
+        driver = cli.KarmaDriver(binary=make_fake_karma(self))
+        self.addCleanup(driver.stop_servers)
+        spec = Spec(build_dir=build_dir, karma_persistent_server=True)
+        driver.run(NullToolchain(), spec)
+        server = driver.servers[9876]
+        self.assertIsNone(server.poll())
+
+        spec = Spec(build_dir=build_dir, karma_stop_server=True)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.run(NullToolchain(), spec)
+        self.assertIn('stopping persistent karma server', log.getvalue())
+        self.assertNotIn('link', spec)
+        self.assertIsNotNone(server.poll())
+        self.assertFalse(exists(join(build_dir, 'karma.server.json')))
+
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.run(NullToolchain(), spec)
+            driver.run(NullToolchain(), Spec(karma_stop_server=True))
+        self.assertIn('no persistent karma server recorded', log.getvalue())
+        self.assertIn('requires the build directory', log.getvalue())
+
+    def test_write_config_shards(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_shards=2,
+            artifact_paths=['artifact.js'],
+            test_module_paths_map={
+                'test_a': 'test_a.js', 'test_b': 'test_b.js',
+                'test_c': 'test_c.js',
+            },
+            karma_config={
+                'port': 9000,
+                'files': ['src.js', 'test_a.js', 'test_b.js', 'test_c.js'],
+                'coverageReporter': {
+                    'dir': 'coverage',
+                    'reporters': [{'type': 'json', 'file': 'coverage/c.json'}],
+                },
+            },
+        )
+        driver.write_config(spec)
+        self.assertEqual(spec['karma_shard_config_paths'], [
+            join(build_dir, 'karma.conf.shard0.js'),
+            join(build_dir, 'karma.conf.shard1.js'),
+        ])
+        configs = []
+        for path in spec['karma_shard_config_paths']:
+            with open(path) as fd:
+                configs.append(json.loads(fd.read()[
+                    len('module.exports = function(config) {\n'
+                        '    config.set('):-len(');\n}\n')]))
+
+        self.assertEqual(configs[0]['files'], [
+            'artifact.js', 'src.js', 'test_a.js', 'test_c.js'])
+        self.assertEqual(configs[1]['files'], [
+            'artifact.js', 'src.js', 'test_b.js'])
+        self.assertEqual([c['port'] for c in configs], [9000, 9001])
+        self.assertEqual(configs[1]['coverageReporter'], {
+            'dir': realpath(join(build_dir, 'coverage.shards')),
+            'reporters': [{'type': 'json', 'file': 'coverage-shard1.json'}],
+        })
+
+    def test_merge_shard_coverage(self):
+        stub_base_which(self)
+        stub_mod_call(self, cli)
+        build_dir = mkdtemp(self)
+        report_dir = join(mkdtemp(self), 'coverage')
+        raw_dir = join(mkdtemp(self), 'raw')
+        shard_dir = join(build_dir, 'coverage.shards', 'PhantomJS')
+        os.makedirs(shard_dir)
+        for idx in range(2):
+            shard_fn = join(shard_dir, 'coverage-shard%d.json' % idx)
+            with open(shard_fn, 'w') as fd:
+                json.dump({'a.js': {'s': {'1': idx + 1}}}, fd)
+        spec = Spec(
+            build_dir=build_dir, coverage_enable=True, cover_raw_dir=raw_dir,
+            cover_report_dir=report_dir, coverage_type='lcovonly')
+        driver = cli.KarmaDriver()
+        driver._merge_shard_coverage(spec)
+        self.assertFalse(exists(join(build_dir, 'coverage.shards')))
+        self.assertTrue(exists(join(report_dir, 'coverage.lcov')))
+        self.assertFalse(exists(join(report_dir, 'coverage.json')))
+        driver.collect_raw_coverage(spec)
+        raw_paths = coverage.find_coverage_files([raw_dir])
+        self.assertEqual(len(raw_paths), 1)
+        with open(raw_paths[0]) as fd:
+            self.assertEqual(json.load(fd)['a.js']['s'], {'1': 3})
+
+    def test_shards_persistent_server(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        driver = cli.KarmaDriver.create()
+        spec = Spec(
+            build_dir=mkdtemp(self), karma_persistent_server=True,
+            karma_shards=2)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.run(NullToolchain(), spec)
+        self.assertIn(
+            'persistent karma server will not be used', log.getvalue())
+        self.assertNotIn('karma_persistent_server', spec)
+
+    def test_write_config_shards_insufficient(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_shards=4,
+            test_module_paths_map={'test_a': 'test_a.js'},
+            karma_config={'files': ['test_a.js']},
+        )
+        driver.write_config(spec)
+        self.assertEqual(spec['karma_shard_config_paths'], [])
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_run_shards_merged_return_code(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='ran shard\n',
+            tail='sys.exit(3 if "shard1" in sys.argv[2] else 0)\n',
+        ))
+        spec = Spec(
+            build_dir=build_dir, karma_shards=3,
+            test_module_paths_map={
+                'test_a': 'test_a.js', 'test_b': 'test_b.js',
+                'test_c': 'test_c.js',
+            },
+        )
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        driver.test_spec(spec)
+        self.assertEqual(spec['karma_shard_return_codes'], [0, 3, 0])
+        self.assertEqual(spec['karma_return_code'], 3)
+        self.assertEqual(sys.stdout.getvalue().count('ran shard'), 3)
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_karma_results_collected(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output=(
+                u'  Suite\n'
+                u'    \u2713 passes (5ms)\n'
+                u'Executed 1 of 1 SUCCESS\n'
+            ),
+            tail='sys.exit(0)\n',
+        ))
+        spec = Spec(build_dir=build_dir)
+        driver.setup_toolchain_spec(NullToolchain(), spec)
+        driver.test_spec(spec)
+        self.assertEqual(spec['karma_return_code'], 0)
+        self.assertEqual(spec['karma_results'], {
+            'tests': [{
+                'suite': ['Suite'], 'name': 'passes', 'status': 'success',
+                'duration': 5,
+            }],
+            'summary': {'executed': 1, 'total': 1, 'failed': 0, 'skipped': 0},
+        })
+        self.assertIn('Executed 1 of 1 SUCCESS', sys.stdout.getvalue())
+
+    def test_create_config_timing(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(build_dir=build_dir, karma_slowest=3)
+        driver.create_config(spec)
+        config = spec['karma_config']
+        self.assertEqual(
+            config['plugins'], ['karma-*', timing.get_timing_reporter_path()])
+        self.assertIn('calmjs-timing', config['reporters'])
+        self.assertEqual(config['calmjsTimingReporter'], {
+            'outputFile': join(build_dir, 'karma.conf.timings.json')})
+
+        # not enabled without either a cache dir or slowest report.
+        spec = Spec(build_dir=build_dir)
+        driver.create_config(spec)
+        self.assertNotIn('calmjsTimingReporter', spec['karma_config'])
+
+    def test_write_config_shards_weighted(self):
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        timing.save_store(cache_dir, {'files': {
+            'test_a.js': [50.0, 1], 'test_b.js': [10.0, 1],
+            'test_c.js': [30.0, 1],
+        }})
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, cache_dir=cache_dir, karma_shards=2,
+            test_module_paths_map={
+                'test_a': 'test_a.js', 'test_b': 'test_b.js',
+                'test_c': 'test_c.js',
+            },
+            karma_config={
+                'files': ['test_a.js', 'test_b.js', 'test_c.js'],
+                'calmjsTimingReporter': {'outputFile': 'timings.json'},
+            },
+        )
+        driver.write_config(spec)
+        configs = []
+        for path in spec['karma_shard_config_paths']:
+            with open(path) as fd:
+                configs.append(json.loads(fd.read()[
+                    len('module.exports = function(config) {\n'
+                        '    config.set('):-len(');\n}\n')]))
+        self.assertEqual(configs[0]['files'], ['test_a.js'])
+        self.assertEqual(configs[1]['files'], ['test_b.js', 'test_c.js'])
+        self.assertEqual(configs[1]['calmjsTimingReporter'], {
+            'outputFile': join(build_dir, 'karma.conf.shard1.timings.json')})
+
+    def test_write_config_bundle_tests(self):
+        build_dir = mkdtemp(self)
+        test_dir = mkdtemp(self)
+        paths = {}
+        for name in ('test_a', 'test_b', 'test_c', 'helper'):
+            paths[name] = join(test_dir, name + '.js')
+            with open(paths[name], 'w') as fd:
+                fd.write('var %s = 1;\n' % name)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_bundle_tests=2,
+            test_module_paths_map=paths,
+            karma_config={
+                'files': ['src.js', paths['helper'], paths['test_a'],
+                          paths['test_b'], paths['test_c']],
+                'preprocessors': {
+                    'src.js': ['coverage'], paths['test_a']: ['wrap']},
+            },
+        )
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.write_config(spec)
+        self.assertIn(
+            'bundled 4 test modules into 2 chunk files', log.getvalue())
+        with open(spec['karma_config_path']) as fd:
+            config = json.loads(fd.read()[
+                len('module.exports = function(config) {\n'
+                    '    config.set('):-len(');\n}\n')])
+        chunk0 = join(build_dir, 'karma.conf.bundle0.js')
+        chunk1 = join(build_dir, 'karma.conf.bundle1.js')
+        self.assertEqual(config['files'], [
+            'src.js', chunk0, chunk1,
+            {'pattern': chunk0 + '.map', 'included': False, 'watched': False},
+            {'pattern': chunk1 + '.map', 'included': False, 'watched': False},
+        ])
+        self.assertEqual(config['preprocessors'], {'src.js': ['coverage']})
+        with open(chunk0) as fd:
+            self.assertEqual(fd.read(), (
+                ';\n'
+                'var helper = 1;\n'
+                ';(function () {\n'
+                'var test_a = 1;\n'
+                '})();\n'
+                '//# sourceMappingURL=karma.conf.bundle0.js.map\n'
+            ))
+        # the config in the spec retains the test modules.
+        self.assertIn(paths['test_c'], spec['karma_config']['files'])
+
+        spec['karma_shards'] = 2
+        driver.write_config(spec)
+        self.assertTrue(exists(
+            join(build_dir, 'karma.conf.shard0.bundle0.js')))
+        self.assertTrue(exists(
+            join(build_dir, 'karma.conf.shard1.bundle0.js')))
+
+    def test_write_config_compact(self):
+        build_dir = mkdtemp(self)
+        test_dir = mkdtemp(self)
+        test_paths = []
+        for name in ('test_a.js', 'test_b.js'):
+            test_paths.append(join(test_dir, name))
+            with open(test_paths[-1], 'w'):
+                pass
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_compact_config=True, karma_shards=2,
+            test_module_paths_map={
+                'test_a': test_paths[0], 'test_b': test_paths[1]},
+            karma_config={
+                'port': 9000,
+                'files': ['src.js'] + test_paths,
+                'preprocessors': {path: ['wrap'] for path in test_paths},
+            },
+        )
+        driver.write_config(spec)
+        with open(join(build_dir, 'karma.conf.files.json')) as fd:
+            self.assertEqual(json.load(fd), {
+                'files': ['src.js', join(test_dir, '*.js')],
+                'preprocessors': {join(test_dir, '*.js'): ['wrap']},
+            })
+        with open(spec['karma_config_path']) as fd:
+            config_js = fd.read()
+        self.assertIn("require(\"./karma.conf.files.json\")", config_js)
+        self.assertIn('"port": 9000', config_js)
+        self.assertNotIn('test_a.js', config_js)
+        # the shards have their own manifests.
+        with open(join(build_dir, 'karma.conf.shard0.files.json')) as fd:
+            self.assertEqual(json.load(fd)['files'], [
+                'src.js', test_paths[0]])
+
+        # the config changes along with the manifest.
+        os.utime(spec['karma_config_path'], (1000, 1000))
+        driver.write_config(spec)
+        self.assertEqual(getmtime(spec['karma_config_path']), 1000)
+        spec['karma_config']['files'] = ['src.js']
+        driver.write_config(spec)
+        self.assertNotEqual(getmtime(spec['karma_config_path']), 1000)
+
+    def test_write_config_bundle_tests_covered(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_bundle_tests=2, cover_test=True,
+            test_module_paths_map={'test_a': 'test_a.js'},
+            karma_config={'files': ['test_a.js']},
+        )
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.write_config(spec)
+        self.assertIn('test modules are not bundled', log.getvalue())
+        self.assertFalse(exists(join(build_dir, 'karma.conf.bundle0.js')))
+
+    def test_record_timings(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        test_a = join(build_dir, 'test_a.js')
+        with open(test_a, 'w') as fd:
+            fd.write("describe('Suite', function() {});\n")
+        with open(join(build_dir, 'karma.conf.timings.json'), 'w') as fd:
+            json.dump([{
+                'browser': 'PhantomJS', 'suite': ['Suite'], 'name': 'slow',
+                'duration': 12, 'status': 'success',
+            }], fd)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            build_dir=build_dir, karma_slowest=5,
+            test_module_paths_map={'test_a': test_a},
+        )
+        driver.record_timings(spec)
+        self.assertEqual(len(spec['karma_timings']), 1)
+        self.assertEqual(timing.load_store(build_dir)['files'], {
+            test_a: [12.0, 1]})
+        self.assertIn('12.0ms  Suite > slow', sys.stdout.getvalue())
+
+    def test_record_timings_missing(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(build_dir=build_dir, karma_slowest=5)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.record_timings(spec)
+        self.assertIn('no timings reported', log.getvalue())
+        self.assertEqual(spec['karma_timings'], [])
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_skip_unchanged_artifacts(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        artifact = join(mkdtemp(self), 'artifact.js')
+        with open(artifact, 'w') as fd:
+            fd.write('var artifact = 1;')
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='ran karma\n', tail='sys.exit(0)\n'))
+
+        def run():
+            spec = Spec(
+                build_dir=build_dir, artifact_paths=[artifact],
+                karma_skip_unchanged_artifacts=True)
+            runtime.prepare_spec_artifacts(spec)
+            driver.setup_toolchain_spec(NullToolchain(), spec)
+            with pretty_logging(
+                    logger='calmjs.dev', stream=mocks.StringIO()) as log:
+                driver.test_spec(spec)
+            return spec, log.getvalue()
+
+        spec, log = run()
+        self.assertNotIn('karma_skipped', spec)
+        spec, log = run()
+        self.assertTrue(spec['karma_skipped'])
+        self.assertEqual(spec['karma_return_code'], 0)
+        self.assertIn('against identical artifacts', log)
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 1)
+
+        with open(artifact, 'w') as fd:
+            fd.write('var artifact = 2;')
+        spec, log = run()
+        self.assertNotIn('karma_skipped', spec)
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 2)
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_test_cache(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        root = mkdtemp(self)
+        test_a = join(root, 'test_a.js')
+        test_b = join(root, 'test_b.js')
+        for path in (test_a, test_b):
+            with open(path, 'w') as fd:
+                fd.write('var test = 1;')
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='ran karma\n', tail='sys.exit(0)\n'))
+
+        def run(**kw):
+            spec = Spec(
+                build_dir=build_dir, cache_dir=cache_dir,
+                test_module_paths_map={'test_a': test_a, 'test_b': test_b},
+                **kw)
+            driver.setup_toolchain_spec(NullToolchain(), spec)
+            with pretty_logging(
+                    logger='calmjs.dev', stream=mocks.StringIO()) as log:
+                driver.test_spec(spec)
+            return spec, log.getvalue()
+
+        spec, log = run()
+        self.assertEqual(spec['karma_test_cached'], [])
+        self.assertEqual(sorted(spec['karma_test_fingerprints']), [
+            'test_a', 'test_b'])
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 1)
+
+        spec, log = run()
+        self.assertEqual(spec['karma_test_cached'], ['test_a', 'test_b'])
+        self.assertEqual(spec['karma_return_code'], 0)
+        self.assertIn('skipping 2 of 2 test modules', log)
+        self.assertIn('all selected test modules have passed', log)
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 1)
+
+        with open(test_b, 'w') as fd:
+            fd.write('var test = 2;')
+        spec, log = run()
+        self.assertEqual(spec['karma_test_cached'], ['test_a'])
+        self.assertEqual(spec['karma_config']['files'], [test_b])
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 2)
+
+        spec, log = run(test_no_cache=True)
+        self.assertNotIn('karma_test_cached', spec)
+        self.assertEqual(spec['karma_config']['files'], [test_a, test_b])
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 3)
+
+        # a change to the configuration invalidates every test module.
+        spec, log = run(karma_browsers=['Other'])
+        self.assertEqual(spec['karma_test_cached'], [])
+        self.assertEqual(sys.stdout.getvalue().count('ran karma'), 4)
+
+    def test_record_test_cache_failures(self):
+        cache_dir = mkdtemp(self)
+        root = mkdtemp(self)
+        test_module_paths_map = {}
+        for name in ('test_a', 'test_b'):
+            test_module_paths_map[name] = join(root, name + '.js')
+            with open(test_module_paths_map[name], 'w') as fd:
+                fd.write("describe('%s', function() {});\n" % name)
+        driver = cli.KarmaDriver()
+        spec = Spec(
+            cache_dir=cache_dir, karma_return_code=1,
+            test_module_paths_map=test_module_paths_map,
+            karma_test_fingerprints={'test_a': 'a', 'test_b': 'b'},
+            karma_results={'tests': [
+                {'suite': ['test_a'], 'name': 'a', 'status': 'success'},
+                {'suite': ['test_b'], 'name': 'b', 'status': 'failed'},
+            ]},
+        )
+        driver.record_test_cache(spec)
+        self.assertEqual(testcache.load_cache(cache_dir), {'test_a': 'a'})
+
+        # failures that cannot be attributed leave nothing as passed.
+        spec['karma_results']['tests'].append(
+            {'suite': ['unknown'], 'name': 'c', 'status': 'failed'})
+        spec['karma_test_fingerprints'] = {'test_a': 'a2', 'test_b': 'b'}
+        driver.record_test_cache(spec)
+        self.assertEqual(testcache.load_cache(cache_dir), {'test_a': 'a'})
+
+    def test_write_config_unchanged(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        spec = Spec(build_dir=build_dir, karma_config={'files': ['a.js']})
+        driver.write_config(spec)
+        os.utime(spec['karma_config_path'], (1000, 1000))
+        driver.write_config(spec)
+        self.assertEqual(getmtime(spec['karma_config_path']), 1000)
+        spec['karma_config']['files'] = ['b.js']
+        driver.write_config(spec)
+        self.assertNotEqual(getmtime(spec['karma_config_path']), 1000)
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_reuse_build(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        source = join(mkdtemp(self), 'mod.js')
+        with open(source, 'w') as fd:
+            fd.write('var mod = 1;')
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='', tail='sys.exit(0)\n'))
+
+        def run(**kw):
+            spec = Spec(
+                build_dir=build_dir, karma_reuse_build=True,
+                transpile_source_map={'mod': source}, **kw)
+            driver.run(NullToolchain(), spec)
+            return spec
+
+        first = run()
+        self.assertEqual(first['link'], 'linked')
+        self.assertTrue(exists(join(build_dir, 'karma.build.json')))
+
+        second = run()
+        self.assertNotIn('link', second)
+        self.assertEqual(second['karma_return_code'], 0)
+        self.assertEqual(second['karma_config'], first['karma_config'])
+        self.assertEqual(second['transpiled_targets'], {'mod': 'mod.js'})
+
+        # different inputs
+        self.assertEqual(run(karma_browsers=['Firefox'])['link'], 'linked')
+        # the build for the original inputs must be rebuilt.
+        self.assertEqual(run()['link'], 'linked')
+        self.assertNotIn('link', run())
+
+        # changed source file
+        with open(source, 'w') as fd:
+            fd.write('var mod = 2;')
+        self.assertEqual(run()['link'], 'linked')
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_reuse_build_test_module_added(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        test_dir = mkdtemp(self)
+        test_module = join(test_dir, 'test_mod.js')
+        with open(test_module, 'w') as fd:
+            fd.write('var test = 1;')
+        # ensure the addition of a file is reflected by the mtime.
+        os.utime(test_dir, (1000, 1000))
+        driver = cli.KarmaDriver(binary=make_fake_karma(
+            self, output='', tail='sys.exit(0)\n'))
+
+        def run():
+            spec = Spec(
+                build_dir=build_dir, karma_reuse_build=True,
+                test_module_paths_map={'test_mod': test_module})
+            driver.run(NullToolchain(), spec)
+            return spec
+
+        self.assertEqual(run()['link'], 'linked')
+        self.assertNotIn('link', run())
+
+        with open(join(test_dir, 'test_other.js'), 'w') as fd:
+            fd.write('var test = 2;')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            self.assertEqual(run()['link'], 'linked')
+        self.assertIn('directories changed since previous build',
+                      log.getvalue())
+        self.assertNotIn('link', run())
+
+    def test_reuse_build_requires_build_dir(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        driver = cli.KarmaDriver.create()
+        spec = Spec(karma_reuse_build=True)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.run(NullToolchain(), spec)
+        self.assertIn('requires a build directory', log.getvalue())
+        self.assertEqual(spec['link'], 'linked')
+
     def test_apply_wrap_tests(self):
         driver = cli.KarmaDriver()
         spec = Spec(
@@ -243,6 +978,343 @@ class KarmaDriverTestSpecTestCase(unittest.TestCase):
             log.getvalue(),
         )
 
+    def test_create_config_changed_files(self):
+        main = resource_filename('calmjs.dev', 'main.js')
+        spec = Spec(
+            test_package_names=['calmjs.dev'],
+            calmjs_test_registry_names=['calmjs.dev.module.tests'],
+            karma_source_map_keys=['transpile_source_map'],
+            transpile_source_map={'calmjs/dev/main': main},
+        )
+        driver = cli.KarmaDriver()
+        spec['test_changed_files'] = [join(mkdtemp(self), 'unrelated.js')]
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertEqual(spec['karma_config']['files'], [])
+        self.assertIn('selected 0 of 2 test modules', log.getvalue())
+
+        # the tests share the namespace of the changed module.
+        spec['test_changed_files'] = [main]
+        driver.create_config(spec)
+        self.assertEqual(
+            sorted(basename(i) for i in spec['karma_config']['files']),
+            ['test_fail.js', 'test_main.js'],
+        )
+
+    def test_create_config_test_impact(self):
+        build_dir = mkdtemp(self)
+        spec = Spec(
+            build_dir=build_dir, coverage_enable=True, test_impact_index=True,
+            transpiled_targets={'pkg/mod': 'mod.js'},
+            karma_spec_keys=['transpiled_targets'],
+            test_module_paths_map={'pkg/tests/test_mod': 'test_mod.js'},
+        )
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        config = spec['karma_config']
+        self.assertEqual(config['files'], [
+            'mod.js', impact.get_impact_hooks_path(), 'test_mod.js'])
+        self.assertIn('calmjs-impact', config['reporters'])
+        self.assertIn(impact.get_impact_reporter_path(), config['plugins'])
+        self.assertEqual(config['calmjsImpactReporter'], {
+            'outputFile': join(build_dir, 'karma.conf.impact.json')})
+
+        spec = Spec(
+            build_dir=build_dir, test_impact_index=True,
+            test_module_paths_map={'pkg/tests/test_mod': 'test_mod.js'},
+        )
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertEqual(spec['karma_config']['files'], ['test_mod.js'])
+        self.assertIn('only be recorded with coverage', log.getvalue())
+
+    def test_create_config_browser_pool(self):
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        stub_os_environ(self)
+        os.environ['CHROME_BIN'] = make_fake_browser(self)
+        spec = Spec(
+            build_dir=build_dir, cache_dir=cache_dir, karma_browser_pool=2,
+            karma_shards=2,
+            test_module_paths_map={
+                'test_a': 'test_a.js', 'test_b': 'test_b.js'},
+        )
+        driver = cli.KarmaDriver()
+        self.addCleanup(pool.BrowserPool(
+            join(cache_dir, pool.BROWSER_POOL_CACHE)).stop)
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            driver.create_config(spec)
+        config = spec['karma_config']
+        endpoints = spec['karma_browser_pool_endpoints']
+        self.assertEqual(2, len(endpoints))
+        self.assertEqual(config['browsers'], ['CalmjsPool'])
+        self.assertIn(pool.get_pool_launcher_path(), config['plugins'])
+        self.assertEqual(
+            config['calmjsBrowserPool'], {'endpoint': endpoints[0]})
+
+        driver.write_config(spec)
+        configs = []
+        for path in spec['karma_shard_config_paths']:
+            with open(path) as fd:
+                configs.append(json.loads(fd.read()[
+                    len('module.exports = function(config) {\n'
+                        '    config.set('):-len(');\n}\n')]))
+        self.assertEqual(
+            [c['calmjsBrowserPool']['endpoint'] for c in configs], endpoints)
+
+        # a pool size of zero stops the pooled browsers.
+        spec = Spec(
+            build_dir=build_dir, cache_dir=cache_dir, karma_browser_pool=0,
+            test_module_paths_map={'test_a': 'test_a.js'},
+        )
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            driver.create_config(spec)
+        self.assertNotIn('calmjsBrowserPool', spec['karma_config'])
+        self.assertEqual([], pool.BrowserPool(
+            join(cache_dir, pool.BROWSER_POOL_CACHE)).load())
+
+    def test_create_config_browser_pool_no_cache_dir(self):
+        spec = Spec(
+            build_dir=mkdtemp(self), karma_browser_pool=1,
+            test_module_paths_map={'test_a': 'test_a.js'},
+        )
+        driver = cli.KarmaDriver()
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertNotIn('calmjsBrowserPool', spec['karma_config'])
+        self.assertIn('requires a cache directory', log.getvalue())
+
+    def test_record_impact(self):
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        test_dir = mkdtemp(self)
+        test_paths = {}
+        for name in ('mod', 'other', 'skipped'):
+            test_paths['pkg/tests/test_' + name] = path = join(
+                test_dir, 'test_%s.js' % name)
+            with open(path, 'w') as fd:
+                fd.write("describe('%s suite', function() {});" % name)
+        spec = Spec(
+            build_dir=build_dir, cache_dir=cache_dir, coverage_enable=True,
+            test_impact_index=True,
+            transpiled_targets={'pkg/mod': 'mod.js', 'pkg/util': 'util.js'},
+            karma_spec_keys=['transpiled_targets'],
+            test_module_paths_map=test_paths,
+            karma_config={'files': [
+                'mod.js', 'util.js', test_paths['pkg/tests/test_mod'],
+                test_paths['pkg/tests/test_other'],
+            ]},
+        )
+        with open(join(build_dir, 'karma.conf.impact.json'), 'w') as fd:
+            json.dump({
+                'mod suite': [
+                    join(build_dir, 'mod.js'), join(build_dir, 'util.js')],
+                'unknown suite': [join(build_dir, 'mod.js')],
+            }, fd)
+        driver = cli.KarmaDriver()
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.record_impact(spec)
+        self.assertIn('executed by 2 test modules', log.getvalue())
+        index = impact.load_index(cache_dir)
+        self.assertEqual(index['tests'], [
+            'pkg/tests/test_mod', 'pkg/tests/test_other'])
+        self.assertEqual(impact.decode_index(index), {
+            'pkg/mod': set(['pkg/tests/test_mod']),
+            'pkg/util': set(['pkg/tests/test_mod']),
+        })
+
+        # selection through the index with the changed files.
+        spec['test_changed_files'] = [join(build_dir, 'util.js')]
+        spec['karma_source_map_keys'] = ['transpiled_targets']
+        spec['transpiled_targets'] = {
+            'pkg/mod': join(build_dir, 'mod.js'),
+            'pkg/util': join(build_dir, 'util.js'),
+        }
+        self.assertEqual(
+            sorted(driver._select_test_modules(spec, test_paths)),
+            ['pkg/tests/test_mod', 'pkg/tests/test_skipped'])
+
+    def test_create_config_multiple_packages(self):
+        spec = Spec(
+            test_package_names=['calmjs.dev', 'calmjs'],
+            calmjs_test_registry_names=['calmjs.dev.module.tests'],
+        )
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        self.assertEqual(spec['karma_package_test_modules'], {
+            'calmjs': [],
+            'calmjs.dev': [
+                'calmjs/dev/tests/test_fail', 'calmjs/dev/tests/test_main'],
+        })
+        self.assertEqual(sorted(spec['test_module_paths_map']), [
+            'calmjs/dev/tests/test_fail', 'calmjs/dev/tests/test_main'])
+
+        # not tracked for a single package.
+        spec = Spec(
+            test_package_names=['calmjs.dev'],
+            calmjs_test_registry_names=['calmjs.dev.module.tests'],
+        )
+        driver.create_config(spec)
+        self.assertNotIn('karma_package_test_modules', spec)
+
+    def test_select_test_modules_dependent_packages(self):
+        root = mkdtemp(self)
+        paths = {}
+        for name in ('mod', 'tests/test_a', 'tests/test_b', 'tests/test_c'):
+            paths[name] = join(root, name.replace('/', '_') + '.js')
+            with open(paths[name], 'w') as fd:
+                fd.write("require('pkg/mod');")
+
+        class Resolver(object):
+            dependents = {'pkg/mod': set(['pkg.a'])}
+
+            def module_dependents(self, pkg_names, registry_names, modnames):
+                if any(modname not in self.dependents for modname in modnames):
+                    return None
+                return set().union(*(
+                    self.dependents[modname] for modname in modnames))
+
+        test_paths = {
+            'a/tests/test_a': paths['tests/test_a'],
+            'b/tests/test_b': paths['tests/test_b'],
+            'c/tests/test_c': paths['tests/test_c'],
+        }
+        spec = Spec(
+            dist_resolver=Resolver(),
+            karma_package_test_modules={
+                'pkg.a': ['a/tests/test_a'],
+                'pkg.b': ['b/tests/test_b'],
+                'pkg.c': ['c/tests/test_c'],
+            },
+            karma_source_map_keys=['transpiled_targets'],
+            transpiled_targets={'pkg/mod': paths['mod']},
+            test_changed_files=[paths['mod'], paths['tests/test_c']],
+        )
+        self.assertIs(cli.get_resolver(spec), spec['dist_resolver'])
+        driver = cli.KarmaDriver()
+        # the test modules of the packages that do not depend on the
+        # changed module are not selected, unless they were changed.
+        self.assertEqual(
+            sorted(driver._select_test_modules(spec, test_paths)),
+            ['a/tests/test_a', 'c/tests/test_c'])
+
+        # every test module is considered for the changed modules that
+        # are not declared by any of the packages.
+        spec['dist_resolver'].dependents = {}
+        self.assertEqual(
+            sorted(driver._select_test_modules(spec, test_paths)),
+            ['a/tests/test_a', 'b/tests/test_b', 'c/tests/test_c'])
+
+    def test_record_package_results(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        test_dir = mkdtemp(self)
+        test_paths = {}
+        for name in ('a', 'b'):
+            test_paths['pkg/%s/tests/test_%s' % (name, name)] = path = join(
+                test_dir, 'test_%s.js' % name)
+            with open(path, 'w') as fd:
+                fd.write("describe('%s suite', function() {});" % name)
+
+        spec = Spec(
+            build_dir=build_dir,
+            test_module_paths_map=test_paths,
+            karma_package_test_modules={
+                'pkg.a': ['pkg/a/tests/test_a'],
+                'pkg.b': ['pkg/b/tests/test_b'],
+                'pkg.c': [],
+            },
+            karma_return_code=1,
+            karma_results={'tests': [
+                {'suite': ['a suite'], 'name': 'x', 'status': 'success'},
+                {'suite': ['a suite', 'n'], 'name': 'y', 'status': 'skipped'},
+                {'suite': ['b suite'], 'name': 'x', 'status': 'success'},
+                {'suite': ['b suite'], 'name': 'y', 'status': 'failed'},
+                {'suite': ['unknown'], 'name': 'z', 'status': 'failed'},
+            ]},
+        )
+        driver = cli.KarmaDriver()
+        driver.record_package_results(spec)
+        self.assertEqual(spec['karma_package_results'], {
+            'pkg.a': {
+                'success': 1, 'failed': 0, 'skipped': 1, 'return_code': 0},
+            'pkg.b': {
+                'success': 1, 'failed': 1, 'skipped': 0, 'return_code': 1},
+            'pkg.c': {
+                'success': 0, 'failed': 0, 'skipped': 0, 'return_code': 0},
+        })
+        self.assertIn('pkg.b: FAILED', sys.stdout.getvalue())
+
+        # failures that cannot be attributed apply to every package.
+        spec['karma_results'] = {'tests': []}
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.record_package_results(spec)
+        self.assertIn('cannot be attributed', log.getvalue())
+        self.assertEqual(set(
+            result['return_code']
+            for result in spec['karma_package_results'].values()
+        ), set([1]))
+
+    def test_record_package_results_coverage(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        staging_dir = join(build_dir, 'coverage.raw', 'PhantomJS')
+        os.makedirs(staging_dir)
+        main = join(build_dir, 'calmjs', 'dev', 'main.js')
+        with open(join(staging_dir, 'coverage.json'), 'w') as fd:
+            json.dump({main: {'s': {'1': 1, '2': 0}}}, fd)
+        spec = Spec(
+            build_dir=build_dir, coverage_enable=True, cover_native=True,
+            calmjs_module_registry_names=['calmjs.dev.module'],
+            transpiled_targets={'calmjs/dev/main': 'calmjs/dev/main.js'},
+            karma_spec_keys=['transpiled_targets'],
+            karma_package_test_modules={'calmjs.dev': [], 'calmjs': []},
+            karma_return_code=0,
+            karma_results={'tests': []},
+        )
+        driver = cli.KarmaDriver()
+        driver.record_package_results(spec)
+        results = spec['karma_package_results']
+        self.assertEqual(results['calmjs.dev']['coverage']['statements'], [
+            1, 2])
+        self.assertNotIn('coverage', results['calmjs'])
+
+    def test_no_affected_tests_skips_karma(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        main = resource_filename('calmjs.dev', 'main.js')
+        driver = cli.KarmaDriver.create()
+
+        def make_spec(changed_file):
+            spec = Spec(
+                build_dir=mkdtemp(self),
+                test_package_names=['calmjs.dev'],
+                calmjs_test_registry_names=['calmjs.dev.module.tests'],
+                karma_abort_on_test_failure=True,
+                transpile_source_map={'calmjs/dev/main': main},
+                test_changed_files=[changed_file],
+            )
+            driver.setup_toolchain_spec(NullToolchain(), spec)
+            return spec
+
+        spec = make_spec(join(mkdtemp(self), 'unrelated.js'))
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.test_spec(spec)
+        self.assertIsNone(self.call_args)
+        self.assertEqual(spec['karma_return_code'], 0)
+        self.assertEqual(spec['karma_results']['tests'], [])
+        self.assertIn('karma will not be invoked', log.getvalue())
+
+        # karma is invoked once a test module is selected.
+        driver.test_spec(make_spec(main))
+        self.assertEqual(self.call_args[0][0][1], 'start')
+
     def test_create_config_with_coverage_standard_no_wrap(self):
         # this is usually provided by the toolchains themselves
         spec = Spec(
@@ -313,6 +1385,28 @@ class KarmaDriverTestSpecTestCase(unittest.TestCase):
         self.assertEqual(
             len(spec['karma_config']['coverageReporter']['reporters']), 4)
 
+    def test_create_config_with_coverage_exclude(self):
+        spec = Spec(
+            transpiled_targets={
+                'calmjs/dev/main': 'calmjs/dev/main.js',
+                'vendor/lib': 'vendor/lib.js',
+                'calmjs/dev/__init__': 'calmjs/dev/__init__.js',
+            },
+            test_module_paths_map={'calmjs/dev/tests/test_main': (
+                'calmjs/dev/tests/test_main.js')},
+            karma_spec_keys=['transpiled_targets'],
+            coverage_enable=True,
+            cover_test=True,
+            cover_exclude=['vendor/*'],
+        )
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        preprocessors = spec['karma_config']['preprocessors']
+        self.assertEqual(preprocessors, {
+            'calmjs/dev/main.js': ['coverage'],
+            'calmjs/dev/tests/test_main.js': ['coverage', 'wrap'],
+        })
+
     def test_create_config_with_coverage_standard_specified_no_wrap(self):
         # this is usually provided by the toolchains themselves
         spec = Spec(
@@ -473,6 +1567,210 @@ class KarmaDriverTestSpecTestCase(unittest.TestCase):
             'file': realpath('lcov.txt'),
         })
 
+    def test_create_config_with_coverage_raw_dir(self):
+        build_dir = mkdtemp(self)
+        raw_json = {
+            'type': 'json', 'file': 'coverage.json',
+            'dir': realpath(join(build_dir, 'coverage.raw')),
+        }
+        spec = Spec(
+            coverage_enable=True, cover_raw_dir='raw',
+            cover_report_dir='coverage', build_dir=build_dir,
+        )
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        reporters = spec['karma_config']['coverageReporter']['reporters']
+        self.assertEqual(len(reporters), 5)
+        self.assertEqual(reporters[-1], raw_json)
+
+        spec = Spec(
+            coverage_enable=True, cover_raw_dir='raw',
+            cover_report_dir='lcov-coverage', coverage_type='lcovonly',
+            cover_report_file='lcov.txt', build_dir=build_dir,
+        )
+        driver.create_config(spec)
+        self.assertEqual(spec['karma_config']['coverageReporter'], {
+            'dir': realpath('lcov-coverage'),
+            'reporters': [{'type': 'lcovonly', 'file': 'lcov.txt'}, raw_json],
+        })
+
+        # the configuration does not vary between runs.
+        driver.write_config(spec)
+        with open(spec['karma_config_path']) as fd:
+            first = fd.read()
+        driver.create_config(spec)
+        driver.write_config(spec)
+        with open(spec['karma_config_path']) as fd:
+            self.assertEqual(first, fd.read())
+
+    def test_create_config_with_coverage_raw_dir_no_build_dir(self):
+        spec = Spec(coverage_enable=True, cover_raw_dir='raw')
+        driver = cli.KarmaDriver()
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertEqual(
+            len(spec['karma_config']['coverageReporter']['reporters']), 4)
+        self.assertIn(
+            'raw coverage report will not be written', log.getvalue())
+
+    def test_create_config_native_coverage(self):
+        build_dir = mkdtemp(self)
+        spec = Spec(
+            coverage_enable=True, cover_native=True, cover_raw_dir='raw',
+            cover_report_dir='coverage', build_dir=build_dir,
+        )
+        driver = cli.KarmaDriver()
+        driver.create_config(spec)
+        self.assertEqual(spec['karma_config']['coverageReporter'], {
+            'dir': realpath(join(build_dir, 'coverage.raw')),
+            'reporters': [{'type': 'json', 'file': 'coverage.json'}],
+        })
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_create_config_cover_cache(self):
+        stub_stdouts(self)
+        binary, log = make_fake_istanbul(self)
+        stub_base_which(self, binary)
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        for name in ('mod.js', 'test_mod.js'):
+            with open(join(build_dir, name), 'w') as fd:
+                fd.write('var %s = 1;' % name[:-3])
+
+        def create_config():
+            spec = Spec(
+                coverage_enable=True, cover_cache=True, cover_test=True,
+                build_dir=build_dir, cache_dir=cache_dir,
+                transpiled_targets={'mod': 'mod.js'},
+                test_module_paths_map={'test_mod': 'test_mod.js'},
+                karma_spec_keys=['transpiled_targets'],
+            )
+            driver = cli.KarmaDriver()
+            driver.create_config(spec)
+            driver.write_config(spec)
+            return spec
+
+        spec = create_config()
+        instrumented = spec['karma_instrumented_paths']['mod.js']
+        self.assertTrue(instrumented.startswith(
+            join(cache_dir, 'instrumented')))
+        with open(instrumented) as fd:
+            self.assertEqual(fd.read(), '/* instrumented */var mod = 1;')
+        config = spec['karma_config']
+        self.assertEqual(config['files'], [instrumented, 'test_mod.js'])
+        # the test module is instrumented by karma.
+        self.assertEqual(config['preprocessors'], {
+            'test_mod.js': ['coverage', 'wrap']})
+
+        # the cached copy is reused.
+        self.assertEqual(create_config()['karma_instrumented_paths'], {
+            'mod.js': instrumented})
+        with open(log) as fd:
+            self.assertEqual(len(fd.read().splitlines()), 1)
+
+        # until the source is changed.
+        with open(join(build_dir, 'mod.js'), 'w') as fd:
+            fd.write('var mod = 2;')
+        self.assertNotEqual(
+            create_config()['karma_instrumented_paths']['mod.js'],
+            instrumented)
+        with open(log) as fd:
+            self.assertEqual(len(fd.read().splitlines()), 2)
+
+    def test_create_config_cover_cache_no_cache_dir(self):
+        spec = Spec(
+            coverage_enable=True, cover_cache=True, build_dir=mkdtemp(self),
+            transpiled_targets={'mod': 'mod.js'},
+            karma_spec_keys=['transpiled_targets'],
+        )
+        driver = cli.KarmaDriver()
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertIn('requires a cache directory', log.getvalue())
+        self.assertEqual(spec['karma_config']['preprocessors'], {
+            'mod.js': ['coverage']})
+
+    def test_create_config_native_coverage_no_build_dir(self):
+        spec = Spec(coverage_enable=True, cover_native=True)
+        driver = cli.KarmaDriver()
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.create_config(spec)
+        self.assertEqual(
+            len(spec['karma_config']['coverageReporter']['reporters']), 4)
+        self.assertIn(
+            'coverage reports will be produced by karma', log.getvalue())
+
+    def test_write_native_coverage(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        report_dir = join(mkdtemp(self), 'coverage')
+        staging_dir = join(build_dir, 'coverage.raw', 'PhantomJS')
+        os.makedirs(staging_dir)
+        with open(join(staging_dir, 'coverage.json'), 'w') as fd:
+            json.dump({'a.js': {'s': {'1': 1}}}, fd)
+        spec = Spec(
+            coverage_enable=True, cover_native=True, build_dir=build_dir,
+            cover_report_dir=report_dir)
+        driver = cli.KarmaDriver()
+        driver.write_native_coverage(spec)
+        self.assertEqual(sorted(os.listdir(report_dir)), [
+            'cobertura-coverage.xml', 'coverage.json', 'coverage.lcov'])
+        self.assertIn('All files', sys.stdout.getvalue())
+        # the staged report is removed without a raw directory.
+        self.assertFalse(exists(join(build_dir, 'coverage.raw')))
+
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            driver.write_native_coverage(spec)
+        self.assertIn('no raw coverage report found', log.getvalue())
+
+    def test_write_native_coverage_raw_dir(self):
+        stub_stdouts(self)
+        build_dir = mkdtemp(self)
+        report_dir = join(mkdtemp(self), 'coverage')
+        raw_dir = join(mkdtemp(self), 'raw')
+        staging_dir = join(build_dir, 'coverage.raw', 'PhantomJS')
+        os.makedirs(staging_dir)
+        with open(join(staging_dir, 'coverage.json'), 'w') as fd:
+            json.dump({'a.js': {'s': {'1': 1}}}, fd)
+        spec = Spec(
+            coverage_enable=True, cover_native=True, build_dir=build_dir,
+            cover_report_dir=report_dir, cover_raw_dir=raw_dir,
+            coverage_type='lcovonly')
+        driver = cli.KarmaDriver()
+        driver.write_native_coverage(spec)
+        driver.collect_raw_coverage(spec)
+        self.assertEqual(os.listdir(report_dir), ['coverage.lcov'])
+        self.assertEqual(len(coverage.find_coverage_files([raw_dir])), 1)
+
+    def test_collect_raw_coverage(self):
+        build_dir = mkdtemp(self)
+        raw_dir = join(mkdtemp(self), 'raw')
+        staging_dir = join(build_dir, 'coverage.raw', 'PhantomJS')
+        spec = Spec(
+            coverage_enable=True, cover_raw_dir=raw_dir, build_dir=build_dir)
+        driver = cli.KarmaDriver()
+        for run in range(2):
+            os.makedirs(staging_dir)
+            with open(join(staging_dir, 'coverage.json'), 'w') as fd:
+                fd.write('{}')
+            driver.collect_raw_coverage(spec)
+            os.rmdir(staging_dir)
+        # reports from each run are kept, as they have unique names.
+        self.assertEqual(len(coverage.find_coverage_files([raw_dir])), 2)
+
+    def test_shard_coverage_reporter(self):
+        build_dir = mkdtemp(self)
+        driver = cli.KarmaDriver()
+        result = driver._shard_coverage_reporter(Spec(build_dir=build_dir), 1)
+        self.assertEqual(result, {
+            'dir': realpath(join(build_dir, 'coverage.shards')),
+            'reporters': [{'type': 'json', 'file': 'coverage-shard1.json'}],
+        })
+
     def test_write_config_not_enough_info(self):
         build_dir = mkdtemp(self)
         spec = Spec(build_dir=build_dir)
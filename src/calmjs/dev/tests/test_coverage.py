@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+import unittest
+import json
+import os
+from os.path import exists
+from os.path import join
+from xml.dom import minidom
+
+from calmjs.utils import pretty_logging
+
+from calmjs.dev import coverage
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+
+
+def file_coverage(path, s, f, b):
+    return {
+        'path': path,
+        's': s,
+        'f': f,
+        'b': b,
+        'statementMap': {
+            '1': {'start': {'line': 1, 'column': 0},
+                  'end': {'line': 1, 'column': 10}},
+            '2': {'start': {'line': 2, 'column': 0},
+                  'end': {'line': 2, 'column': 10}},
+            '3': {'start': {'line': 2, 'column': 12},
+                  'end': {'line': 2, 'column': 20}},
+        },
+        'fnMap': {
+            '1': {'name': 'main', 'line': 1, 'loc': {}},
+        },
+        'branchMap': {
+            '1': {'line': 2, 'type': 'if', 'locations': [{}, {}]},
+        },
+    }
+
+
+class CoverageTestCase(unittest.TestCase):
+
+    def test_raw_coverage_filename_unique(self):
+        first = coverage.raw_coverage_filename()
+        self.assertTrue(first.startswith('coverage-'))
+        self.assertTrue(first.endswith('.json'))
+        self.assertNotEqual(first, coverage.raw_coverage_filename())
+
+    def test_find_coverage_files(self):
+        root = mkdtemp(self)
+        os.mkdir(join(root, 'PhantomJS'))
+        paths = [
+            join(root, 'PhantomJS', 'coverage-a.json'),
+            join(root, 'coverage-b.json'),
+            join(root, 'notes.txt'),
+        ]
+        for path in paths + [join(root, 'coverage.json')]:
+            with open(path, 'w') as fd:
+                fd.write('{}')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            result = coverage.find_coverage_files([
+                root, paths[2], join(root, 'missing.json')])
+        self.assertEqual(result, sorted(paths))
+        self.assertIn('missing.json', log.getvalue())
+
+    def test_collect_raw_coverage(self):
+        root = mkdtemp(self)
+        staging_dir = join(root, 'build', 'coverage.raw')
+        raw_dir = join(root, 'raw')
+        self.assertEqual(
+            coverage.collect_raw_coverage(staging_dir, raw_dir), [])
+        for browser in ('PhantomJS', 'Firefox'):
+            os.makedirs(join(staging_dir, browser))
+            with open(join(staging_dir, browser, 'coverage.json'), 'w') as fd:
+                fd.write('{}')
+        result = coverage.collect_raw_coverage(staging_dir, raw_dir)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(sorted(result), coverage.find_coverage_files(
+            [raw_dir]))
+        self.assertFalse(exists(join(staging_dir, 'Firefox', 'coverage.json')))
+        # subsequent runs produce further reports.
+        os.makedirs(join(staging_dir, 'Opera'))
+        with open(join(staging_dir, 'Opera', 'coverage.json'), 'w') as fd:
+            fd.write('{}')
+        coverage.collect_raw_coverage(staging_dir, raw_dir)
+        self.assertEqual(len(coverage.find_coverage_files([raw_dir])), 3)
+
+    def test_merge_coverage(self):
+        target = {'a.js': file_coverage(
+            'a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1}, {'1': [1, 0]})}
+        target['a.js']['l'] = {'1': 1}
+        coverage.merge_coverage(target, {
+            'a.js': file_coverage(
+                'a.js', {'1': 2, '2': 1, '3': 0}, {'1': 2}, {'1': [0, 3]}),
+            'b.js': {'s': {'1': 1}},
+        })
+        self.assertEqual(target['a.js']['s'], {'1': 3, '2': 1, '3': 0})
+        self.assertEqual(target['a.js']['f'], {'1': 3})
+        self.assertEqual(target['a.js']['b'], {'1': [1, 3]})
+        self.assertNotIn('l', target['a.js'])
+        self.assertEqual(target['b.js'], {'s': {'1': 1}})
+
+    def test_merge_coverage_files(self):
+        root = mkdtemp(self)
+        paths = []
+        for idx, s in enumerate(({'1': 1}, {'1': 4})):
+            paths.append(join(root, '%d.json' % idx))
+            with open(paths[-1], 'w') as fd:
+                json.dump({'a.js': {'s': s}}, fd)
+        paths.append(join(root, 'bad.json'))
+        with open(paths[-1], 'w') as fd:
+            fd.write('{')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            result = coverage.merge_coverage_files(paths)
+        self.assertEqual(result, {'a.js': {'s': {'1': 5}, 'f': {}, 'b': {}}})
+        self.assertIn('skipping invalid coverage report', log.getvalue())
+
+    def test_line_coverage(self):
+        self.assertEqual(coverage.line_coverage(file_coverage(
+            'a.js', {'1': 1, '2': 0, '3': 2}, {}, {})), {1: 1, 2: 2})
+
+    def test_write_lcov(self):
+        stream = mocks.StringIO()
+        coverage.write_lcov({'/src/a.js': file_coverage(
+            '/src/a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1}, {'1': [1, 0]},
+        )}, stream)
+        self.assertEqual(stream.getvalue().splitlines(), [
+            'TN:',
+            'SF:/src/a.js',
+            'FN:1,main',
+            'FNDA:1,main',
+            'FNF:1',
+            'FNH:1',
+            'DA:1,1',
+            'DA:2,0',
+            'LF:2',
+            'LH:1',
+            'BRDA:2,1,0,1',
+            'BRDA:2,1,1,0',
+            'BRF:2',
+            'BRH:1',
+            'end_of_record',
+        ])
+
+    def test_summary(self):
+        merged = {
+            'a.js': file_coverage(
+                'a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1}, {'1': [1, 0]}),
+            'b.js': file_coverage(
+                'b.js', {'1': 1, '2': 1, '3': 1}, {'1': 0}, {'1': [1, 1]}),
+        }
+        self.assertEqual(coverage.file_summary(merged['a.js']), {
+            'statements': (1, 3),
+            'branches': (1, 2),
+            'functions': (1, 1),
+            'lines': (1, 2),
+        })
+        self.assertEqual(coverage.summary(merged), {
+            'statements': (4, 6),
+            'branches': (3, 4),
+            'functions': (1, 2),
+            'lines': (3, 4),
+        })
+        self.assertEqual(coverage.summary({}), {
+            'statements': (0, 0),
+            'branches': (0, 0),
+            'functions': (0, 0),
+            'lines': (0, 0),
+        })
+
+    def test_write_text(self):
+        stream = mocks.StringIO()
+        coverage.write_text({'/src/a.js': file_coverage(
+            '/src/a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1}, {'1': [1, 0]},
+        )}, stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[1].split('|')[0].strip(), 'File')
+        self.assertEqual(
+            [c.strip() for c in lines[3].split('|')],
+            ['/src/a.js', '33.33', '50', '100', '50'])
+        self.assertEqual(
+            [c.strip() for c in lines[4].split('|')],
+            ['All files', '33.33', '50', '100', '50'])
+
+    def test_write_text_summary(self):
+        stream = mocks.StringIO()
+        coverage.write_text_summary({'/src/a.js': file_coverage(
+            '/src/a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1}, {'1': [1, 0]},
+        )}, stream)
+        self.assertEqual(stream.getvalue().splitlines()[1:5], [
+            'Statements   : 33.33% ( 1/3 )',
+            'Branches     : 50% ( 1/2 )',
+            'Functions    : 100% ( 1/1 )',
+            'Lines        : 50% ( 1/2 )',
+        ])
+
+    def test_write_cobertura(self):
+        stream = mocks.StringIO()
+        coverage.write_cobertura({
+            '/src/a.js': file_coverage(
+                '/src/a.js', {'1': 1, '2': 0, '3': 0}, {'1': 1},
+                {'1': [1, 0]}),
+            '/src/lib/b.js': file_coverage(
+                '/src/lib/b.js', {'1': 1, '2': 1, '3': 1}, {'1': 0},
+                {'1': [1, 1]}),
+        }, stream)
+        root = minidom.parseString(stream.getvalue()).documentElement
+        self.assertEqual(root.getAttribute('lines-valid'), '4')
+        self.assertEqual(root.getAttribute('lines-covered'), '3')
+        self.assertEqual(root.getAttribute('branch-rate'), '0.7500')
+        self.assertEqual(
+            root.getElementsByTagName('source')[0].firstChild.data, '/src')
+        self.assertEqual([
+            node.getAttribute('name')
+            for node in root.getElementsByTagName('package')
+        ], ['main', 'lib'])
+        self.assertEqual([
+            node.getAttribute('filename')
+            for node in root.getElementsByTagName('class')
+        ], ['a.js', 'lib/b.js'])
+        line = root.getElementsByTagName('class')[0].getElementsByTagName(
+            'line')[-1]
+        self.assertEqual(line.getAttribute('number'), '2')
+        self.assertEqual(line.getAttribute('condition-coverage'), '50% (1/2)')
+
+    def test_native_reporters_for_type(self):
+        self.assertEqual(
+            coverage.native_reporters_for_type('default'),
+            ['json', 'lcov', 'cobertura', 'text'])
+        self.assertEqual(
+            coverage.native_reporters_for_type('lcov'), ['html', 'lcov'])
+        self.assertEqual(
+            coverage.native_reporters_for_type('text-summary'),
+            ['text-summary'])
+
+    def test_write_reports_text(self):
+        report_dir = join(mkdtemp(self), 'coverage')
+        stream = mocks.StringIO()
+        coverage.write_reports(
+            {'a.js': {'s': {'1': 1}}}, report_dir,
+            ['text-summary', 'cobertura'], stream=stream)
+        self.assertIn('Statements   : 100% ( 1/1 )', stream.getvalue())
+        self.assertTrue(exists(join(report_dir, 'cobertura-coverage.xml')))
+
+    def test_write_reports(self):
+        reports = []
+
+        class Driver(object):
+            def report(self, root, report_dir, reporter):
+                with open(join(root, 'coverage.json')) as fd:
+                    reports.append((json.load(fd), report_dir, reporter))
+                return True
+
+        report_dir = join(mkdtemp(self), 'coverage')
+        merged = {'a.js': {'s': {'1': 1}}}
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            coverage.write_reports(
+                merged, report_dir, ['json', 'lcov', 'html', 'bogus'],
+                Driver())
+        with open(join(report_dir, 'coverage.json')) as fd:
+            self.assertEqual(json.load(fd), merged)
+        self.assertTrue(exists(join(report_dir, 'coverage.lcov')))
+        self.assertEqual(reports, [(merged, join(report_dir, 'html'), 'html')])
+        self.assertIn("unsupported coverage reporter 'bogus'", log.getvalue())
+
+    def test_write_reports_html_no_driver(self):
+        report_dir = mkdtemp(self)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            coverage.write_reports({}, report_dir, ['html'])
+        self.assertIn('cannot produce html report', log.getvalue())
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 import unittest
 
+from pkg_resources import WorkingSet
+
+from calmjs.registry import _inst as root_registry
+
 from calmjs.dev import dist
+from calmjs.dev.benchmark import SyntheticRegistry
+
+from calmjs.testing.utils import make_dummy_dist
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
 
 
 class DistTestCase(unittest.TestCase):
@@ -24,3 +33,221 @@ class DistTestCase(unittest.TestCase):
             'calmjs/dev/tests/test_fail',
             'calmjs/dev/tests/test_main',
         ])
+
+    def test_get_cached_module_registries_dependencies(self):
+        cache_dir = mkdtemp(self)
+        results = dist.get_cached_module_registries_dependencies(
+            ['calmjs.dev'], ['calmjs.dev.module.tests'], cache_dir)
+        self.assertEqual(sorted(results.keys()), [
+            'calmjs/dev/tests/test_fail',
+            'calmjs/dev/tests/test_main',
+        ])
+
+        def fail(*a, **kw):
+            raise AssertionError('cache not used')
+
+        stub_item_attr_value(
+            self, dist, 'get_module_registries_dependencies', fail)
+        self.assertEqual(dist.get_cached_module_registries_dependencies(
+            ['calmjs.dev'], ['calmjs.dev.module.tests'], cache_dir), results)
+        with self.assertRaises(AssertionError):
+            dist.get_cached_module_registries_dependencies(
+                ['calmjs.dev'], ['calmjs.dev.module'], cache_dir)
+
+    def test_get_module_registries_dependencies_by_package(self):
+        results = dist.get_module_registries_dependencies_by_package(
+            ['calmjs.dev', 'calmjs'], ['calmjs.dev.module.tests'])
+        self.assertEqual(sorted(results), ['calmjs', 'calmjs.dev'])
+        self.assertEqual(results['calmjs'], {})
+        self.assertEqual(sorted(results['calmjs.dev'].keys()), [
+            'calmjs/dev/tests/test_fail',
+            'calmjs/dev/tests/test_main',
+        ])
+
+    def test_get_registries_records_merged_in_order(self):
+        registries = {
+            'calmjs.dev.testing.first': {
+                'pkg.a': {'a/mod': '/first/a/mod.js'},
+                'pkg.b': {'b/mod': '/first/b/mod.js'},
+            },
+            'calmjs.dev.testing.second': {
+                'pkg.a': {'a/mod': '/second/a/mod.js'},
+                'pkg.b': {},
+            },
+        }
+        records = dict(root_registry.records)
+        for name, package_records in registries.items():
+            records[name] = SyntheticRegistry(name, package_records)
+        stub_item_attr_value(self, root_registry, 'records', records)
+
+        registry_names = [
+            'calmjs.dev.testing.first', 'calmjs.dev.testing.missing',
+            'calmjs.dev.testing.second',
+        ]
+        self.assertEqual(dist.get_registries_records(
+            ['pkg.a', 'pkg.b'], registry_names, processes=3), [
+            [{'a/mod': '/first/a/mod.js'}, {'b/mod': '/first/b/mod.js'}],
+            [{}, {}],
+            [{'a/mod': '/second/a/mod.js'}, {}],
+        ])
+        # the later registries take precedence, as with the serial
+        # resolution of the registries.
+        self.assertEqual(dist.get_module_registries_dependencies(
+            ['pkg.a', 'pkg.b'], registry_names), {
+            'a/mod': '/second/a/mod.js', 'b/mod': '/first/b/mod.js'})
+        self.assertEqual(dist.get_module_registries_dependencies(
+            ['pkg.a', 'pkg.b'], list(reversed(registry_names))), {
+            'a/mod': '/first/a/mod.js', 'b/mod': '/first/b/mod.js'})
+        self.assertEqual(dist.get_module_registries_dependencies_by_package(
+            ['pkg.a', 'pkg.b'], registry_names), {
+            'pkg.a': {'a/mod': '/second/a/mod.js'},
+            'pkg.b': {'b/mod': '/first/b/mod.js'},
+        })
+
+    def test_get_registries_loads_pending_concurrently(self):
+        loaded = []
+
+        def thread_map(func, items, processes=None):
+            loaded.extend(items)
+            return [func(item) for item in items]
+
+        stub_item_attr_value(self, dist.utils, 'thread_map', thread_map)
+        root_registry.get_record('calmjs.dev.module')
+        registries = dist.get_registries([
+            'calmjs.dev.module', 'calmjs.dev.testing.missing',
+            'calmjs.dev.testing.missing',
+        ])
+        self.assertEqual(loaded, ['calmjs.dev.testing.missing'])
+        self.assertIs(registries[0], root_registry.get('calmjs.dev.module'))
+        self.assertEqual(registries[1:], [None, None])
+
+    def test_get_cached_module_registries_dependencies_by_package(self):
+        cache_dir = mkdtemp(self)
+        results = dist.get_cached_module_registries_dependencies_by_package(
+            ['calmjs.dev', 'calmjs'], ['calmjs.dev.module.tests'], cache_dir)
+        self.assertEqual(sorted(results['calmjs.dev'].keys()), [
+            'calmjs/dev/tests/test_fail',
+            'calmjs/dev/tests/test_main',
+        ])
+
+        def fail(*a, **kw):
+            raise AssertionError('cache not used')
+
+        stub_item_attr_value(
+            self, dist, 'get_module_registries_dependencies_by_package', fail)
+        self.assertEqual(
+            dist.get_cached_module_registries_dependencies_by_package(
+                ['calmjs.dev', 'calmjs'], ['calmjs.dev.module.tests'],
+                cache_dir),
+            results)
+
+    def test_get_cached_flatten_module_registry_names(self):
+        cache_dir = mkdtemp(self)
+        self.assertEqual(dist.get_cached_flatten_module_registry_names(
+            ['calmjs.dev'], cache_dir), [])
+
+
+class ResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        working_dir = mkdtemp(self)
+        for name, requires in (
+                ('pkg.base', ''),
+                ('pkg.lib', 'pkg.base\n'),
+                ('pkg.app', 'pkg.lib\n'),
+                ('pkg.other', 'pkg.base\n')):
+            make_dummy_dist(self, (
+                ('requires.txt', requires),
+                ('calmjs_module_registry.txt', 'calmjs.dev.testing.src\n'),
+            ), name, '1.0', working_dir=working_dir)
+        records = dict(root_registry.records)
+        records['calmjs.dev.testing.src'] = SyntheticRegistry(
+            'calmjs.dev.testing.src', {
+                'pkg.base': {'base/mod': '/base/mod.js'},
+                'pkg.lib': {'lib/mod': '/lib/mod.js'},
+                'pkg.app': {'app/mod': '/app/mod.js'},
+                'pkg.other': {'other/mod': '/other/mod.js'},
+            })
+        stub_item_attr_value(self, root_registry, 'records', records)
+        self.resolver = dist.Resolver(
+            working_set=WorkingSet([working_dir]))
+        self.pkg_names = ['pkg.app', 'pkg.other']
+
+    def test_package_graph(self):
+        self.assertEqual(self.resolver.package_graph(self.pkg_names), {
+            'pkg.base': [],
+            'pkg.lib': ['pkg.base'],
+            'pkg.app': ['pkg.lib'],
+            'pkg.other': ['pkg.base'],
+        })
+        self.assertEqual(
+            self.resolver.reverse_graph(self.pkg_names)['pkg.base'],
+            {'pkg.lib', 'pkg.other'})
+
+    def test_dependents(self):
+        resolver = self.resolver
+        self.assertEqual(resolver.dependents(self.pkg_names, ['pkg.lib']), {
+            'pkg.lib', 'pkg.app'})
+        self.assertEqual(resolver.dependents(self.pkg_names, ['PKG.Base']), {
+            'pkg.base', 'pkg.lib', 'pkg.app', 'pkg.other'})
+        self.assertEqual(resolver.dependents(self.pkg_names, ['none']), set())
+
+    def test_module_dependents(self):
+        resolver = self.resolver
+        registry_names = ['calmjs.dev.testing.src']
+        self.assertEqual(resolver.module_index(
+            self.pkg_names, registry_names)['lib/mod'], ['pkg.lib'])
+        self.assertEqual(resolver.module_dependents(
+            self.pkg_names, registry_names, ['lib/mod']), {
+            'pkg.lib', 'pkg.app'})
+        self.assertEqual(resolver.module_dependents(
+            self.pkg_names, registry_names, ['other/mod']), {'pkg.other'})
+        self.assertEqual(resolver.module_dependents(
+            self.pkg_names, registry_names, []), set())
+        # not declared by any of the packages.
+        self.assertIsNone(resolver.module_dependents(
+            self.pkg_names, registry_names, ['lib/mod', 'unknown/mod']))
+
+    def test_memoized(self):
+        resolver = self.resolver
+        self.assertEqual(resolver.flatten_module_registry_names(
+            self.pkg_names), ['calmjs.dev.testing.src'])
+        self.assertEqual(resolver.module_registries_dependencies(
+            ['pkg.app'], ['calmjs.dev.testing.src']), {
+            'app/mod': '/app/mod.js'})
+        graph = resolver.package_graph(self.pkg_names)
+
+        def fail(*a, **kw):
+            raise AssertionError('resolved again')
+
+        stub_item_attr_value(self, dist, 'flatten_module_registry_names', fail)
+        stub_item_attr_value(
+            self, dist, 'get_module_registries_dependencies', fail)
+        stub_item_attr_value(
+            self, dist, 'find_packages_requirements_dists', fail)
+        self.assertEqual(resolver.flatten_module_registry_names(
+            self.pkg_names), ['calmjs.dev.testing.src'])
+        self.assertEqual(resolver.module_registries_dependencies(
+            ['pkg.app'], ['calmjs.dev.testing.src']), {
+            'app/mod': '/app/mod.js'})
+        self.assertIs(resolver.package_graph(self.pkg_names), graph)
+
+    def test_cache_dir(self):
+        cache_dir = mkdtemp(self)
+        resolver = dist.Resolver(
+            working_set=self.resolver.working_set, cache_dir=cache_dir)
+        self.assertEqual(resolver.module_registries_dependencies_by_package(
+            ['pkg.app'], ['calmjs.dev.testing.src']), {
+            'pkg.app': {'app/mod': '/app/mod.js'}})
+
+        def fail(*a, **kw):
+            raise AssertionError('cache not used')
+
+        stub_item_attr_value(
+            self, dist, 'get_module_registries_dependencies_by_package', fail)
+        # a new resolver, as for the next run, uses the persisted cache.
+        resolver = dist.Resolver(
+            working_set=self.resolver.working_set, cache_dir=cache_dir)
+        self.assertEqual(resolver.module_registries_dependencies_by_package(
+            ['pkg.app'], ['calmjs.dev.testing.src']), {
+            'pkg.app': {'app/mod': '/app/mod.js'}})
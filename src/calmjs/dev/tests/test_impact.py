@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import unittest
+from os.path import join
+
+from calmjs.dev import impact
+
+from calmjs.testing.utils import mkdtemp
+
+
+def write(root, name, contents=''):
+    target = join(root, name)
+    with open(target, 'w') as fd:
+        fd.write(contents)
+    return target
+
+
+class ImpactTestCase(unittest.TestCase):
+
+    def setUp(self):
+        root = mkdtemp(self)
+        self.source_map = {
+            'pkg/base': write(root, 'base.js', 'var base = 1;'),
+            'pkg/util': write(
+                root, 'util.js', "define(['pkg/base'], function() {});"),
+            'pkg/widget': write(
+                root, 'widget.js', "var util = require('pkg/util');"),
+            'other/thing': write(root, 'thing.js', 'var thing = 1;'),
+        }
+        self.test_module_paths_map = {
+            'pkg/tests/test_widget': write(
+                root, 'test_widget.js', 'require("pkg/widget");'),
+            'pkg/tests/test_base': write(root, 'test_base.js', ''),
+            'other/tests/test_thing': write(root, 'test_thing.js', ''),
+            'misc/tests/test_uses_base': write(
+                root, 'test_uses_base.js', "require('pkg/base')"),
+        }
+
+    def test_read_references(self):
+        self.assertEqual(impact.read_references(
+            self.source_map['pkg/util'], ['pkg/base', 'pkg/util']),
+            {'pkg/base'})
+        self.assertEqual(impact.read_references(
+            self.source_map['pkg/util'], []), set())
+        self.assertEqual(impact.read_references(
+            join(mkdtemp(self), 'missing.js'), ['pkg/base']), set())
+
+    def test_build_reverse_index(self):
+        self.assertEqual(impact.build_reverse_index(self.source_map), {
+            'pkg/base': {'pkg/util'},
+            'pkg/util': {'pkg/widget'},
+        })
+
+    def test_module_namespace(self):
+        self.assertEqual(impact.module_namespace('pkg/tests/test_a'), 'pkg')
+        self.assertEqual(impact.module_namespace('pkg/sub/mod'), 'pkg/sub')
+        self.assertEqual(impact.module_namespace('mod'), '')
+
+    def test_find_affected_modules(self):
+        self.assertEqual(impact.find_affected_modules(
+            self.source_map, [self.source_map['pkg/base']]),
+            {'pkg/base', 'pkg/util', 'pkg/widget'})
+        self.assertEqual(impact.find_affected_modules(
+            self.source_map, [self.source_map['pkg/widget']]),
+            {'pkg/widget'})
+
+    def test_select_affected_tests_transitive(self):
+        result = impact.select_affected_tests(
+            self.test_module_paths_map, self.source_map,
+            [self.source_map['pkg/base']])
+        self.assertEqual(sorted(result), [
+            'misc/tests/test_uses_base',
+            'pkg/tests/test_base',
+            'pkg/tests/test_widget',
+        ])
+
+    def test_select_affected_tests_namespace(self):
+        result = impact.select_affected_tests(
+            self.test_module_paths_map, self.source_map,
+            [self.source_map['other/thing']])
+        self.assertEqual(sorted(result), ['other/tests/test_thing'])
+
+    def test_select_affected_tests_changed_test(self):
+        result = impact.select_affected_tests(
+            self.test_module_paths_map, self.source_map,
+            [self.test_module_paths_map['misc/tests/test_uses_base']])
+        self.assertEqual(sorted(result), ['misc/tests/test_uses_base'])
+
+    def test_select_affected_tests_unrelated(self):
+        result = impact.select_affected_tests(
+            self.test_module_paths_map, self.source_map,
+            [join(mkdtemp(self), 'README.rst')])
+        self.assertEqual(result, {})
+
+    def test_update_index(self):
+        index = impact.update_index({}, {
+            'pkg/tests/test_widget': set(['pkg/widget', 'pkg/util']),
+            'pkg/tests/test_base': set(['pkg/base']),
+            'other/tests/test_thing': set(),
+        })
+        self.assertEqual(index, {
+            'tests': [
+                'other/tests/test_thing',
+                'pkg/tests/test_base',
+                'pkg/tests/test_widget',
+            ],
+            'sources': {
+                'pkg/base': [1],
+                'pkg/util': [2],
+                'pkg/widget': [2],
+            },
+        })
+        # the entries for the test modules recorded again are replaced.
+        index = impact.update_index(index, {
+            'pkg/tests/test_widget': set(['pkg/base']),
+        })
+        self.assertEqual(impact.decode_index(index), {
+            'pkg/base': set(['pkg/tests/test_base', 'pkg/tests/test_widget']),
+        })
+        self.assertEqual(len(index['tests']), 3)
+
+    def test_save_load_index(self):
+        cache_dir = mkdtemp(self)
+        self.assertEqual(impact.load_index(cache_dir), {})
+        index = impact.update_index({}, {'a/tests/test_a': set(['a/a'])})
+        impact.save_index(cache_dir, index)
+        self.assertEqual(impact.load_index(cache_dir), index)
+
+    def test_select_indexed_tests(self):
+        index = impact.update_index({}, {
+            'pkg/tests/test_widget': set(['pkg/widget', 'pkg/base']),
+            'pkg/tests/test_base': set(['pkg/base']),
+            'other/tests/test_thing': set(['other/thing']),
+        })
+        result = impact.select_indexed_tests(
+            index, self.test_module_paths_map, self.source_map,
+            [self.source_map['pkg/base']])
+        # the test module never recorded is always selected.
+        self.assertEqual(sorted(result), [
+            'misc/tests/test_uses_base',
+            'pkg/tests/test_base',
+            'pkg/tests/test_widget',
+        ])
+
+        result = impact.select_indexed_tests(
+            index, self.test_module_paths_map, self.source_map,
+            [self.source_map['pkg/util'],
+             self.test_module_paths_map['other/tests/test_thing']])
+        self.assertEqual(sorted(result), [
+            'misc/tests/test_uses_base',
+            'other/tests/test_thing',
+        ])
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import unittest
+import json
 
 from calmjs.dev import karma
 
@@ -9,3 +10,91 @@ class BaseConfigTestCase(unittest.TestCase):
     def test_generate_base_config(self):
         result = karma.build_base_config()
         self.assertTrue(isinstance(result, dict))
+
+
+SAMPLE_OUTPUT = u"""\
+18 10 2026 12:00:00.000:INFO [karma]: Karma v1.3.0 server started
+\x1b[32m
+  Test for main
+\x1b[39m    \u2713 Main identity test (3ms)
+    nested
+      \u2717 fails nicely (12ms)
+\tFAILED
+\tAssertionError: expected 1 to equal 2
+\t    at test_fail.js:5
+      - is skipped
+  Other suite
+    \u221a windows style success
+PhantomJS 2.1.1 (Linux 0.0.0): Executed 1 of 4\r\
+PhantomJS 2.1.1 (Linux 0.0.0): Executed 3 of 4 (1 FAILED) (skipped 1) \
+(0.01 secs / 0.003 secs)
+TOTAL: 1 FAILED, 2 SUCCESS
+"""
+
+
+class ResultCollectorTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        collector = karma.ResultCollector()
+        self.assertEqual(collector.results, {'tests': [], 'summary': {}})
+
+    def test_parse_sample(self):
+        collector = karma.ResultCollector()
+        for line in SAMPLE_OUTPUT.splitlines(True):
+            collector.feed(line)
+        results = collector.results
+        self.assertEqual(results['summary'], {
+            'executed': 3, 'total': 4, 'failed': 1, 'skipped': 1})
+        self.assertEqual(results['tests'], [{
+            'suite': ['Test for main'],
+            'name': 'Main identity test',
+            'status': 'success',
+            'duration': 3,
+        }, {
+            'suite': ['Test for main', 'nested'],
+            'name': 'fails nicely',
+            'status': 'failed',
+            'duration': 12,
+        }, {
+            'suite': ['Test for main', 'nested'],
+            'name': 'is skipped',
+            'status': 'skipped',
+            'duration': None,
+        }, {
+            'suite': ['Other suite'],
+            'name': 'windows style success',
+            'status': 'success',
+            'duration': None,
+        }])
+
+
+class FormatTestCase(unittest.TestCase):
+
+    def test_format_package_results(self):
+        self.assertEqual(karma.format_package_results({
+            'pkg.b': {
+                'success': 2, 'failed': 1, 'skipped': 0, 'return_code': 1},
+            'pkg.a': {
+                'success': 3, 'failed': 0, 'skipped': 1, 'return_code': 0,
+                'coverage': {'statements': [2, 3]}},
+        }).splitlines(), [
+            'results by package:',
+            '  pkg.a: ok, 3 passed, 0 failed, 1 skipped, '
+            '66.67% statements covered',
+            '  pkg.b: FAILED, 2 passed, 1 failed, 0 skipped',
+        ])
+
+
+class FilesManifestTestCase(unittest.TestCase):
+
+    def test_iter_files_manifest(self):
+        text = ''.join(karma.iter_files_manifest(
+            ['a.js', {'pattern': 'b.map', 'included': False}],
+            {'b.js': ['wrap'], 'a.js': 'coverage'},
+        ))
+        self.assertEqual(text, (
+            '{"files":["a.js",{"included":false,"pattern":"b.map"}],'
+            '"preprocessors":{"a.js":"coverage","b.js":["wrap"]}}\n'
+        ))
+        self.assertEqual(json.loads(''.join(karma.iter_files_manifest(
+            [], {}))), {'files': [], 'preprocessors': {}})
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import re
+from os.path import join
+
+from calmjs.dev import paths
+
+from calmjs.testing.utils import mkdtemp
+
+
+class CompileRulesTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(paths.compile_rules([]))
+
+    def test_globs_match_entire_path(self):
+        match = paths.compile_rules(['*/vendor/*', '*.min.js'])
+        self.assertTrue(match('/src/vendor/lib.js'))
+        self.assertTrue(match('/src/lib.min.js'))
+        self.assertFalse(match('/src/lib.js'))
+        self.assertFalse(match('vendor/lib.js'))
+
+    def test_regexes_search(self):
+        match = paths.compile_rules([re.compile(r'__\w*__')])
+        self.assertTrue(match('/src/pkg/__init__.js'))
+        self.assertFalse(match('/src/pkg/init.js'))
+
+    def test_mixed(self):
+        match = paths.compile_rules(['*/vendor/*', re.compile(r'__\w*__')])
+        self.assertTrue(match('/src/vendor/lib.js'))
+        self.assertTrue(match('/src/pkg/__init__.js'))
+        self.assertFalse(match('/src/pkg/init.js'))
+
+
+class PathClassifierTestCase(unittest.TestCase):
+
+    def test_path_rules(self):
+        rules = paths.PathRules(exclude=['*.txt'])
+        self.assertTrue(rules('a.js'))
+        self.assertFalse(rules('a.txt'))
+        rules = paths.PathRules(include=['*.js'], exclude=['*/vendor/*'])
+        self.assertTrue(rules('/src/a.js'))
+        self.assertFalse(rules('/src/a.txt'))
+        self.assertFalse(rules('/src/vendor/a.js'))
+
+    def test_classify(self):
+        classifier = paths.get_classifier('test')
+        self.assertEqual(classifier.classify([
+            '/src/pkg/mod.js',
+            '/src/pkg/__init__.js',
+            '/src/pkg/tests/test_mod.js',
+            '/src/pkg/test/mod.js',
+            '/src/pkg/style.css',
+        ]), {
+            'cover': [
+                '/src/pkg/mod.js',
+                '/src/pkg/tests/test_mod.js',
+                '/src/pkg/test/mod.js',
+            ],
+            'wrap': ['/src/pkg/tests/test_mod.js'],
+        })
+
+    def test_select(self):
+        classifier = paths.get_classifier('spec', ['*/vendor/*'])
+        self.assertEqual(classifier.select('cover', [
+            '/src/vendor/lib.js', '/src/mod.js']), ['/src/mod.js'])
+        self.assertEqual(classifier.select('wrap', [
+            '/src/tests/test_mod.js', '/src/tests/spec_mod.js']), [
+            '/src/tests/spec_mod.js'])
+
+    def test_get_classifier_reused(self):
+        self.assertIs(
+            paths.get_classifier('test', ['*.min.js']),
+            paths.get_classifier('test', ('*.min.js',)))
+        self.assertIsNot(
+            paths.get_classifier('test'), paths.get_classifier('spec'))
+
+
+class CompactPathsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        for name in ('src', 'tests', 'mixed'):
+            os.mkdir(join(self.root, name))
+        for name in ('src/a.js', 'src/b.js', 'src/a.js.map', 'src/.hidden.js',
+                     'tests/test_a.js', 'tests/test_b.js', 'mixed/a.js',
+                     'mixed/b.js', 'mixed/c.js'):
+            with open(join(self.root, name), 'w'):
+                pass
+
+    def test_compact_paths(self):
+        root = self.root
+        files, preprocessors = paths.compact_paths([
+            'artifact.js',
+            join(root, 'src', 'a.js'),
+            join(root, 'src', 'b.js'),
+            # not every file in the directory.
+            join(root, 'mixed', 'a.js'),
+            join(root, 'mixed', 'b.js'),
+            # relative to the base directory.
+            join('tests', 'test_a.js'),
+            join('tests', 'test_b.js'),
+            {'pattern': join(root, 'src', 'a.js.map'), 'included': False},
+        ], {
+            join(root, 'src', 'a.js'): ['coverage'],
+            join(root, 'src', 'b.js'): ['coverage'],
+            join('tests', 'test_a.js'): ['wrap'],
+            '*.js': 'other',
+        }, root)
+        self.assertEqual(files, [
+            'artifact.js',
+            join(root, 'src', '*.js'),
+            join(root, 'mixed', 'a.js'),
+            join(root, 'mixed', 'b.js'),
+            join('tests', '*.js'),
+            {'pattern': join(root, 'src', 'a.js.map'), 'included': False},
+        ])
+        # the preprocessors of the tests differ, so they are retained.
+        self.assertEqual(preprocessors, {
+            join(root, 'src', '*.js'): ['coverage'],
+            join('tests', 'test_a.js'): ['wrap'],
+            '*.js': 'other',
+        })
+
+    def test_compact_paths_unsorted_or_missing(self):
+        files = [
+            join(self.root, 'src', 'b.js'), join(self.root, 'src', 'a.js')]
+        self.assertEqual(
+            (files, {}), paths.compact_paths(files, {}, self.root))
+        files = [join(self.root, 'none', 'a.js'), join(
+            self.root, 'none', 'b.js')]
+        self.assertEqual(
+            (files, {}), paths.compact_paths(files, {}, self.root))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import unittest
+import json
+import pstats
+import sys
+from os.path import join
+
+from calmjs.toolchain import Spec
+from calmjs.utils import pretty_logging
+
+from calmjs.dev import phases
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_stdouts
+
+
+class PhaseRecorderTestCase(unittest.TestCase):
+
+    def test_span_nesting(self):
+        recorder = phases.PhaseRecorder()
+        with recorder.span('outer'):
+            with recorder.span('inner', 'other'):
+                pass
+        self.assertEqual(
+            [('outer', 'driver', 0), ('inner', 'other', 1)],
+            [(s['name'], s['category'], s['depth'])
+                for s in recorder.ordered()],
+        )
+
+    def test_instrument_steps(self):
+        recorder = phases.PhaseRecorder()
+        spec = Spec()
+        called = []
+        spec.advise('before_compile', called.append, 'before_compile')
+        recorder.instrument(spec)
+        spec.handle('before_compile')
+        spec.handle('after_compile')
+        self.assertEqual(['before_compile'], called)
+        self.assertEqual(
+            [('before_compile', 'advice'), ('compile', 'step'),
+                ('after_compile', 'advice')],
+            [(s['name'], s['category']) for s in recorder.ordered()],
+        )
+
+    def test_format_breakdown(self):
+        recorder = phases.PhaseRecorder()
+        recorder.record('run', 'driver', 1.0, 3.5)
+        recorder._depth = 1
+        recorder.record('compile', 'step', 1.5, 2.0)
+        recorder.record('before_test', 'advice', 2.0, 2.0)
+        self.assertEqual(
+            'time spent in phases:\n'
+            '      2.500s run\n'
+            '      0.500s   (compile)\n'
+            '      0.000s   before_test',
+            recorder.format_breakdown(),
+        )
+
+    def test_trace_events(self):
+        recorder = phases.PhaseRecorder()
+        recorder.record('run', 'driver', 1.0, 3.5)
+        target = join(mkdtemp(self), 'trace.json')
+        recorder.write_trace(target)
+        with open(target) as fd:
+            trace = json.load(fd)
+        self.assertEqual(1, len(trace['traceEvents']))
+        event = trace['traceEvents'][0]
+        self.assertEqual('X', event['ph'])
+        self.assertEqual(1000000, event['ts'])
+        self.assertEqual(2500000, event['dur'])
+
+
+class ProfileTestCase(unittest.TestCase):
+
+    def test_get_recorder_disabled(self):
+        spec = Spec()
+        self.assertIsNone(phases.get_recorder(spec))
+        with phases.span(spec, 'noop'):
+            pass
+        with phases.profile(spec):
+            pass
+        self.assertNotIn('karma_phase_recorder', spec)
+
+    def test_profile(self):
+        stub_stdouts(self)
+        tmpdir = mkdtemp(self)
+        spec = Spec(
+            karma_profile_trace=join(tmpdir, 'trace.json'),
+            karma_profile_stats=join(tmpdir, 'run.prof'),
+        )
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            with phases.profile(spec):
+                with phases.span(spec, 'work'):
+                    spec.handle('before_test')
+        self.assertIn('wrote trace of phases', log.getvalue())
+        self.assertIn('wrote profiler statistics', log.getvalue())
+        self.assertIn('time spent in phases:', sys.stdout.getvalue())
+        self.assertIn('s run\n', sys.stdout.getvalue())
+        self.assertIn('s   work\n', sys.stdout.getvalue())
+
+        with open(join(tmpdir, 'trace.json')) as fd:
+            names = [e['name'] for e in json.load(fd)['traceEvents']]
+        self.assertEqual(['run', 'work', 'before_test'], names)
+        self.assertTrue(pstats.Stats(join(tmpdir, 'run.prof')))
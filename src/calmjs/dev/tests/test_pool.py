@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+import sys
+from os.path import exists
+from os.path import join
+
+from calmjs.utils import pretty_logging
+
+from calmjs.dev import pool
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_os_environ
+
+
+def make_fake_browser(testcase):
+    """
+    Create a fake browser executable that serves the version request of
+    the remote debugging protocol on the port it was launched with.
+    """
+
+    target = join(mkdtemp(testcase), 'chromium')
+    with open(target, 'w') as fd:
+        fd.write(
+            '#!%s\n'
+            'import sys\n'
+            'try:\n'
+            '    from http.server import HTTPServer\n'
+            '    from http.server import BaseHTTPRequestHandler\n'
+            'except ImportError:\n'
+            '    from BaseHTTPServer import HTTPServer\n'
+            '    from BaseHTTPServer import BaseHTTPRequestHandler\n'
+            '\n'
+            'class Handler(BaseHTTPRequestHandler):\n'
+            '    def do_GET(self):\n'
+            '        self.send_response(200)\n'
+            '        self.end_headers()\n'
+            '        self.wfile.write(b\'{"Browser": "Fake/1.0"}\')\n'
+            '\n'
+            'port = [int(arg.split("=")[1]) for arg in sys.argv\n'
+            '    if arg.startswith("--remote-debugging-port=")][0]\n'
+            'HTTPServer(("127.0.0.1", port), Handler).serve_forever()\n'
+            % sys.executable
+        )
+    os.chmod(target, 0o755)
+    return target
+
+
+class UtilitiesTestCase(unittest.TestCase):
+
+    def test_get_pool_launcher_path(self):
+        self.assertTrue(exists(pool.get_pool_launcher_path()))
+
+    def test_find_browser_binary_env(self):
+        binary = make_fake_browser(self)
+        stub_os_environ(self)
+        os.environ['CHROME_BIN'] = binary
+        self.assertEqual(binary, pool.find_browser_binary())
+
+    def test_find_browser_binary_missing(self):
+        stub_os_environ(self)
+        os.environ['CHROME_BIN'] = join(mkdtemp(self), 'no_such_browser')
+        self.assertIsNone(pool.find_browser_binary())
+
+    def test_endpoint(self):
+        self.assertEqual('http://127.0.0.1:9222', pool.endpoint(9222))
+
+    def test_check_browser_nothing_listening(self):
+        self.assertFalse(pool.check_browser(pool.free_port()))
+
+    def test_check_pid(self):
+        self.assertTrue(pool.check_pid(os.getpid()))
+
+
+class BrowserPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool_dir = mkdtemp(self)
+        self.browser_pool = pool.BrowserPool(
+            self.pool_dir, size=2, recycle=2,
+            binary=make_fake_browser(self), timeout=10)
+        self.addCleanup(self.browser_pool.stop)
+
+    def test_acquire_launch_reuse(self):
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            endpoints = self.browser_pool.acquire(2)
+        self.assertEqual(2, len(endpoints))
+        browsers = self.browser_pool.load()
+        self.assertEqual([1, 1], [browser['runs'] for browser in browsers])
+        for browser in browsers:
+            self.assertTrue(self.browser_pool.healthy(browser))
+
+        # the same browsers are used again.
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            self.assertEqual(
+                sorted(endpoints), sorted(self.browser_pool.acquire(2)))
+
+    def test_acquire_least_used(self):
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            first = self.browser_pool.acquire(1)
+            second = self.browser_pool.acquire(1)
+        self.assertNotEqual(first, second)
+        self.assertEqual(
+            [1, 1], [browser['runs'] for browser in self.browser_pool.load()])
+
+    def test_recycle(self):
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            self.browser_pool.acquire(2)
+            original = self.browser_pool.acquire(2)
+            # the browsers have reached their number of runs.
+            with pretty_logging(
+                    logger='calmjs.dev', stream=mocks.StringIO()) as s:
+                replaced = self.browser_pool.acquire(2)
+        self.assertIn('after 2 runs', s.getvalue())
+        self.assertFalse(set(original) & set(replaced))
+
+    def test_unhealthy_replaced(self):
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            self.browser_pool.acquire(1)
+        browsers = self.browser_pool.load()
+        self.browser_pool.terminate(browsers[0])
+        os.waitpid(browsers[0]['pid'], 0)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as s:
+            self.browser_pool.acquire(1)
+        self.assertIn('failed health check', s.getvalue())
+        self.assertEqual(2, len(self.browser_pool.load()))
+
+    def test_stop(self):
+        with pretty_logging(logger='calmjs.dev', stream=mocks.StringIO()):
+            self.browser_pool.acquire(1)
+        browsers = self.browser_pool.load()
+        self.browser_pool.stop()
+        for browser in browsers:
+            os.waitpid(browser['pid'], 0)
+            self.assertFalse(pool.check_pid(browser['pid']))
+        self.assertEqual([], self.browser_pool.load())
+
+    def test_no_binary(self):
+        browser_pool = pool.BrowserPool(mkdtemp(self), size=1, binary=None)
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as s:
+            self.assertEqual([], browser_pool.acquire(1))
+        self.assertIn('CHROME_BIN', s.getvalue())
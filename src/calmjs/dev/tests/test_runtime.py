@@ -22,9 +22,11 @@ from calmjs.toolchain import CALMJS_TOOLCHAIN_ADVICE
 from calmjs.utils import pretty_logging
 
 from calmjs.dev import cli
+from calmjs.dev import watch
 from calmjs.dev.cli import KarmaDriver
 from calmjs.dev.toolchain import TestToolchain
 from calmjs.dev.runtime import prepare_spec_artifacts
+from calmjs.dev.runtime import prepare_spec_changed_files
 from calmjs.dev.runtime import KarmaRuntime
 from calmjs.dev.runtime import TestToolchainRuntime
 
@@ -37,8 +39,16 @@ from calmjs.testing.utils import setup_class_install_environment
 from calmjs.testing.utils import stub_base_which
 from calmjs.testing.utils import stub_item_attr_value
 from calmjs.testing.utils import stub_mod_call
+from calmjs.testing.utils import stub_os_environ
 from calmjs.testing.utils import stub_stdouts
 
+from calmjs.dev.tests.test_cli import make_fake_karma
+
+try:
+    from calmjs.dev import aio
+except (ImportError, SyntaxError):  # pragma: no cover
+    aio = None
+
 npm_version = get_npm_version()
 
 
@@ -77,6 +87,41 @@ class TestToolchainRuntimeTestCase(unittest.TestCase):
         prepare_spec_artifacts(spec)
         self.assertEqual(spec['artifact_paths'], [real])
 
+    def test_prepare_spec_artifacts_manifest(self):
+        tmpdir = mkdtemp(self)
+        build_dir = mkdtemp(self)
+        art1 = join(tmpdir, 'art1.js')
+        art2 = join(tmpdir, 'art2.js')
+        for path in (art1, art2):
+            with open(path, 'w') as fd:
+                fd.write('var art = 1;')
+
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            spec = Spec(build_dir=build_dir, artifact_paths=[art1, art2])
+            prepare_spec_artifacts(spec)
+        manifest_path = join(build_dir, 'karma.artifacts.json')
+        self.assertEqual(spec['karma_artifact_manifest'], manifest_path)
+        self.assertIn("artifact '%s' recorded for the first" % art1,
+                      log.getvalue())
+
+        with open(art2, 'w') as fd:
+            fd.write('var art = 2;')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            spec = Spec(build_dir=build_dir, artifact_paths=[art1, art2])
+            prepare_spec_artifacts(spec)
+        self.assertIn("artifact '%s' changed since the previous run" % art2,
+                      log.getvalue())
+        self.assertIn(
+            '1 of 2 artifacts unchanged since the previous run',
+            log.getvalue())
+
+        # no manifest without a build or cache directory.
+        spec = Spec(artifact_paths=[art1])
+        prepare_spec_artifacts(spec)
+        self.assertNotIn('karma_artifact_manifest', spec)
+
     def test_prepare_spec_artifacts_order(self):
         remember_cwd(self)
         tmpdir = mkdtemp(self)
@@ -102,6 +147,32 @@ class TestToolchainRuntimeTestCase(unittest.TestCase):
             join(tmpdir, 'art3.js'),
         ])
 
+    def test_prepare_spec_changed_files_unset(self):
+        spec = Spec()
+        prepare_spec_changed_files(spec)
+        self.assertNotIn('test_changed_files', spec)
+
+    def test_prepare_spec_changed_files_failure(self):
+        remember_cwd(self)
+        os.chdir(mkdtemp(self))
+        spec = Spec(test_changed_since='HEAD', test_changed_files=['a.js'])
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            prepare_spec_changed_files(spec)
+        self.assertIn(
+            "unable to derive the files changed since 'HEAD'", log.getvalue())
+        self.assertIn(
+            "only the test modules affected by the changed files specified",
+            log.getvalue())
+        self.assertEqual(spec['test_changed_files'], ['a.js'])
+
+        spec = Spec(test_changed_since='HEAD')
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            prepare_spec_changed_files(spec)
+        self.assertIn('all test modules will be selected', log.getvalue())
+        self.assertNotIn('test_changed_files', spec)
+
 
 class BaseRuntimeTestCase(unittest.TestCase):
 
@@ -203,6 +274,92 @@ class BaseRuntimeTestCase(unittest.TestCase):
         self.assertEqual(
             ['Chromium', 'Firefox'], result['karma_config']['browsers'])
 
+    def test_karma_runtime_cache_dir(self):
+        stub_stdouts(self)
+        stub_mod_call(self, cli)
+        stub_base_which(self, 'karma')
+
+        build_dir = mkdtemp(self)
+        cache_dir = mkdtemp(self)
+        rt = KarmaRuntime(KarmaDriver())
+        result = rt([
+            '--cache-dir', cache_dir, 'run',
+            '--build-dir', build_dir,
+            '--test-registry', 'calmjs.dev.module.tests',
+            '--test-package', 'calmjs.dev',
+        ])
+        self.assertEqual(result['cache_dir'], cache_dir)
+        self.assertIn(
+            'calmjs/dev/tests/test_main', result['test_module_paths_map'])
+        self.assertTrue(exists(join(
+            cache_dir, 'module_registries_dependencies.json')))
+        self.assertTrue(exists(join(cache_dir, 'module_registry_names.json')))
+
+    def test_karma_runtime_merge(self):
+        stub_stdouts(self)
+        raw_dir = mkdtemp(self)
+        report_dir = join(mkdtemp(self), 'coverage')
+        for idx in range(2):
+            with open(join(raw_dir, 'coverage-%d.json' % idx), 'w') as fd:
+                fd.write('{"a.js": {"s": {"1": %d}}}' % (idx + 1))
+        rt = KarmaRuntime(KarmaDriver())
+        result = rt([
+            'merge', raw_dir, '--cover-report-dir', report_dir,
+            '--reporters', 'json,lcov',
+        ])
+        self.assertEqual(result['a.js']['s'], {'1': 3})
+        self.assertTrue(exists(join(report_dir, 'coverage.json')))
+        self.assertTrue(exists(join(report_dir, 'coverage.lcov')))
+
+    def test_karma_runtime_merge_nothing(self):
+        stub_stdouts(self)
+        rt = KarmaRuntime(KarmaDriver())
+        self.assertIsNone(rt(['merge', mkdtemp(self)]))
+        self.assertIn('no coverage reports found', sys.stderr.getvalue())
+
+    @unittest.skipIf(aio is None, 'requires Python 3.5.1 or later')
+    @unittest.skipIf(sys.platform == 'win32', 'requires posix executable')
+    def test_karma_runtime_concurrent(self):
+        stub_stdouts(self)
+        build_dirs = [mkdtemp(self), mkdtemp(self)]
+        rt = KarmaRuntime(KarmaDriver(binary=make_fake_karma(
+            self, output='Executed 0 of 0 SUCCESS\n', tail='sys.exit(0)\n')))
+        specs = rt([
+            'concurrent', '-j', '1',
+            'run --build-dir=%s' % build_dirs[0],
+            '--watch --browser=Firefox run --build-dir=%s' % build_dirs[1],
+        ])
+        self.assertEqual([s['build_dir'] for s in specs], build_dirs)
+        self.assertEqual([s['karma_return_code'] for s in specs], [0, 0])
+        self.assertEqual(specs[1]['karma_browsers'], ['Firefox'])
+        self.assertNotIn('karma_watch', specs[1])
+        self.assertIn('watch mode is not supported', sys.stderr.getvalue())
+
+    @unittest.skipIf(aio is None, 'requires Python 3.5.1 or later')
+    def test_karma_runtime_concurrent_not_toolchain(self):
+        stub_stdouts(self)
+        rt = KarmaRuntime(KarmaDriver())
+        self.assertIsNone(rt(['concurrent', 'merge somewhere']))
+        self.assertIn(
+            "command 'merge somewhere' does not lead to a toolchain runtime",
+            sys.stderr.getvalue())
+
+    def test_karma_runtime_watch(self):
+        stub_stdouts(self)
+        watched = []
+
+        def fake_watch(driver, toolchain, spec):
+            watched.append((driver, toolchain))
+            return spec
+
+        stub_item_attr_value(self, watch, 'watch', fake_watch)
+        driver = KarmaDriver()
+        rt = KarmaRuntime(driver)
+        result = rt(['--watch', 'run'])
+        self.assertTrue(result['karma_watch'])
+        self.assertIs(watched[0][0], driver)
+        self.assertIsInstance(watched[0][1], TestToolchain)
+
 
 @unittest.skipIf(npm_version is None, 'npm not found.')
 class CliRuntimeTestCase(unittest.TestCase):
@@ -379,6 +536,66 @@ class CliRuntimeTestCase(unittest.TestCase):
         self.assertIn('--test-registry', stream.getvalue())
         self.assertIn('null', stream.getvalue())
 
+    def test_init_argparser_lazy_subcommand(self):
+        initialized = []
+
+        class DummyRuntime(ToolchainRuntime):
+            def init_argparser(self, argparser):
+                initialized.append(argparser)
+                super(DummyRuntime, self).init_argparser(argparser)
+
+        stub_item_attr_value(
+            self, mocks, 'dummy', DummyRuntime(NullToolchain()))
+        make_dummy_dist(self, ((
+            'entry_points.txt',
+            '[calmjs.runtime]\n'
+            'null = calmjs.testing.mocks:dummy\n'
+        ),), 'example.package', '1.0')
+        working_set = WorkingSet([self._calmjs_testing_tmpdir])
+
+        runtime = KarmaRuntime(self.driver, working_set=working_set)
+        argparser = runtime.argparser
+        self.assertEqual([], initialized)
+        # only initialized once selected.
+        ns = argparser.parse_args(['null', '--export-target', 'target'])
+        self.assertEqual(1, len(initialized))
+        self.assertEqual('target', ns.export_target)
+        self.assertIs(mocks.dummy, runtime.get_runtime('null'))
+        argparser.parse_args(['null', '--export-target', 'target'])
+        self.assertEqual(1, len(initialized))
+
+    def test_init_argparser_entry_point_metadata_cache(self):
+        stub_os_environ(self)
+        cache_dir = mkdtemp(self)
+        os.environ['CALMJS_DEV_CACHE_DIR'] = cache_dir
+        stub_item_attr_value(
+            self, mocks, 'dummy', ToolchainRuntime(
+                NullToolchain(), description='dummy null runtime'))
+        make_dummy_dist(self, ((
+            'entry_points.txt',
+            '[calmjs.runtime]\n'
+            'null = calmjs.testing.mocks:dummy\n'
+        ),), 'example.package', '1.0')
+        working_set = WorkingSet([self._calmjs_testing_tmpdir])
+
+        runtime = KarmaRuntime(self.driver, working_set=working_set)
+        runtime.argparser
+        self.assertTrue(exists(join(cache_dir, 'runtime.entry_points.json')))
+
+        # the entry point is no longer imported for the listing.
+        del mocks.dummy
+        runtime = KarmaRuntime(self.driver, working_set=working_set)
+        stream = mocks.StringIO()
+        runtime.argparser.print_help(file=stream)
+        self.assertIn('dummy null runtime', stream.getvalue())
+
+        # but will fail once the subcommand is actually used.
+        stub_stdouts(self)
+        with pretty_logging(logger='calmjs', stream=mocks.StringIO()):
+            with self.assertRaises(SystemExit):
+                runtime.argparser.parse_args(['null'])
+        self.assertIn('cannot load entry point', sys.stderr.getvalue())
+
     def test_karma_runtime_integration_default_abort_on_error(self):
         stub_stdouts(self)
         target = join(mkdtemp(self), 'target')
@@ -681,13 +898,14 @@ class CliRuntimeTestCase(unittest.TestCase):
 
         _called = []
 
-        def fake_flatten_module_registry_names(package_names):
+        def fake_flatten_module_registry_names(
+                package_names, working_set=None):
             _called.extend(package_names)
             return ['calmjs.dev.module']
 
-        from calmjs.dev import toolchain
+        from calmjs.dev import dist
         stub_item_attr_value(
-            self, toolchain, 'flatten_module_registry_names',
+            self, dist, 'flatten_module_registry_names',
             fake_flatten_module_registry_names
         )
 
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import unittest
+from os.path import join
+
+from calmjs.dev import testcache
+
+from calmjs.testing.utils import mkdtemp
+
+
+class TestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+
+    def write(self, name, contents):
+        path = join(self.root, name)
+        with open(path, 'w') as fd:
+            fd.write(contents)
+        return path
+
+    def test_fingerprints(self):
+        paths = {
+            'test_a': self.write('test_a.js', 'a'),
+            'test_b': self.write('test_b.js', 'b'),
+            'test_c': self.write('test_c.js', 'a'),
+            'test_missing': join(self.root, 'missing.js'),
+        }
+        results = testcache.fingerprints('base', paths, processes=2)
+        self.assertEqual(sorted(results), ['test_a', 'test_b', 'test_c'])
+        self.assertNotEqual(results['test_a'], results['test_b'])
+        # identified by the contents only.
+        self.assertEqual(results['test_a'], results['test_c'])
+        self.assertNotEqual(
+            testcache.fingerprints('other', paths)['test_a'],
+            results['test_a'])
+
+    def test_select_cached(self):
+        self.assertEqual(testcache.select_cached(
+            {'test_a': 'a', 'test_b': 'old', 'test_c': 'c'},
+            {'test_a': 'a', 'test_b': 'b', 'test_d': 'd'},
+        ), ['test_a'])
+
+    def test_attribute_results(self):
+        suite_files = {'A': 'a.js', 'B': 'b.js', 'C': 'c.js'}
+        path_names = {'a.js': 'test_a', 'b.js': 'test_b', 'c.js': 'test_c'}
+        self.assertEqual(testcache.attribute_results([
+            {'suite': ['A'], 'status': 'success'},
+            {'suite': ['A', 'nested'], 'status': 'skipped'},
+            {'suite': ['B'], 'status': 'success'},
+            {'suite': ['B'], 'status': 'failed'},
+            {'suite': ['Z'], 'status': 'failed'},
+            {'suite': [], 'status': 'success'},
+        ], suite_files, path_names), (set(['test_a']), set(['test_b']), 1))
+
+    def test_update_cache(self):
+        cache_dir = mkdtemp(self)
+        self.assertEqual(testcache.load_cache(cache_dir), {})
+        testcache.update_cache(
+            cache_dir, {'test_a': 'a', 'test_b': 'b'}, ['test_a', 'test_b'],
+            [])
+        testcache.update_cache(
+            cache_dir, {'test_a': 'a2', 'test_b': 'b2'}, [], ['test_b'])
+        self.assertEqual(testcache.load_cache(cache_dir), {'test_a': 'a'})
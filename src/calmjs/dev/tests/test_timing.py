@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import unittest
+from os.path import exists
+from os.path import join
+
+from calmjs.utils import pretty_logging
+
+from calmjs.dev import timing
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+
+
+def result(suite, name, duration, status='success'):
+    return {
+        'browser': 'PhantomJS', 'suite': suite, 'name': name,
+        'duration': duration, 'status': status,
+    }
+
+
+class TimingTestCase(unittest.TestCase):
+
+    def test_get_timing_reporter_path(self):
+        self.assertTrue(exists(timing.get_timing_reporter_path()))
+
+    def test_map_suites_to_files(self):
+        root = mkdtemp(self)
+        test_a = join(root, 'test_a.js')
+        test_b = join(root, 'test_b.js')
+        with open(test_a, 'w') as fd:
+            fd.write("describe('Suite A', function() {\n"
+                     "    describe('nested', function() {});\n});\n")
+        with open(test_b, 'w') as fd:
+            fd.write('describe("Suite B", function() {});\n')
+        self.assertEqual(timing.map_suites_to_files([
+            test_a, test_b, join(root, 'missing.js')]), {
+            'Suite A': test_a,
+            'nested': test_a,
+            'Suite B': test_b,
+        })
+
+    def test_map_suites_to_files_duplicated(self):
+        root = mkdtemp(self)
+        test_a = join(root, 'test_a.js')
+        test_b = join(root, 'test_b.js')
+        with open(test_a, 'w') as fd:
+            fd.write("describe('Suite', function() {});\n"
+                     "describe('Suite A', function() {});\n")
+        with open(test_b, 'w') as fd:
+            fd.write("describe('Suite', function() {});\n")
+        with pretty_logging(
+                logger='calmjs.dev', stream=mocks.StringIO()) as log:
+            result = timing.map_suites_to_files([test_a, test_b])
+        self.assertEqual(result, {'Suite A': test_a})
+        self.assertIn(
+            "suite 'Suite' is declared in multiple test modules",
+            log.getvalue())
+
+    def test_update_timings(self):
+        store = {}
+        timing.update_timings(store, [
+            result(['A'], 'one', 10),
+            result(['A', 'nested'], 'two', 30),
+            result(['B'], 'three', 5),
+            result(['B'], 'skip', 0, 'skipped'),
+            result([], 'orphan', 1),
+        ], {'A': 'test_a.js'})
+        self.assertEqual(store, {
+            'tests': {
+                'A > one': [10.0, 1],
+                'A > nested > two': [30.0, 1],
+                'B > three': [5.0, 1],
+            },
+            'files': {'test_a.js': [40.0, 1]},
+        })
+        timing.update_timings(store, [result(['A'], 'one', 20)], {
+            'A': 'test_a.js'})
+        self.assertEqual(store['tests']['A > one'], [15.0, 2])
+        self.assertEqual(store['files']['test_a.js'], [30.0, 2])
+        self.assertEqual(timing.file_durations(store), {'test_a.js': 30.0})
+
+    def test_store_roundtrip(self):
+        root = mkdtemp(self)
+        self.assertEqual(timing.load_store(root), {})
+        timing.save_store(root, {'tests': {'A > one': [1.0, 1]}})
+        self.assertEqual(timing.load_store(root), {
+            'tests': {'A > one': [1.0, 1]}})
+
+    def test_slowest(self):
+        store = {'tests': {'a': [1.0, 1], 'b': [3.0, 1], 'c': [2.0, 1]}}
+        self.assertEqual(timing.slowest(store, 2), [('b', 3.0), ('c', 2.0)])
+        self.assertEqual(timing.slowest(store, 2, 'files'), [])
+
+    def test_format_slowest(self):
+        store = {
+            'tests': {'a': [1.0, 1], 'b': [3.0, 1]},
+            'files': {'test.js': [4.0, 1]},
+        }
+        self.assertEqual(timing.format_slowest(store, 5).splitlines(), [
+            'slowest 2 tests:',
+            '       3.0ms  b',
+            '       1.0ms  a',
+            'slowest 1 files:',
+            '       4.0ms  test.js',
+        ])
+        self.assertEqual(timing.format_slowest({}, 5), '')
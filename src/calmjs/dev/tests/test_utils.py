@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import sys
+from io import BytesIO
+from os.path import join
+from os.path import realpath
+from subprocess import CalledProcessError
+from subprocess import check_call
 
 from calmjs.toolchain import Toolchain
 
 from calmjs.dev import utils
 
+from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import stub_os_environ
 
 
@@ -54,6 +62,12 @@ class ToolchainTargetsTestCase(unittest.TestCase):
             toolchain, include_targets_from=('explicit',)))
         self.assertEqual(result, ['explicit_targets'])
 
+    def test_grab_source_map_keys(self):
+        toolchain = Toolchain()
+        result = utils.get_toolchain_source_map_keys(toolchain)
+        self.assertEqual(
+            result, ['transpile_source_map', 'bundle_source_map'])
+
 
 class TargetsFromSpecTestCase(unittest.TestCase):
 
@@ -92,3 +106,152 @@ class TargetsFromSpecTestCase(unittest.TestCase):
             '/move/to/m1.js', '/move/to/m2.js',
             '/path/to/t1.js', '/path/to/t2.js',
         ])
+
+
+class PartitionTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(utils.partition([], 4), [])
+
+    def test_round_robin(self):
+        self.assertEqual(utils.partition(range(7), 3), [
+            [0, 3, 6], [1, 4], [2, 5]])
+
+    def test_more_shards_than_items(self):
+        self.assertEqual(utils.partition('ab', 4), [['a'], ['b']])
+
+    def test_weighted(self):
+        self.assertEqual(utils.partition_weighted(
+            ['a', 'b', 'c', 'd'], 2, {'a': 1, 'b': 5, 'c': 2, 'd': 2}), [
+            ['b'], ['a', 'c', 'd']])
+
+    def test_weighted_unknown_uses_mean(self):
+        self.assertEqual(utils.partition_weighted(
+            ['a', 'b', 'c'], 2, {'a': 4, 'b': 2}), [
+            ['a'], ['b', 'c']])
+
+    def test_weighted_empty(self):
+        self.assertEqual(utils.partition_weighted([], 3, {}), [])
+
+
+class StreamIfChangedTestCase(unittest.TestCase):
+
+    def test_stream_if_changed(self):
+        target = join(mkdtemp(self), 'out.json')
+        digest = utils.stream_if_changed(
+            target, iter([u'{"a":', u'"\u2713"}']))
+        with open(target, 'rb') as fd:
+            self.assertEqual(fd.read(), u'{"a":"\u2713"}'.encode('utf8'))
+        os.utime(target, (1000, 1000))
+        self.assertEqual(digest, utils.stream_if_changed(target, [
+            u'{"a":"\u2713"}']))
+        self.assertEqual(os.path.getmtime(target), 1000)
+        self.assertNotEqual(digest, utils.stream_if_changed(target, ['{}']))
+        self.assertNotEqual(os.path.getmtime(target), 1000)
+        self.assertEqual(os.listdir(os.path.dirname(target)), ['out.json'])
+
+
+class GitChangedFilesTestCase(unittest.TestCase):
+
+    def test_not_a_repo(self):
+        with self.assertRaises((OSError, CalledProcessError)):
+            utils.get_git_changed_files('HEAD', cwd=mkdtemp(self))
+
+    def test_changed_files(self):
+        root = realpath(mkdtemp(self))
+
+        def git(*args):
+            check_call(('git', '-c', 'user.name=t', '-c', 'user.email=t@t') +
+                       args, cwd=root)
+
+        def write(name, contents):
+            with open(join(root, name), 'w') as fd:
+                fd.write(contents)
+
+        git('init', '-q')
+        write('kept.js', 'var a;')
+        write('modified.js', 'var b;')
+        git('add', '.')
+        git('commit', '-q', '-m', 'initial')
+        write('modified.js', 'var c;')
+        write('new.js', 'var d;')
+        os.mkdir(join(root, 'sub'))
+        self.assertEqual(sorted(utils.get_git_changed_files(
+            'HEAD', cwd=join(root, 'sub'))), [
+            join(root, 'modified.js'), join(root, 'new.js'),
+        ])
+
+
+class TeeCallTestCase(unittest.TestCase):
+
+    def test_tee_call(self):
+        stdout = mocks.StringIO()
+        stderr = mocks.StringIO()
+        lines = []
+        result = utils.tee_call([
+            sys.executable, '-c',
+            'import sys; sys.stdout.write("a\\nb\\n"); '
+            'sys.stderr.write("err\\n"); sys.exit(2)',
+        ], line_handler=lines.append, stdout=stdout, stderr=stderr)
+        self.assertEqual(result, 2)
+        self.assertEqual(lines, ['a\n', 'b\n'])
+        self.assertEqual(stdout.getvalue(), 'a\nb\n')
+        self.assertEqual(stderr.getvalue(), 'err\n')
+
+    def test_tee_call_bytes_stream(self):
+        stdout = BytesIO()
+        lines = []
+        result = utils.tee_call([
+            sys.executable, '-c',
+            'import sys; '
+            'out = getattr(sys.stdout, "buffer", sys.stdout); '
+            'out.write(b"\\xe2\\x9c\\x93 passed\\n")',
+        ], line_handler=lines.append, stdout=stdout)
+        self.assertEqual(result, 0)
+        self.assertEqual(lines, [u'\u2713 passed\n'])
+        self.assertEqual(stdout.getvalue(), b'\xe2\x9c\x93 passed\n')
+
+    def test_tee_call_ascii_stream(self):
+        class AsciiStream(object):
+            # emulate sys.stdout under Python 2 when piped.
+            encoding = None
+
+            def __init__(self):
+                self.written = []
+
+            def write(self, value):
+                if not isinstance(value, bytes):
+                    value.encode('ascii')
+                self.written.append(value)
+
+            def flush(self):
+                pass
+
+        stdout = AsciiStream()
+        result = utils.tee_call([
+            sys.executable, '-c',
+            'import sys; '
+            'out = getattr(sys.stdout, "buffer", sys.stdout); '
+            'out.write(b"\\xe2\\x9c\\x93 passed\\n")',
+        ], stdout=stdout)
+        self.assertEqual(result, 0)
+        self.assertEqual(stdout.written, [b'\xe2\x9c\x93 passed\n'])
+
+    def test_tee_call_broken_stream_drained(self):
+        class BrokenStream(object):
+            def write(self, value):
+                raise IOError('broken')
+
+            def flush(self):
+                pass
+
+        lines = []
+        # more output than the buffer of a pipe may hold.
+        result = utils.tee_call([
+            sys.executable, '-c',
+            'import sys; '
+            'out = getattr(sys.stdout, "buffer", sys.stdout); '
+            'out.write(b"\\xe2\\x9c\\x93 passed\\n" * 20000)',
+        ], line_handler=lines.append, stdout=BrokenStream())
+        self.assertEqual(result, 0)
+        self.assertEqual(len(lines), 20000)
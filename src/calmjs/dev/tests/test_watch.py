@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import unittest
+import os
+from os.path import exists
+from os.path import join
+
+from calmjs.toolchain import NullToolchain
+from calmjs.toolchain import Spec
+
+from calmjs.dev import cli
+from calmjs.dev import dist
+from calmjs.dev import watch
+
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_base_which
+from calmjs.testing.utils import stub_item_attr_value
+from calmjs.testing.utils import stub_mod_call
+
+
+def write(path, contents, mtime=None):
+    with open(path, 'w') as fd:
+        fd.write(contents)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def test_snapshot_and_changed_paths(self):
+        root = mkdtemp(self)
+        a = write(join(root, 'a.js'), 'a', 1000)
+        os.mkdir(join(root, 'pkg'))
+        b = write(join(root, 'pkg', 'b.js'), 'b', 1000)
+        old = watch.snapshot([a, join(root, 'pkg'), join(root, 'missing')])
+        self.assertEqual(old, {a: 1000, b: 1000})
+
+        write(b, 'bb', 2000)
+        c = write(join(root, 'pkg', 'c.js'), 'c', 1000)
+        os.remove(a)
+        new = watch.snapshot([a, join(root, 'pkg')])
+        self.assertEqual(watch.changed_paths(old, new), {a, b, c})
+        self.assertEqual(watch.changed_paths(new, new), set())
+
+    def test_recompile(self):
+        root = mkdtemp(self)
+        build_dir = mkdtemp(self)
+        source = write(join(root, 'mod.js'), 'var mod = 1;')
+        other = write(join(root, 'other.js'), 'var other = 1;')
+        spec = Spec(build_dir=build_dir, transpile_source_map={
+            'mod': source, 'other': other, 'gone': join(root, 'gone.js')})
+        self.assertEqual(watch.recompile(NullToolchain(), spec, {
+            source, join(root, 'gone.js')}), ['mod'])
+        with open(join(build_dir, 'mod.js')) as fd:
+            self.assertEqual(fd.read(), 'var mod = 1;')
+        self.assertFalse(exists(join(build_dir, 'other.js')))
+
+
+class WatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stub_mod_call(self, cli)
+        stub_base_which(self)
+        self.root = mkdtemp(self)
+        self.build_dir = mkdtemp(self)
+        self.source = write(join(self.root, 'mod.js'), 'var a;', 1000)
+        self.tests = join(self.root, 'tests')
+        os.mkdir(self.tests)
+        self.test_mod = write(join(self.tests, 'test_mod.js'), '', 1000)
+        os.utime(self.tests, (1000, 1000))
+        self.test_module_paths_map = {'tests/test_mod': self.test_mod}
+        stub_item_attr_value(
+            self, dist, 'get_module_registries_dependencies',
+            lambda *a, **kw: dict(self.test_module_paths_map))
+
+        self.driver = cli.KarmaDriver.create()
+        self.toolchain = NullToolchain()
+        self.spec = Spec(
+            build_dir=self.build_dir,
+            transpile_source_map={'mod': self.source},
+        )
+        self.driver.setup_toolchain_spec(self.toolchain, self.spec)
+        self.toolchain(self.spec)
+        self.call_args = None
+
+    def test_no_changes(self):
+        watcher = watch.Watcher(self.driver, self.toolchain, self.spec)
+        self.assertEqual(
+            watcher.watched_paths(), sorted([self.source, self.test_mod]))
+        self.assertFalse(watcher.step())
+        self.assertIsNone(self.call_args)
+
+    def test_source_changed(self):
+        config_fn = self.spec['karma_config_path']
+        os.utime(config_fn, (1000, 1000))
+        watcher = watch.Watcher(self.driver, self.toolchain, self.spec)
+        write(self.source, 'var b;', 2000)
+        self.assertTrue(watcher.step())
+        with open(join(self.build_dir, 'mod.js')) as fd:
+            self.assertEqual(fd.read(), 'var b;')
+        self.assertEqual(self.call_args[0][0][1:3], ['start', config_fn])
+        # config untouched
+        self.assertEqual(os.path.getmtime(config_fn), 1000)
+        self.assertFalse(watcher.step())
+
+    def test_test_module_added(self):
+        watcher = watch.Watcher(self.driver, self.toolchain, self.spec)
+        added = write(join(self.tests, 'test_new.js'), '')
+        os.utime(self.tests, (2000, 2000))
+        self.test_module_paths_map['tests/test_new'] = added
+        self.assertTrue(watcher.step())
+        self.assertIn(added, self.spec['karma_config']['files'])
+        with open(self.spec['karma_config_path']) as fd:
+            self.assertIn('test_new.js', fd.read())
+        self.assertIn(added, watcher.watched_paths())
+        self.assertFalse(watcher.step())
+
+    def test_refresh_config_unchanged(self):
+        watcher = watch.Watcher(self.driver, self.toolchain, self.spec)
+        config = self.spec['karma_config']
+        self.assertFalse(watcher.refresh_config())
+        self.assertIs(self.spec['karma_config'], config)
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def test_watch_setup(self):
+        records = []
+
+        class Driver(object):
+            def run(self, toolchain, spec):
+                records.append(exists(spec['build_dir']))
+
+            def stop_servers(self):
+                records.append('stopped')
+
+        stub_item_attr_value(
+            self, watch.Watcher, 'run', lambda self: records.append('watch'))
+        spec = Spec(karma_abort_on_test_failure=True, karma_shards=2)
+        watch.watch(Driver(), NullToolchain(), spec)
+        self.assertEqual(records, [True, 'watch', 'stopped'])
+        self.assertTrue(spec['karma_persistent_server'])
+        self.assertNotIn('karma_abort_on_test_failure', spec)
+        self.assertNotIn('karma_shards', spec)
+        # the temporary build directory is removed.
+        self.assertFalse(exists(spec['build_dir']))
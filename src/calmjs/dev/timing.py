@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the recording of test durations across runs, and
+reporting of the slowest tests.
+"""
+
+import codecs
+import logging
+import re
+from os.path import isfile
+
+from pkg_resources import resource_filename
+
+from calmjs.dev import cache
+
+logger = logging.getLogger(__name__)
+
+TIMING_REPORTER = 'calmjs-timing'
+TIMING_REPORTER_CONFIG = 'calmjsTimingReporter'
+TIMINGS_JSON = 'timings.json'
+
+_describe = re.compile(r'''describe\(\s*(['"])(.*?)\1''')
+
+
+def get_timing_reporter_path():
+    """
+    Return the path to the bundled karma timing reporter plugin.
+    """
+
+    return resource_filename('calmjs.dev', 'plugins/timing_reporter.js')
+
+
+def map_suites_to_files(test_module_paths):
+    """
+    Map the names of the suites declared through describe in the test
+    modules to the path of the module that declared them.  Names that
+    are declared by more than one module are omitted, as the durations
+    of their tests cannot be attributed to a specific module.
+    """
+
+    result = {}
+    ambiguous = {}
+    for path in test_module_paths:
+        if not isfile(path):
+            continue
+        with codecs.open(path, encoding='utf8', errors='replace') as fd:
+            for match in _describe.finditer(fd.read()):
+                name = match.group(2)
+                if result.setdefault(name, path) != path:
+                    ambiguous.setdefault(name, set([result[name]])).add(path)
+    for name, paths in sorted(ambiguous.items()):
+        logger.warning(
+            "suite '%s' is declared in multiple test modules %r; the "
+            "durations of its tests will not be attributed to any of them",
+            name, sorted(paths),
+        )
+        result.pop(name)
+    return result
+
+
+def result_id(result):
+    return ' > '.join(list(result['suite']) + [result['name']])
+
+
+def _accumulate(entries, key, duration):
+    # entries are stored as [mean duration, number of samples].
+    mean, count = entries.get(key, [0, 0])
+    entries[key] = [(mean * count + duration) / float(count + 1), count + 1]
+
+
+def update_timings(store, results, suite_files):
+    """
+    Update the timing store with the durations from a list of results
+    as produced by the timing reporter; the duration of each file is
+    the sum of the durations of the tests declared in its top level
+    suite.
+    """
+
+    tests = store.setdefault('tests', {})
+    files = store.setdefault('files', {})
+    file_durations = {}
+    for result in results:
+        if result.get('status') == 'skipped' or not result.get('suite'):
+            continue
+        duration = result.get('duration') or 0
+        _accumulate(tests, result_id(result), duration)
+        path = suite_files.get(result['suite'][0])
+        if path:
+            file_durations[path] = file_durations.get(path, 0) + duration
+    for path, duration in file_durations.items():
+        _accumulate(files, path, duration)
+    return store
+
+
+def load_store(cache_dir):
+    return cache.read_json(cache_dir, TIMINGS_JSON, {})
+
+
+def save_store(cache_dir, store):
+    cache.write_json(cache_dir, TIMINGS_JSON, store)
+
+
+def file_durations(store):
+    """
+    Return the mapping of test file paths to their mean duration.
+    """
+
+    return {
+        path: entry[0] for path, entry in store.get('files', {}).items()}
+
+
+def slowest(store, count, kind='tests'):
+    """
+    Return a list of (name, mean duration) tuples of the slowest entries
+    of the kind from the store.
+    """
+
+    return sorted(
+        ((key, entry[0]) for key, entry in store.get(kind, {}).items()),
+        key=lambda item: (-item[1], item[0]),
+    )[:count]
+
+
+def format_slowest(store, count):
+    """
+    Produce a report of the slowest tests and test files.
+    """
+
+    lines = []
+    for kind in ('tests', 'files'):
+        entries = slowest(store, count, kind)
+        if not entries:
+            continue
+        lines.append('slowest %d %s:' % (len(entries), kind))
+        lines.extend(
+            '%10.1fms  %s' % (duration, name) for name, duration in entries)
+    return '\n'.join(lines)
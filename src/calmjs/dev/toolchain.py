@@ -2,9 +2,15 @@
 from calmjs.toolchain import Toolchain
 from calmjs.toolchain import CALMJS_MODULE_REGISTRY_NAMES
 from calmjs.toolchain import TEST_PACKAGE_NAMES
-from calmjs.dist import flatten_module_registry_names
+
+from calmjs.dev import dist
 
 # reserved terms
+# the directory to persist caches across runs
+CACHE_DIR = 'cache_dir'
+# the shared calmjs.dev.dist.Resolver instance for the run, as returned
+# by get_resolver.
+DIST_RESOLVER = 'dist_resolver'
 # flag for enabling coverage through karma-coverage (istanbul)
 COVERAGE_ENABLE = 'coverage_enable'
 # the type of the coverage report to generate
@@ -17,12 +23,31 @@ COVER_BUNDLE = 'cover_bundle'
 COVER_REPORT_DIR = 'cover_report_dir'
 # the file to write the coverage report to for selected reporters.
 COVER_REPORT_FILE = 'cover_report_file'
+# the dir to write the raw coverage reports with unique names to.
+COVER_RAW_DIR = 'cover_raw_dir'
 # flag for including coverage report for tests.
 COVER_TEST = 'cover_test'
+# list of glob patterns for the paths to exclude from coverage.
+COVER_EXCLUDE = 'cover_exclude'
+# flag for caching the instrumented sources in the cache directory.
+COVER_CACHE = 'cover_cache'
+# flag for producing the coverage reports from the raw coverage report
+# in Python, rather than through the reporters of karma-coverage.
+COVER_NATIVE = 'cover_native'
 # no wrap tests with a function closure
 NO_WRAP_TESTS = 'no_wrap_tests'
 # test filename prefix
 TEST_FILENAME_PREFIX = 'test_filename_prefix'
+# list of changed files for selecting only the affected tests
+TEST_CHANGED_FILES = 'test_changed_files'
+# the git ref that changed files will be derived from
+TEST_CHANGED_SINCE = 'test_changed_since'
+# flag for recording and selecting the test modules through the index
+# of the source modules executed by them
+TEST_IMPACT_INDEX = 'test_impact_index'
+# flag for running the test modules that have passed in a previous run
+# with identical inputs, which are otherwise skipped.
+TEST_NO_CACHE = 'test_no_cache'
 
 # values for some of the above keys
 COVERAGE_TYPE_DEFAULT = 'default'
@@ -30,6 +55,20 @@ COVER_REPORT_DIR_DEFAULT = 'coverage'
 TEST_FILENAME_PREFIX_DEFAULT = 'test'
 
 
+def get_resolver(spec):
+    """
+    Return the resolver of the packages and the modules declared for
+    them that is shared by every step of the run with the spec, which
+    is created and assigned to the spec on first use.  The advices from
+    other packages should query this rather than resolving the packages
+    and the registries again.
+    """
+
+    if spec.get(DIST_RESOLVER) is None:
+        spec[DIST_RESOLVER] = dist.Resolver(cache_dir=spec.get(CACHE_DIR))
+    return spec[DIST_RESOLVER]
+
+
 class TestToolchain(Toolchain):
     """
     A toolchain that truly does nothing, except to fit in with the
@@ -67,5 +106,6 @@ class KarmaToolchain(TestToolchain):
     def prepare(self, spec):
         # simply add the registry names provided by as test package
         # names
-        spec[CALMJS_MODULE_REGISTRY_NAMES] = flatten_module_registry_names(
-            spec.get(TEST_PACKAGE_NAMES, []))
+        spec[CALMJS_MODULE_REGISTRY_NAMES] = list(
+            get_resolver(spec).flatten_module_registry_names(
+                spec.get(TEST_PACKAGE_NAMES, [])))
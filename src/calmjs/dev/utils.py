@@ -1,7 +1,22 @@
 # -*- coding: utf-8 -*-
+import codecs
 import os
+import socket
+import sys
+from hashlib import sha256
 from itertools import chain
+from multiprocessing.pool import ThreadPool
+from os.path import exists
+from os.path import join
+from subprocess import check_output
+from subprocess import Popen
+from subprocess import PIPE
+from threading import Thread
 
+from calmjs.dev.cache import file_digest
+
+# the default number of threads for the pools of threads.
+THREADS_DEFAULT = 8
 
 # keys that are needed by various platforms for successful launching of
 # graphical browsers:
@@ -54,6 +69,20 @@ def get_toolchain_targets_keys(
     )
 
 
+def get_toolchain_source_map_keys(toolchain):
+    """
+    Derive the keys that a toolchain instance will read the source maps
+    from the Spec instances passed into it.  This will be acquired from
+    the ``compile_entries`` attribute and be joined with its
+    ``sourcemap_suffix`` attribute.
+    """
+
+    return [
+        entry[1] + toolchain.sourcemap_suffix
+        for entry in toolchain.compile_entries
+    ]
+
+
 def get_targets_from_spec(spec, spec_keys):
     """
     Used in conjunction with the output from get_toolchain_targets_keys,
@@ -61,3 +90,193 @@ def get_targets_from_spec(spec, spec_keys):
     """
 
     return chain.from_iterable(spec.get(key, {}).values() for key in spec_keys)
+
+
+def write_if_changed(path, contents):
+    """
+    Write the contents to the file at path, unless the file already has
+    the identical contents.  Returns True if the file was written.
+    """
+
+    if exists(path):
+        with codecs.open(path, encoding='utf8') as fd:
+            if fd.read() == contents:
+                return False
+    with codecs.open(path, 'w', encoding='utf8') as fd:
+        fd.write(contents)
+    return True
+
+
+def stream_if_changed(path, chunks):
+    """
+    Stream the chunks of text into the file at path, unless the file
+    already has the identical contents.  Returns the hex digest of the
+    contents.
+    """
+
+    h = sha256()
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as fd:
+        for chunk in chunks:
+            data = chunk.encode('utf8')
+            h.update(data)
+            fd.write(data)
+    digest = h.hexdigest()
+    if exists(path) and file_digest(path) == digest:
+        os.remove(tmp)
+        return digest
+    if exists(path):
+        # os.rename does not replace an existing file on Windows.
+        os.remove(path)
+    os.rename(tmp, path)
+    return digest
+
+
+def check_port(port, host='localhost', timeout=0.5):
+    """
+    Return True if something is accepting connections at the provided
+    port on the host.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        return sock.connect_ex((host, port)) == 0
+    finally:
+        sock.close()
+
+
+def thread_map(func, items, processes=None):
+    """
+    Apply func to every one of the items through a pool of threads,
+    returning the results in the order of the items.  The items are
+    processed directly if there are fewer than two of them.
+    """
+
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    pool = ThreadPool(processes or min(len(items), THREADS_DEFAULT))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def partition(items, count):
+    """
+    Partition the provided items into at most count lists in a round
+    robin manner, such that the lengths of the resulting lists differ
+    by at most one.  Empty lists are not returned.
+    """
+
+    items = list(items)
+    count = max(1, min(count, len(items)))
+    return [items[idx::count] for idx in range(count) if items[idx::count]]
+
+
+def get_git_changed_files(ref, cwd=None):
+    """
+    Return the absolute paths of the files that differ between the git
+    ref and the working tree of the repository at cwd, including files
+    not yet tracked.
+    """
+
+    def git(cwd, *args):
+        return check_output(('git',) + args, cwd=cwd).decode('utf8')
+
+    root = git(cwd, 'rev-parse', '--show-toplevel').strip()
+    names = git(root, 'diff', '--name-only', ref).splitlines() + git(
+        root, 'ls-files', '--others', '--exclude-standard').splitlines()
+    return [join(root, name) for name in names if name]
+
+
+def partition_weighted(items, count, weights):
+    """
+    Partition the provided items into at most count lists, such that
+    the sums of the weights of the items in the lists are balanced.
+    Items without a weight are assigned the mean of the known weights.
+    Items retain their original order within each list, and empty lists
+    are not returned.
+    """
+
+    items = list(items)
+    known = [weights[item] for item in items if item in weights]
+    default = sum(known) / float(len(known)) if known else 1
+    count = max(1, min(count, len(items)))
+    bins = [[0, idx, []] for idx in range(count)]
+    # assign the heaviest items first to the lightest bin.
+    for pos, item in sorted(
+            enumerate(items),
+            key=lambda i: (-weights.get(i[1], default), i[0])):
+        target = min(bins)
+        target[0] += weights.get(item, default)
+        target[2].append(pos)
+    return [[items[pos] for pos in sorted(b[2])] for b in bins if b[2]]
+
+
+def write_line(stream, line, text):
+    """
+    Write a line of output to the stream, where line is the raw bytes
+    and text is the decoded version.  Streams backed by a buffer will
+    have the raw bytes written to them.
+    """
+
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is not None:
+        # write the raw bytes, such that streams with an encoding that
+        # cannot represent the text will not fail.
+        stream.flush()
+        buffer.write(line)
+        buffer.flush()
+        return
+    try:
+        stream.write(text)
+    except (TypeError, UnicodeError):
+        # streams that only accept bytes, or streams without an encoding
+        # such as sys.stdout under Python 2 when piped.
+        stream.write(text.encode(
+            getattr(stream, 'encoding', None) or 'utf8', 'replace'))
+    stream.flush()
+
+
+def _pump(pipe, stream, line_handler):
+    for line in iter(pipe.readline, b''):
+        text = line.decode('utf8', 'replace')
+        try:
+            write_line(stream, line, text)
+        except (IOError, OSError, ValueError, TypeError, UnicodeError):
+            # the pipe must be drained regardless, as the process would
+            # otherwise block once the buffer of the pipe is filled.
+            pass
+        if line_handler:
+            line_handler(text)
+    pipe.close()
+
+
+def tee_call(args, line_handler=None, stdout=None, stderr=None, **kw):
+    """
+    Run the command described by args like subprocess.call, except the
+    output of the process is forwarded line by line to the stdout and
+    stderr streams (defaults to the ones in sys) as it is produced, such
+    that nothing accumulates in memory.  Every line from the standard
+    output is also passed to the line_handler, if provided.
+
+    Returns the return code of the process.
+    """
+
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    proc = Popen(args, stdout=PIPE, stderr=PIPE, **kw)
+    threads = [
+        Thread(target=_pump, args=(proc.stdout, stdout, line_handler)),
+        Thread(target=_pump, args=(proc.stderr, stderr, None)),
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    return_code = proc.wait()
+    for thread in threads:
+        thread.join()
+    return return_code
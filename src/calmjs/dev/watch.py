@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Module that provides the watch mode, where the sources and tests for a
+spec are monitored for changes, such that only the changed modules are
+recompiled through the toolchain before the tests are rerun against the
+browsers already captured by a persistent karma server.
+"""
+
+import logging
+import os
+import shutil
+from os.path import getmtime
+from os.path import isdir
+from os.path import isfile
+from os.path import join
+from os.path import realpath
+from tempfile import mkdtemp
+from time import sleep
+
+from calmjs.toolchain import ARTIFACT_PATHS
+from calmjs.toolchain import BUILD_DIR
+from calmjs.toolchain import TEST_MODULE_PATHS_MAP
+
+from calmjs.dev import karma
+from calmjs.dev.cache import check_stamps
+from calmjs.dev.cache import path_stamps
+from calmjs.dev.toolchain import DIST_RESOLVER
+
+logger = logging.getLogger(__name__)
+
+# seconds between each check for changes.
+WATCH_INTERVAL = 0.5
+
+
+def snapshot(paths):
+    """
+    Return a mapping of the files at the provided paths to their
+    modification times; directories are walked for the files within.
+    """
+
+    result = {}
+    for path in paths:
+        if isfile(path):
+            result[path] = getmtime(path)
+        elif isdir(path):
+            for root, dirs, files in os.walk(path):
+                for name in files:
+                    target = join(root, name)
+                    result[target] = getmtime(target)
+    return result
+
+
+def changed_paths(old, new):
+    """
+    Return the set of paths that were modified, added or removed
+    between two snapshots.
+    """
+
+    return set(
+        path for path in set(old) | set(new) if old.get(path) != new.get(path))
+
+
+def get_compile_source_maps(toolchain, spec):
+    """
+    Return a list of (method, source map) pairs for the compile entries
+    of the toolchain, with the source map being the mapping of module
+    names to their sources as read from the spec.
+    """
+
+    results = []
+    for m, read_key, store_key in toolchain.compile_entries:
+        method = m if callable(m) else getattr(
+            toolchain, toolchain.compile_prefix + m, None)
+        if not callable(method):
+            continue
+        results.append((method, spec.get(
+            read_key + toolchain.sourcemap_suffix, {})))
+    return results
+
+
+def recompile(toolchain, spec, changed):
+    """
+    Recompile the modules with their sources among the changed paths
+    through the compile methods of the toolchain; returns the sorted
+    list of the names of the recompiled modules.
+    """
+
+    recompiled = []
+    for method, source_map in get_compile_source_maps(toolchain, spec):
+        subset = {}
+        for modname, source in source_map.items():
+            if source not in changed:
+                continue
+            if not isfile(source):
+                logger.warning(
+                    "cannot recompile '%s' as its source '%s' is not a "
+                    "file", modname, source,
+                )
+                continue
+            subset[modname] = source
+        if subset:
+            modpaths, targets, export_module_names = method(
+                spec, toolchain._gen_modname_source_target_modpath(
+                    spec, subset))
+            recompiled.extend(modpaths)
+    return sorted(recompiled)
+
+
+class Watcher(object):
+    """
+    Watch the sources and the tests of a spec that was already executed
+    with a persistent karma server, and rerun the tests whenever they
+    change.
+    """
+
+    def __init__(self, driver, toolchain, spec, interval=WATCH_INTERVAL):
+        self.driver = driver
+        self.toolchain = toolchain
+        self.spec = spec
+        self.interval = interval
+        self.reset()
+
+    def watched_paths(self):
+        paths = set()
+        for method, source_map in get_compile_source_maps(
+                self.toolchain, self.spec):
+            paths.update(source_map.values())
+        paths.update(self.spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+        return sorted(paths)
+
+    def reset(self):
+        paths = self.watched_paths()
+        self.snapshot = snapshot(paths)
+        # the parent directories of the test modules, such that added
+        # or removed test modules may be detected.
+        self.stamps = path_stamps(
+            self.spec.get(TEST_MODULE_PATHS_MAP, {}).values())
+
+    def refresh_config(self):
+        """
+        Resolve the test modules again and produce a new config for the
+        spec, which is only written if the set of files has changed.
+        """
+
+        previous = self.spec.get(karma.KARMA_CONFIG, {})
+        # the memoized results of the previous resolution are discarded.
+        self.spec.pop(TEST_MODULE_PATHS_MAP, None)
+        self.spec.pop(DIST_RESOLVER, None)
+        self.driver.create_config(self.spec)
+        files = list(self.spec.get(ARTIFACT_PATHS) or []) + list(
+            self.spec[karma.KARMA_CONFIG].get('files', []))
+        if files == previous.get('files'):
+            self.spec[karma.KARMA_CONFIG] = previous
+            return False
+        logger.info('set of files changed; rewriting karma configuration')
+        self.driver.write_config(self.spec)
+        return True
+
+    def step(self):
+        """
+        Check for changes once, and recompile the changed modules and
+        rerun the tests if there are any.  Returns True if the tests
+        were rerun.
+        """
+
+        current = snapshot(self.watched_paths())
+        changed = changed_paths(self.snapshot, current)
+        self.snapshot = current
+        if not changed and check_stamps(self.stamps):
+            return False
+
+        logger.info('detected changes to %d file(s)', len(changed))
+        if recompile(self.toolchain, self.spec, changed):
+            # only the methods are invoked, so no advices are triggered.
+            self.toolchain.assemble(self.spec)
+            self.toolchain.link(self.spec)
+        if not check_stamps(self.stamps) or any(
+                path not in current for path in changed):
+            self.refresh_config()
+            self.reset()
+        self.driver.run_karma(self.spec)
+        self.driver.write_native_coverage(self.spec)
+        self.driver.collect_raw_coverage(self.spec)
+        return True
+
+    def run(self):
+        """
+        Keep checking for changes until interrupted.
+        """
+
+        logger.info(
+            'watching %d paths for changes; interrupt to stop',
+            len(self.watched_paths()),
+        )
+        try:
+            while True:
+                sleep(self.interval)
+                try:
+                    self.step()
+                except Exception:
+                    logger.exception(
+                        'failed to rerun tests; waiting for further changes')
+        except KeyboardInterrupt:
+            logger.info('watch mode interrupted')
+        finally:
+            self.driver.stop_servers()
+
+
+def watch(driver, toolchain, spec, interval=WATCH_INTERVAL):
+    """
+    Run the toolchain with the driver for the spec, with the tests
+    executed on a persistent karma server, and then watch for changes.
+    As the build directory must persist through the watch, a temporary
+    one will be created if the spec does not specify one.
+    """
+
+    spec[karma.KARMA_PERSISTENT_SERVER] = True
+    # failures are expected while developing, and shards would require
+    # a karma server for each of them.
+    spec.pop(karma.KARMA_ABORT_ON_TEST_FAILURE, None)
+    spec.pop(karma.KARMA_SHARDS, None)
+
+    tempdir = None
+    if not spec.get(BUILD_DIR):
+        tempdir = realpath(mkdtemp())
+        spec[BUILD_DIR] = join(tempdir, 'build')
+        os.mkdir(spec[BUILD_DIR])
+
+    try:
+        driver.run(toolchain, spec)
+        Watcher(driver, toolchain, spec, interval=interval).run()
+    finally:
+        driver.stop_servers()
+        if tempdir:
+            shutil.rmtree(tempdir)
+    return spec